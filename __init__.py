@@ -1,25 +1,48 @@
-from .se_workload_wrapper import (
-    test_load,
-    test_store,
-    dot_indirect,
-    dot_indirect_sve,
-    dot_indirect_hov,
-    reduce_indirect,
-    reduce_indirect_sve,
-    reduce_indirect_hov,
-)
+import importlib
 
-from .fs_workload_wrapper import (
-    BootWrapper,
-    MPIBenchWrapper,
-    HPCGWrapper,
-    BransonWrapper,
-    UMEWrapper,
-    NPBWrapper,
-    MPINPBWrapper,
-    GUPSWrapper,
-    PermutatingGatherWrapper,
-    PermutatingScatterWrapper,
-    SpatterWrapper,
-    StreamWrapper,
-)
+# The workload wrappers import m5, so they are only imported once one of them
+# is used. This keeps the host-side tools (e.g. phase_analysis) runnable with
+# `python3 -m` outside of gem5.
+_wrapper_modules = {
+    ".se_workload_wrapper": [
+        "test_load",
+        "test_store",
+        "dot_indirect",
+        "dot_indirect_sve",
+        "dot_indirect_hov",
+        "reduce_indirect",
+        "reduce_indirect_sve",
+        "reduce_indirect_hov",
+    ],
+    ".fs_workload_wrapper": [
+        "BootWrapper",
+        "MPIBenchWrapper",
+        "HPCGWrapper",
+        "BransonWrapper",
+        "UMEWrapper",
+        "NPBWrapper",
+        "MPINPBWrapper",
+        "GUPSWrapper",
+        "PermutatingGatherWrapper",
+        "PermutatingScatterWrapper",
+        "SpatterWrapper",
+        "StreamWrapper",
+    ],
+}
+_wrapper_module_of = {
+    name: module
+    for module, names in _wrapper_modules.items()
+    for name in names
+}
+
+__all__ = list(_wrapper_module_of.keys())
+
+
+def __getattr__(name):
+    if name not in _wrapper_module_of:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(
+        importlib.import_module(_wrapper_module_of[name], __name__), name
+    )
+    globals()[name] = value
+    return value
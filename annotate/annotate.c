@@ -94,6 +94,7 @@ void thread_init_()
 #include "gem5/m5_mmap.h"
 
 #include <errno.h>
+#include <fcntl.h>
 #include <limits.h>
 #include <stdio.h>
 #include <stdlib.h>
@@ -104,11 +105,21 @@ void thread_init_()
 // "mss-flag"
 #define MSS_FLAG 0x67616c662d73736d
 
-void annotate_init_()
+// Rank of this process as set by the MPI launcher, -1 outside of MPI.
+static int get_rank()
 {
-    map_m5_mem();
+    const char *names[] = {"OMPI_COMM_WORLD_RANK", "PMI_RANK", "PMIX_RANK"};
+    for (int i = 0; i < (int) (sizeof(names) / sizeof(names[0])); i++) {
+        const char *value = getenv(names[i]);
+        if (value && *value) {
+            return atoi(value);
+        }
+    }
+    return -1;
+}
 
-    pid_t pid = getpid();
+static void dump_pid_file(pid_t pid, int rank)
+{
     const char *dir = getenv("PID_DUMP_PATH");
     if (!dir || !*dir) {
         fprintf(
@@ -139,19 +150,58 @@ void annotate_init_()
                 path, strerror(errno));
         return;
     }
+    fprintf(fp, "%d\n", rank);
     fclose(fp);
 
     fprintf(stderr, "[pid-dump] wrote %s\n", path);
+}
 
-    const char *done_file = getenv("MMAP_DONE_PATH");
-    if (!done_file) {
+// Writes the pid and rank as one line to PID_SYNC_FIFO. Lines are shorter
+// than PIPE_BUF so writes from different ranks never interleave.
+static void write_pid_fifo(const char *fifo, pid_t pid, int rank)
+{
+    int fd = open(fifo, O_WRONLY);
+    if (fd == -1) {
+        fprintf(stderr,
+                "[pid-sync] cannot open '%s' for writing: %s\n",
+                fifo, strerror(errno));
+        return;
+    }
+
+    char line[32];
+    int n = snprintf(line, sizeof(line), "%d %d\n", (int) pid, rank);
+    if (write(fd, line, n) != n) {
+        fprintf(stderr,
+                "[pid-sync] cannot write to '%s': %s\n",
+                fifo, strerror(errno));
+    }
+    close(fd);
+}
+
+// Blocks until the runscript writes this rank's byte to MMAP_DONE_FIFO.
+static void wait_mmap_done_fifo(const char *fifo)
+{
+    // Opening for reading and writing does not wait for the runscript to
+    // open its end.
+    int fd = open(fifo, O_RDWR);
+    if (fd == -1) {
+        fprintf(stderr,
+                "[pid-sync] cannot open '%s' for reading: %s\n",
+                fifo, strerror(errno));
         return;
     }
 
+    char val;
+    while (read(fd, &val, 1) == -1 && errno == EINTR);
+    close(fd);
+}
+
+static void wait_mmap_done_file(const char *done_file)
+{
     char val[8] = {0};
 
     while (1) {
-        fp = fopen(done_file, "r");
+        FILE *fp = fopen(done_file, "r");
         if (fp) {
             if (fgets(val, sizeof(val), fp)) {
                 if (strncmp(val, "1", 1) == 0) {
@@ -165,6 +215,32 @@ void annotate_init_()
     }
 }
 
+void annotate_init_()
+{
+    map_m5_mem();
+
+    pid_t pid = getpid();
+    int rank = get_rank();
+    const char *pid_fifo = getenv("PID_SYNC_FIFO");
+    if (pid_fifo && *pid_fifo) {
+        write_pid_fifo(pid_fifo, pid, rank);
+    } else {
+        dump_pid_file(pid, rank);
+    }
+
+    const char *done_fifo = getenv("MMAP_DONE_FIFO");
+    if (done_fifo && *done_fifo) {
+        wait_mmap_done_fifo(done_fifo);
+        return;
+    }
+
+    const char *done_file = getenv("MMAP_DONE_PATH");
+    if (!done_file) {
+        return;
+    }
+    wait_mmap_done_file(done_file);
+}
+
 void annotate_term_()
 {
     unmap_m5_mem();
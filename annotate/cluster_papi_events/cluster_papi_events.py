@@ -1,116 +1,157 @@
-from math import comb
-from random import shuffle
+from itertools import combinations
 
-from pypapi import events, EventSet
-from pypapi.library import init as papi_init
+from pypapi import events, papi_low
+from pypapi.exceptions import PapiError
+
+_papi_initialized = False
+
+
+def _init_papi():
+    global _papi_initialized
+    if not _papi_initialized:
+        papi_low.library_init()
+        _papi_initialized = True
 
 
 # Function to check if a set of events can be measured together
 def can_measure_together(event_list):
-    # Initialize pypapi library
-    papi_init()
+    # Initialize pypapi library once per process
+    _init_papi()
 
     # Create an event set
-    event_set = EventSet()
+    event_set = papi_low.create_eventset()
 
     try:
         # Add events to the event set
         for event in event_list:
-            event_set.add_named(event)
+            papi_low.add_named_event(event_set, event)
 
         # Check if the event set can be started
-        event_set.start()
-        event_set.stop()
+        papi_low.start(event_set)
+        papi_low.stop(event_set)
 
         # If no exception is raised, the events can be measured together
         return True
-    except pypapi.pypapiError:
+    except PapiError:
         # If an exception is raised, the events cannot be measured together
         return False
     finally:
-        # Cleanup
-        event_set.cleanup()
+        # Cleanup. If stop failed the event set is still running and can
+        # not be cleaned up before it is stopped.
+        try:
+            papi_low.stop(event_set)
+        except PapiError:
+            pass
+        papi_low.cleanup_eventset(event_set)
+        papi_low.destroy_eventset(event_set)
+
+
+def build_conflict_graph(event_list: list, can_measure=can_measure_together):
+    """Probes every event on its own and every pair of events.
+
+    Returns the events that can be measured on their own and, for each of
+    them, the set of events it can not be measured together with.
+    """
+    measurable = [event for event in event_list if can_measure([event])]
+    conflicts = {event: set() for event in measurable}
+    for first, second in combinations(measurable, 2):
+        if not can_measure([first, second]):
+            conflicts[first].add(second)
+            conflicts[second].add(first)
+    return measurable, conflicts
+
+
+def color_conflict_graph(
+    measurable: list, conflicts: dict, max_partition_size: int
+):
+    """Packs events into groups with DSATUR coloring.
+
+    The next event to place is always the one whose conflicts already span
+    the most groups, ties broken by the number of conflicts. It goes into
+    the first group that has room and none of its conflicts. `measurable`
+    can be a subset of the events in `conflicts`.
+    """
+    groups = []
+    order = {event: index for index, event in enumerate(measurable)}
+    saturation = {event: set() for event in measurable}
+    uncolored = set(measurable)
+    while len(uncolored) > 0:
+        event = max(
+            uncolored,
+            key=lambda event: (
+                len(saturation[event]),
+                len(conflicts[event]),
+                -order[event],
+            ),
+        )
+        for index, group in enumerate(groups):
+            if index not in saturation[event] and (
+                len(group) < max_partition_size
+            ):
+                break
+        else:
+            index = len(groups)
+            groups.append([])
+        groups[index].append(event)
+        uncolored.remove(event)
+        for neighbor in conflicts[event]:
+            if neighbor in saturation:
+                saturation[neighbor].add(index)
+    return groups
+
+
+def _split_group(group: list, can_measure):
+    """Splits a group that can not be measured as a whole by adding its
+    events one at a time to the first subgroup they fit in."""
+    subgroups = []
+    for event in group:
+        for subgroup in subgroups:
+            if can_measure(subgroup + [event]):
+                subgroup.append(event)
+                break
+        else:
+            subgroups.append([event])
+    return subgroups
 
 
 def partition_pypapi_events(
     event_list: list,
-    og_max_partition_size: int,
-    window_size: int,
-    necessary_shuffle_limit: int = 3,
+    max_partition_size: int,
+    can_measure=can_measure_together,
 ):
-    def _all_subsets(in_set: list, max_length: int, current_set: list):
-        if len(current_set) == max_length:
-            return [current_set]
-        if len(in_set) + len(current_set) < max_length:
-            return []
-
-        current_item = in_set[0]
-        return _all_subsets(
-            in_set[1:], max_length, current_set
-        ) + _all_subsets(in_set[1:], max_length, current_set + [current_item])
+    """Partitions events into groups that can each be measured in one run.
+
+    Pairwise compatibility is probed once to build a conflict graph, which
+    is colored with at most `max_partition_size` events per color. Only the
+    final groups are verified as a whole. Groups that fail, e.g. because
+    the events compete for the same counters, are split again. The first
+    piece of a split group is kept and the events of the other pieces are
+    colored again together with the leftovers of the other failed groups.
+    """
+    measurable, conflicts = build_conflict_graph(event_list, can_measure)
+    unmeasurable = [event for event in event_list if event not in conflicts]
+    if len(unmeasurable) > 0:
+        print(f"Events that can not be measured at all: {unmeasurable}")
 
     partitions = []
-    necessary_shuffles = 0
-    remaining_events = event_list.copy()
-    max_partition_size = og_max_partition_size
-    while len(remaining_events) > 0:
-        window = remaining_events[:window_size]
-        subsets = _all_subsets(
-            window,
-            min(len(remaining_events), max_partition_size),
-            [],
-        )
-        print(f"There are a total of {len(subsets)} subsets.")
-        select = []
-        for subset in subsets:
-            if can_measure_together(subset):
-                select = subset
-                partitions.append(select)
-                print(f"Found suitable subset: {select}")
-                if (
-                    max_partition_size < og_max_partition_size
-                    and necessary_shuffles == 0
-                ):
-                    max_partition_size = og_max_partition_size
-                break
-        new_remaining_events = [
-            event for event in remaining_events if event not in select
-        ]
-        if len(new_remaining_events) == len(remaining_events):
-            necessary_shuffles += 1
-            if necessary_shuffles > necessary_shuffle_limit:
-                print(
-                    f"Hit necessary shuffle limit: {necessary_shuffle_limit}"
-                )
-                necessary_shuffles = 0
-                max_partition_size -= 1
-                continue
-        if (
-            len(new_remaining_events) == len(remaining_events)
-            and max_partition_size == 0
+    pending = measurable
+    while len(pending) > 0:
+        leftovers = []
+        for group in color_conflict_graph(
+            pending, conflicts, max_partition_size
         ):
-            print(
-                f"Could not find a partition for {remaining_events} with "
-                f"max_partition_size={max_partition_size}."
-            )
-            break
-        remaining_events = new_remaining_events
-        shuffle(remaining_events)
+            if can_measure(group):
+                partitions.append(group)
+            else:
+                print(f"Splitting group that can not be measured: {group}")
+                first, *rest = _split_group(group, can_measure)
+                partitions.append(first)
+                leftovers.extend(event for piece in rest for event in piece)
+        pending = leftovers
 
     return partitions
 
 
-def good_window_size(num_counters):
-    upper_bound = 50_000
-    window_size = num_counters + 1
-    combinations = window_size
-    while combinations < upper_bound:
-        window_size += 1
-        combinations = comb(window_size, num_counters)
-
-    return window_size - 1
-
-
 if __name__ == "__main__":
     print(events)
     # all_events = ???
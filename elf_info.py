@@ -0,0 +1,427 @@
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_elf_magic = b"\x7fELF"
+
+# ELF e_machine mapping
+_elf_arch_map = {
+    0x03: "x86",
+    0x3E: "x86_64",
+    0x28: "arm",
+    0xB7: "aarch64",
+    0xF3: "riscv",
+    0x08: "mips",
+}
+
+ET_EXEC = 2
+ET_DYN = 3
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+PT_NOTE = 4
+
+NT_GNU_BUILD_ID = 3
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+
+SHT_SYMTAB = 2
+SHT_DYNSYM = 11
+
+STT_FUNC = 2
+
+
+class ProgramHeader:
+    def __init__(
+        self,
+        p_type: int,
+        p_flags: int,
+        p_offset: int,
+        p_vaddr: int,
+        p_filesz: int,
+        p_memsz: int,
+    ):
+        self._p_type = p_type
+        self._p_flags = p_flags
+        self._p_offset = p_offset
+        self._p_vaddr = p_vaddr
+        self._p_filesz = p_filesz
+        self._p_memsz = p_memsz
+
+    def type(self) -> int:
+        return self._p_type
+
+    def flags(self) -> int:
+        return self._p_flags
+
+    def offset(self) -> int:
+        return self._p_offset
+
+    def vaddr(self) -> int:
+        return self._p_vaddr
+
+    def filesz(self) -> int:
+        return self._p_filesz
+
+    def memsz(self) -> int:
+        return self._p_memsz
+
+    def __str__(self) -> str:
+        return (
+            f"ProgramHeader(type: {self._p_type}, "
+            f"offset: {hex(self._p_offset)}, vaddr: {hex(self._p_vaddr)})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+class ElfFile:
+    """Reads the parts of an ELF file that the wrappers need.
+
+    The file is mmapped once. The headers, the interpreter and the needed
+    libraries are parsed when the object is created, everything else is
+    read on demand. Use `get_elf_info` to share one object per binary.
+    """
+
+    def __init__(self, path: Path):
+        self._path = Path(path)
+        with open(self._path, "rb") as binary:
+            if os.fstat(binary.fileno()).st_size < 16:
+                raise ValueError(f"{self._path} is not an ELF binary")
+            self._data = mmap.mmap(binary.fileno(), 0, access=mmap.ACCESS_READ)
+        ident = self._data[:16]
+        if ident[:4] != _elf_magic:
+            raise ValueError(f"{self._path} is not an ELF binary")
+        self._is_64 = ident[4] == 2
+        self._endian = "<" if ident[5] == 1 else ">"
+
+        (
+            self._e_type,
+            self._e_machine,
+            _,
+            self._e_entry,
+            e_phoff,
+            self._e_shoff,
+            _,
+            _,
+            e_phentsize,
+            e_phnum,
+            self._e_shentsize,
+            self._e_shnum,
+            self._e_shstrndx,
+        ) = struct.unpack_from(
+            (
+                f"{self._endian}HHIQQQIHHHHHH"
+                if self._is_64
+                else f"{self._endian}HHIIIIIHHHHHH"
+            ),
+            self._data,
+            16,
+        )
+
+        self._program_headers = [
+            self._unpack_program_header(e_phoff + i * e_phentsize)
+            for i in range(e_phnum)
+        ]
+        self._interpreter = None
+        self._has_dynamic = False
+        self._needed_libraries = []
+        for header in self._program_headers:
+            if header.type() == PT_INTERP:
+                self._interpreter = (
+                    self.read(header.offset(), header.filesz())
+                    .rstrip(b"\0")
+                    .decode(errors="replace")
+                )
+            elif header.type() == PT_DYNAMIC:
+                self._has_dynamic = True
+                self._needed_libraries = self._read_needed_libraries(header)
+
+    def _unpack_program_header(self, offset: int) -> ProgramHeader:
+        if self._is_64:
+            p_type, p_flags, p_offset, p_vaddr, _, p_filesz, p_memsz = (
+                struct.unpack_from(
+                    f"{self._endian}IIQQQQQ", self._data, offset
+                )
+            )
+        else:
+            p_type, p_offset, p_vaddr, _, p_filesz, p_memsz, p_flags = (
+                struct.unpack_from(
+                    f"{self._endian}IIIIIII", self._data, offset
+                )
+            )
+        return ProgramHeader(
+            p_type, p_flags, p_offset, p_vaddr, p_filesz, p_memsz
+        )
+
+    def path(self) -> Path:
+        return self._path
+
+    def is_64(self) -> bool:
+        return self._is_64
+
+    def machine(self) -> int:
+        return self._e_machine
+
+    def elf_type(self) -> int:
+        return self._e_type
+
+    def is_pie(self) -> bool:
+        """Returns True if the binary is loaded at an address picked by the
+        loader, i.e. its addresses are relative to a load base."""
+        return self._e_type == ET_DYN
+
+    def program_headers(self) -> List[ProgramHeader]:
+        return self._program_headers
+
+    def elf_class(self) -> int:
+        return 64 if self._is_64 else 32
+
+    def architecture(self) -> str:
+        return _elf_arch_map.get(
+            self._e_machine, f"unknown({self._e_machine})"
+        )
+
+    def interpreter(self) -> Optional[str]:
+        return self._interpreter
+
+    def is_dynamically_linked(self) -> bool:
+        return self._interpreter is not None
+
+    def has_dynamic(self) -> bool:
+        return self._has_dynamic
+
+    def needed_libraries(self) -> List[str]:
+        return self._needed_libraries
+
+    def read(self, offset: int, size: int) -> bytes:
+        return self._data[offset : offset + size]
+
+    def _vaddr_to_offset(self, vaddr: int) -> Optional[int]:
+        for header in self._program_headers:
+            if (
+                header.type() == PT_LOAD
+                and header.vaddr() <= vaddr < header.vaddr() + header.filesz()
+            ):
+                return vaddr - header.vaddr() + header.offset()
+        return None
+
+    def _read_needed_libraries(self, dynamic: ProgramHeader) -> List[str]:
+        entry_format = (
+            f"{self._endian}qQ" if self._is_64 else f"{self._endian}iI"
+        )
+        entry_size = struct.calcsize(entry_format)
+        data = self.read(dynamic.offset(), dynamic.filesz())
+        needed = []
+        strtab = None
+        for position in range(0, len(data) - entry_size + 1, entry_size):
+            tag, value = struct.unpack_from(entry_format, data, position)
+            if tag == DT_NULL:
+                break
+            if tag == DT_NEEDED:
+                needed.append(value)
+            elif tag == DT_STRTAB:
+                strtab = self._vaddr_to_offset(value)
+        if strtab is None:
+            return []
+        libraries = []
+        for name_offset in needed:
+            start = strtab + name_offset
+            end = self._data.find(b"\0", start)
+            libraries.append(self._data[start:end].decode(errors="replace"))
+        return libraries
+
+    def _section_headers(self) -> List[Tuple[int, int, int, int, int]]:
+        """Returns (type, addr, offset, size, link) of every section."""
+        if self._e_shoff == 0:
+            return []
+        data = self.read(self._e_shoff, self._e_shnum * self._e_shentsize)
+        headers = []
+        for i in range(self._e_shnum):
+            if self._is_64:
+                _, sh_type, _, sh_addr, sh_offset, sh_size, sh_link = (
+                    struct.unpack_from(
+                        f"{self._endian}IIQQQQI", data, i * self._e_shentsize
+                    )
+                )
+            else:
+                _, sh_type, _, sh_addr, sh_offset, sh_size, sh_link = (
+                    struct.unpack_from(
+                        f"{self._endian}IIIIIII", data, i * self._e_shentsize
+                    )
+                )
+            headers.append((sh_type, sh_addr, sh_offset, sh_size, sh_link))
+        return headers
+
+    def function_symbols(self) -> Dict[str, Tuple[int, int]]:
+        """Returns the address and size of every function symbol.
+
+        Symbols from `.symtab` take precedence over the ones in `.dynsym`.
+        """
+        headers = self._section_headers()
+        symbols = {}
+        for section_type in [SHT_DYNSYM, SHT_SYMTAB]:
+            for sh_type, _, sh_offset, sh_size, sh_link in headers:
+                if sh_type != section_type:
+                    continue
+                _, _, strtab_offset, strtab_size, _ = headers[sh_link]
+                strtab = self.read(strtab_offset, strtab_size)
+                data = self.read(sh_offset, sh_size)
+                entry_size = 24 if self._is_64 else 16
+                for position in range(0, len(data), entry_size):
+                    if self._is_64:
+                        st_name, st_info, _, st_shndx, st_value, st_size = (
+                            struct.unpack_from(
+                                f"{self._endian}IBBHQQ", data, position
+                            )
+                        )
+                    else:
+                        st_name, st_value, st_size, st_info, _, st_shndx = (
+                            struct.unpack_from(
+                                f"{self._endian}IIIBBH", data, position
+                            )
+                        )
+                    if st_info & 0xF != STT_FUNC or st_shndx == 0:
+                        continue
+                    end = strtab.index(b"\0", st_name)
+                    name = strtab[st_name:end].decode(errors="replace")
+                    symbols[name] = (st_value, st_size)
+        return symbols
+
+    def _notes(self, data: bytes):
+        position = 0
+        while position + 12 <= len(data):
+            namesz, descsz, note_type = struct.unpack_from(
+                f"{self._endian}III", data, position
+            )
+            position += 12
+            name = data[position : position + namesz].rstrip(b"\0")
+            position += (namesz + 3) & ~3
+            desc = data[position : position + descsz]
+            position += (descsz + 3) & ~3
+            yield name, note_type, desc
+
+    def build_id(self) -> Optional[str]:
+        """Returns the GNU build-id as a hex string, like `readelf -n`."""
+        for header in self._program_headers:
+            if header.type() != PT_NOTE:
+                continue
+            data = self.read(header.offset(), header.filesz())
+            for name, note_type, desc in self._notes(data):
+                if name == b"GNU" and note_type == NT_GNU_BUILD_ID:
+                    return desc.hex()
+        return None
+
+    def close(self):
+        self._data.close()
+
+    def __str__(self) -> str:
+        return f"ElfFile(path: {self._path}, machine: {self._e_machine})"
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+class SymbolIndex:
+    """Function symbols of a binary by name and by address.
+
+    Names can be looked up as they appear in the symbol table or, for C++
+    functions, by their unqualified name as long as only one mangled symbol
+    matches it.
+    """
+
+    def __init__(self, symbols: Dict[str, Tuple[int, int]]):
+        self._symbols = symbols
+        self._fingerprint = None
+        by_address = sorted(
+            (address, size, name) for name, (address, size) in symbols.items()
+        )
+        self._addresses = [entry[0] for entry in by_address]
+        self._by_address = by_address
+
+    def address(self, name: str) -> int:
+        if name in self._symbols:
+            return self._symbols[name][0]
+        prefix = f"_Z{len(name)}{name}"
+        matches = [
+            symbol for symbol in self._symbols if symbol.startswith(prefix)
+        ]
+        if len(matches) == 1:
+            return self._symbols[matches[0]][0]
+        if len(matches) > 1:
+            raise ValueError(
+                f"{name} matches more than one symbol: {matches}. "
+                "Use the mangled name instead."
+            )
+        raise KeyError(f"Could not find symbol {name}.")
+
+    def fingerprint(self) -> str:
+        """Hash of all the symbols, to key anything derived from them."""
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for name, (address, size) in sorted(self._symbols.items()):
+                digest.update(f"{name} {address} {size}\n".encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def symbolize(self, address: int) -> Optional[Tuple[str, int]]:
+        """Returns the function containing `address` and the offset of
+        `address` in it."""
+        index = bisect.bisect_right(self._addresses, address) - 1
+        if index < 0:
+            return None
+        start, size, name = self._by_address[index]
+        if address >= start + max(size, 1):
+            return None
+        return name, address - start
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+
+# Resolved path -> ((mtime_ns, size), cached object). An entry is replaced
+# when its binary changes, so a rebuilt binary does not keep the mmap of
+# the old one open.
+_elf_info_cache = {}
+_symbol_index_cache = {}
+
+
+def _stamp(path: Path):
+    path = Path(path).resolve()
+    stat = os.stat(path)
+    return path, (stat.st_mtime_ns, stat.st_size)
+
+
+def get_elf_info(path: Path) -> ElfFile:
+    """Returns the `ElfFile` of the binary at `path`, only parsing the
+    binary again if it changed."""
+    path, stamp = _stamp(path)
+    cached = _elf_info_cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    elf_info = ElfFile(path)
+    _elf_info_cache[path] = (stamp, elf_info)
+    return elf_info
+
+
+def get_symbol_index(path: Path) -> SymbolIndex:
+    """Returns the `SymbolIndex` of the binary at `path`, only reading the
+    binary again if it changed."""
+    path, stamp = _stamp(path)
+    cached = _symbol_index_cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    symbol_index = SymbolIndex(get_elf_info(path).function_symbols())
+    _symbol_index_cache[path] = (stamp, symbol_index)
+    return symbol_index
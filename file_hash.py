@@ -0,0 +1,12 @@
+import hashlib
+
+from pathlib import Path
+
+
+def hash_file(path: Path) -> str:
+    """Returns the hex SHA-256 digest of the content of the file at `path`."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as hashed_file:
+        while chunk := hashed_file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
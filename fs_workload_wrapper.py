@@ -1,16 +1,26 @@
-from .workload_insights import process_snippet
+from .elf_info import get_elf_info, get_symbol_index
+from .process_maps import (
+    ProcessMaps,
+    build_process_maps,
+    read_process_maps,
+    write_process_maps,
+)
+from .sampling import FixedSamplingScheduler, SamplingScheduler, to_period
+from .stats_dumps import AsyncStatsDumpWriter, StatsDumpWriter
+from .workload_insights import PCLookupTable, compile_snippet, register_snippet
 
 import argparse
-import os
-import re
+import atexit
 
 from pathlib import Path
-from typing import Optional, Union
+from typing import List, Optional, Union
 
+from m5 import curTick
 from m5 import options as m5_options
 from m5.simulate import checkpoint
 from m5.stats import reset as reset_stats
 from m5.stats import dump as m5_dump_stats
+from m5.ticks import fromSeconds
 from m5.util import inform, warn
 
 from gem5.components.boards.abstract_board import AbstractBoard
@@ -39,41 +49,113 @@ def copy_file(file_name: str, src_dir: Path, dst_dir: Path):
         dst_path.write_text(src_path.read_text())
 
 
+def load_process_maps(directory: Path) -> ProcessMaps:
+    """Load the maps of every rank recorded in `directory`.
+
+    process_maps.bin is built from process_info.txt the first time and read
+    directly after that.
+    """
+    maps_path = Path(directory) / "process_maps.bin"
+    info_path = Path(directory) / "process_info.txt"
+    if maps_path.exists() and (
+        not info_path.exists()
+        or maps_path.stat().st_mtime >= info_path.stat().st_mtime
+    ):
+        return read_process_maps(maps_path)
+    process_maps = build_process_maps(info_path)
+    write_process_maps(process_maps, maps_path)
+    return process_maps
+
+
 def take_checkpoint(checkpoint_path: Path):
     checkpoint(str(checkpoint_path))
 
 
-def dump_stats():
-    outdir = get_outdir()
-    stats_file = outdir / "stats.txt"
+_stats_dump_writer = None
+_stats_dump_config = {
+    "copy_dumps": True,
+    "sink": None,
+    "asynchronous": False,
+    "max_pending": 64,
+}
+
+
+def configure_stats_dumps(
+    copy_dumps: bool = True,
+    sink=None,
+    asynchronous: bool = False,
+    max_pending: int = 64,
+):
+    """Configure how `dump_stats` records every dump.
+
+    Args:
+        copy_dumps: If True every dump is copied to its own
+            `stats_dump_N.txt`. If False only `stats_dump_index.txt` is
+            written and dumps are read back with `StatsDumpReader`.
+        sink: Optional object with `add_dump(dump, data)`, `flush()` and
+            `close()` methods that receives every dump right after it is
+            taken, e.g. `NPZStatsSink`.
+        asynchronous: If True dumps are written out on a background thread
+            so the simulation does not wait for the disk.
+        max_pending: Number of dumps that can be waiting for the background
+            thread before `dump_stats` blocks.
+    """
+    if _stats_dump_writer is not None:
+        raise RuntimeError(
+            "Stats dumps can not be configured after the first dump."
+        )
+    _stats_dump_config["copy_dumps"] = copy_dumps
+    _stats_dump_config["sink"] = sink
+    _stats_dump_config["asynchronous"] = asynchronous
+    _stats_dump_config["max_pending"] = max_pending
+
+
+def get_stats_dump_writer():
+    global _stats_dump_writer
+    if _stats_dump_writer is None:
+        if _stats_dump_config["asynchronous"]:
+            _stats_dump_writer = AsyncStatsDumpWriter(
+                get_outdir(),
+                _stats_dump_config["copy_dumps"],
+                _stats_dump_config["sink"],
+                _stats_dump_config["max_pending"],
+            )
+        else:
+            _stats_dump_writer = StatsDumpWriter(
+                get_outdir(),
+                _stats_dump_config["copy_dumps"],
+                _stats_dump_config["sink"],
+            )
+        atexit.register(_stats_dump_writer.close)
+    return _stats_dump_writer
 
-    try:
-        old_size = os.path.getsize(stats_file)
-    except OSError:
-        old_size = 0
 
+def dump_stats():
+    writer = get_stats_dump_writer()
+    # Anything appended to stats.txt since the last dump, e.g. by a guest
+    # `m5 dumpstats`, is not part of this dump.
+    writer.begin_dump()
     m5_dump_stats()
+    return writer.write_dump(curTick())
 
-    new_data = None
-    with open(f"{outdir}/stats.txt", "rb") as stats_file:
-        stats_file.seek(old_size)
-        new_data = stats_file.read()
 
-    if new_data:
-        dump_name_pattern = re.compile(r"^stats_dump_(\d+)\.txt$")
-        all_dumps = [
-            f for f in outdir.iterdir() if dump_name_pattern.fullmatch(f.name)
-        ]
-        if all_dumps:
-            dump_version = (
-                max([int(f.stem.split("_")[-1]) for f in all_dumps]) + 1
-            )
-        else:
-            dump_version = 0
-        with open(
-            outdir / f"stats_dump_{dump_version}.txt", "wb"
-        ) as dump_file:
-            dump_file.write(new_data)
+def flush_stats_dumps():
+    if _stats_dump_writer is not None:
+        _stats_dump_writer.flush()
+
+
+_snippet_cache_dir = None
+
+
+def configure_snippet_cache(cache_dir: Optional[Path]):
+    """Store compiled workload insight snippets in `cache_dir` so they are
+    only parsed once across gem5 runs."""
+    global _snippet_cache_dir
+    _snippet_cache_dir = cache_dir
+
+
+# Binaries that were already reported to have no known load base.
+_unknown_load_bases = set()
 
 
 def try_convert_bool(bool_like):
@@ -112,21 +194,55 @@ class ExitEventHandlerWrapper:
     def __init__(
         self,
         sample_stats: bool,
-        sample_period: str,
+        sample_period: Union[str, SamplingScheduler],
         take_checkpoint: bool,
         restore_checkpoint: bool,
         checkpoint_path: Union[Path, None],
+        checkpoint_ticks: Optional[List[int]] = None,
+        checkpoint_insts: Optional[List[int]] = None,
     ):
         if take_checkpoint and restore_checkpoint:
             raise ValueError(
                 "Both `take_checkpoint` and `restore_checkpoint` "
                 "can not be True at the same time."
             )
+        if checkpoint_ticks is not None and checkpoint_insts is not None:
+            raise ValueError(
+                "Only one of `checkpoint_ticks` and `checkpoint_insts` "
+                "can be set."
+            )
         self._sample_stats = sample_stats
         self._sample_period = sample_period
+        self._sampler = (
+            FixedSamplingScheduler(sample_period)
+            if isinstance(sample_period, str)
+            else sample_period
+        )
         self._reacted_yet = restore_checkpoint
+        self._restore_checkpoint = restore_checkpoint
         self._take_checkpoint = take_checkpoint
         self._checkpoint_path = checkpoint_path
+        # Checkpoints to take inside the ROI, relative to its beginning,
+        # like the start_tick and start_insts of the phases
+        # phase_analysis.py picks. Instruction counts are the instructions
+        # committed by all cores together. A count of 0 takes a checkpoint
+        # right at the ROI begin.
+        self._checkpoint_schedule = None
+        self._checkpoint_unit = None
+        if checkpoint_ticks is not None:
+            self._checkpoint_schedule = checkpoint_ticks
+            self._checkpoint_unit = "ticks"
+        elif checkpoint_insts is not None:
+            self._checkpoint_schedule = checkpoint_insts
+            self._checkpoint_unit = "insts"
+        self._next_checkpoint = 0
+        self._roi_begin_tick = None
+        self._roi_begin_insts = None
+        self._target_insts = None
+        # Absolute instruction count of every core its latest stop fires at.
+        # Stops can not be cancelled, so a core can also have older stops
+        # pending that were replaced when it was re-armed.
+        self._inst_stops = {}
 
     def _validate_options(self, board: AbstractBoard):
         if self._take_checkpoint:
@@ -136,6 +252,28 @@ class ExitEventHandlerWrapper:
                 raise ValueError(
                     "Checkpointing is not supported with SwitchableProcessor."
                 )
+        if self._checkpoint_schedule is not None:
+            if not self._take_checkpoint:
+                raise ValueError(
+                    f"Checkpoint {self._checkpoint_unit} are set, "
+                    "but take_checkpoint is disabled."
+                )
+            if self._sample_stats:
+                raise ValueError(
+                    "Sampling stats is not supported while taking "
+                    "checkpoints inside the ROI."
+                )
+            if len(self._checkpoint_schedule) == 0 or any(
+                current <= previous
+                for previous, current in zip(
+                    [-1] + self._checkpoint_schedule,
+                    self._checkpoint_schedule,
+                )
+            ):
+                raise ValueError(
+                    f"Checkpoint {self._checkpoint_unit} should be "
+                    "non-negative and strictly increasing."
+                )
         if self._sample_period != "none":
             if not self._sample_stats:
                 raise ValueError(
@@ -146,6 +284,168 @@ class ExitEventHandlerWrapper:
         self._validate_options(board)
         return self._get_exit_event_handler(board)
 
+    def restore_checkpoint_path(self) -> Optional[Path]:
+        if not self._restore_checkpoint or self._checkpoint_path is None:
+            return None
+        return Path(self._checkpoint_path)
+
+    def _stop(self):
+        flush_stats_dumps()
+        inform("Flushed sim stats dumps.")
+        return SimStep.STOP
+
+    def _save_checkpoint(self, checkpoint_path: Path):
+        take_checkpoint(checkpoint_path)
+        inform(f"Took a checkpoint in {checkpoint_path}.")
+        inform(
+            "Copying process_info.txt from m5.outdir "
+            "to checkpoint path if it exists."
+        )
+        copy_file("process_info.txt", get_outdir(), Path(checkpoint_path))
+        if (get_outdir() / "process_info.txt").exists():
+            write_process_maps(
+                load_process_maps(get_outdir()),
+                Path(checkpoint_path) / "process_maps.bin",
+            )
+
+    def _start_checkpoint_schedule(self, board: AbstractBoard):
+        self._roi_begin_tick = curTick()
+        self._roi_begin_insts = self._committed_insts(board)
+        self._reacted_yet = True
+        inform(
+            f"Taking {len(self._checkpoint_schedule)} checkpoints at "
+            f"{self._checkpoint_unit} {self._checkpoint_schedule} "
+            "into the ROI."
+        )
+        if self._checkpoint_schedule[0] == 0:
+            self._take_scheduled_checkpoint()
+        return self._schedule_next_checkpoint(board)
+
+    def _take_scheduled_checkpoint(self):
+        self._save_checkpoint(
+            Path(self._checkpoint_path) / f"ckpt_{self._next_checkpoint}"
+        )
+        self._next_checkpoint += 1
+
+    def _schedule_next_checkpoint(self, board: AbstractBoard):
+        if self._checkpoint_unit == "ticks":
+            self._skip_past_checkpoints()
+        if self._next_checkpoint == len(self._checkpoint_schedule):
+            inform("Took all the scheduled checkpoints.")
+            return self._stop()
+        target = self._checkpoint_schedule[self._next_checkpoint]
+        if self._checkpoint_unit == "ticks":
+            return self._ticks_until(self._roi_begin_tick + target)
+        self._target_insts = self._roi_begin_insts + target
+        return self._arm_inst_stops(board)
+
+    def _committed_insts(self, board: AbstractBoard) -> int:
+        return sum(
+            core.get_simobject().totalInsts()
+            for core in board.get_processor().get_cores()
+        )
+
+    def _remaining_insts(self, board: AbstractBoard) -> int:
+        return self._target_insts - self._committed_insts(board)
+
+    def _arm_inst_stops(self, board: AbstractBoard):
+        """Stops every core once it committed its share of the instructions
+        left until the next checkpoint.
+
+        The first core to reach its share stops the simulation with the
+        total still at or below the target, so the handler re-arms the
+        stops until the target is reached. Stops that are still pending and
+        fire no later than the new share are kept.
+        """
+        cores = board.get_processor().get_cores()
+        share = -(-self._remaining_insts(board) // len(cores))
+        for index, core in enumerate(cores):
+            current = core.get_simobject().totalInsts()
+            pending = self._inst_stops.get(index)
+            if pending is None or not current < pending <= current + share:
+                core.set_inst_stop_any_thread(share, at_start=False)
+                self._inst_stops[index] = current + share
+        return SimStep.REMAINING_TIME
+
+    def _inst_stop_reached(self, board: AbstractBoard) -> bool:
+        """Returns whether a core reached its latest stop, as opposed to a
+        stop that was replaced when the cores were re-armed."""
+        return any(
+            core.get_simobject().totalInsts() >= self._inst_stops[index]
+            for index, core in enumerate(board.get_processor().get_cores())
+            if index in self._inst_stops
+        )
+
+    def _skip_past_checkpoints(self):
+        """Skips the scheduled ticks that passed while the simulation was
+        stopped for other exit events."""
+        skipped = []
+        while self._next_checkpoint < len(self._checkpoint_schedule) and (
+            self._roi_begin_tick
+            + self._checkpoint_schedule[self._next_checkpoint]
+            < curTick()
+        ):
+            skipped.append(self._checkpoint_schedule[self._next_checkpoint])
+            self._next_checkpoint += 1
+        if len(skipped) > 0:
+            warn(
+                f"Skipping the checkpoints at ticks {skipped} into the ROI "
+                "since they are already in the past."
+            )
+
+    def _ticks_until(self, tick: int):
+        return to_period((tick - curTick()) / fromSeconds(1))
+
+    def _resume_step(self):
+        if (
+            self._checkpoint_unit == "ticks"
+            and self._roi_begin_tick is not None
+        ):
+            if self._next_checkpoint < len(self._checkpoint_schedule):
+                self._skip_past_checkpoints()
+                if self._next_checkpoint == len(self._checkpoint_schedule):
+                    return self._stop()
+                return self._ticks_until(
+                    self._roi_begin_tick
+                    + self._checkpoint_schedule[self._next_checkpoint]
+                )
+        if self._sample_stats:
+            return self._sampler.current_period()
+        return SimStep.REMAINING_TIME
+
+    def _warn_unused_checkpoints(self):
+        if self._checkpoint_schedule is not None and self._next_checkpoint < (
+            len(self._checkpoint_schedule)
+        ):
+            warn(
+                "The ROI ended before taking checkpoints at "
+                f"{self._checkpoint_unit} "
+                f"{self._checkpoint_schedule[self._next_checkpoint:]}."
+            )
+
+    def _get_scheduled_checkpoint_handlers(self, board: AbstractBoard):
+        def handle_max_insts():
+            num_cores = len(board.get_processor().get_cores())
+            while True:
+                inform("Received a max_insts.")
+                # Replaced stops still fire, e.g. after a checkpoint moved
+                # the target, and are ignored.
+                if not self._inst_stop_reached(board):
+                    inform("It's from a replaced stop, ignoring it.")
+                    yield SimStep.REMAINING_TIME
+                    continue
+                # Once less than one instruction per core is left the
+                # shares can not get any smaller, so that is close enough.
+                if self._remaining_insts(board) > num_cores:
+                    yield self._arm_inst_stops(board)
+                    continue
+                self._take_scheduled_checkpoint()
+                yield self._schedule_next_checkpoint(board)
+
+        if self._checkpoint_unit == "insts":
+            return {ExitEvent.MAX_INSTS: handle_max_insts()}
+        return {}
+
     def _get_exit_event_handler(self, board: AbstractBoard):
         def handle_exit():
             num_exits_received = 0
@@ -160,24 +460,28 @@ class ExitEventHandlerWrapper:
                     inform("Continuing simulation past after_boot.sh.")
                 else:
                     warn("Received an unexpected exit.")
-                    yield SimStep.STOP
+                    yield self._stop()
                 yield SimStep.REMAINING_TIME
 
         def handle_max_tick():
             while not self._reacted_yet:
                 inform("Received a `max_tick` before reacting to the ROI.")
                 yield SimStep.REMAINING_TIME
+            while self._checkpoint_unit == "ticks":
+                inform("Received a max_tick.")
+                self._take_scheduled_checkpoint()
+                yield self._schedule_next_checkpoint(board)
             not_done = True
             while not_done:
                 inform("Received a max_tick.")
                 if self._sample_stats:
-                    dump_stats()
+                    dump = dump_stats()
                     inform("Dumped sim stats.")
-                    yield self._sample_period
+                    yield self._sampler.next_period(dump)
                 else:
                     dump_stats()
                     not_done = False
-                    yield SimStep.STOP
+                    yield self._stop()
             raise RuntimeError("Did not expect a max_tick.")
 
         def handle_work_begin(board):
@@ -187,24 +491,16 @@ class ExitEventHandlerWrapper:
             inform("Received a work_begin.")
             reset_stats()
             inform("Reset sim stats.")
-            if self._take_checkpoint:
-                take_checkpoint(self._checkpoint_path)
-                inform(f"Took a checkpoint in {self._checkpoint_path}.")
-                inform(
-                    "Copying process_info.txt from m5.outdir "
-                    "to checkpoint path if it exists."
-                )
-                copy_file(
-                    "process_info.txt",
-                    get_outdir(),
-                    self._checkpoint_path,
-                )
+            if self._checkpoint_schedule is not None:
+                yield self._start_checkpoint_schedule(board)
+            elif self._take_checkpoint:
+                self._save_checkpoint(self._checkpoint_path)
                 self._reacted_yet = True
                 inform(
                     "Set `_reacted_yet` to True although "
                     "it's probably not going to be used."
                 )
-                yield SimStep.STOP
+                yield self._stop()
             if can_switch:
                 processor.switch()
                 inform("Switched to the next processor.")
@@ -212,15 +508,16 @@ class ExitEventHandlerWrapper:
                 yield (
                     SimStep.REMAINING_TIME
                     if not self._sample_stats
-                    else self._sample_period
+                    else self._sampler.next_period(None)
                 )
             raise RuntimeError("Did not expect a work_begin.")
 
         def handle_work_end():
             inform("Received a work_end.")
+            self._warn_unused_checkpoints()
             dump_stats()
             inform("Dumped sim stats.")
-            yield SimStep.STOP
+            yield self._stop()
             raise RuntimeError("Did not expect a work_end.")
 
         return {
@@ -228,6 +525,7 @@ class ExitEventHandlerWrapper:
             ExitEvent.MAX_TICK: handle_max_tick(),
             ExitEvent.WORKBEGIN: handle_work_begin(board),
             ExitEvent.WORKEND: handle_work_end(),
+            **self._get_scheduled_checkpoint_handlers(board),
         }
 
 
@@ -236,10 +534,12 @@ class MPIExitEventHandlerWrapper(ExitEventHandlerWrapper):
         self,
         num_processes: int,
         sample_stats: bool,
-        sample_period: str,
+        sample_period: Union[str, SamplingScheduler],
         take_checkpoint: bool,
         restore_checkpoint: bool,
         checkpoint_base_path: Optional[Union[str, Path]],
+        checkpoint_ticks: Optional[List[int]] = None,
+        checkpoint_insts: Optional[List[int]] = None,
     ):
         super().__init__(
             sample_stats,
@@ -247,6 +547,8 @@ class MPIExitEventHandlerWrapper(ExitEventHandlerWrapper):
             take_checkpoint,
             restore_checkpoint,
             checkpoint_base_path,
+            checkpoint_ticks,
+            checkpoint_insts,
         )
         self._mss_flag = 0
         self._num_processes = num_processes
@@ -265,24 +567,28 @@ class MPIExitEventHandlerWrapper(ExitEventHandlerWrapper):
                     inform("Continuing simulation past after_boot.sh.")
                 else:
                     warn("Received an unexpected exit.")
-                    yield SimStep.Stop
+                    yield self._stop()
                 yield SimStep.REMAINING_TIME
 
         def handle_max_tick():
             while not self._reacted_yet:
                 inform("Received a `max_tick` before reacting to the ROI.")
                 yield SimStep.REMAINING_TIME
+            while self._checkpoint_unit == "ticks":
+                inform("Received a max_tick.")
+                self._take_scheduled_checkpoint()
+                yield self._schedule_next_checkpoint(board)
             not_done = True
             while not_done:
                 inform("Received a max_tick.")
                 if self._sample_stats:
-                    dump_stats()
+                    dump = dump_stats()
                     inform("Dumped sim stats.")
-                    yield self._sample_period
+                    yield self._sampler.next_period(dump)
                 else:
                     dump_stats()
                     not_done = False
-                    yield SimStep.STOP
+                    yield self._stop()
             raise RuntimeError("Did not expect a max_tick.")
 
         def handle_work_begin(board):
@@ -303,26 +609,16 @@ class MPIExitEventHandlerWrapper(ExitEventHandlerWrapper):
                     inform("Reset sim stats.")
                     self._mss_flag += 1
                     board.setMSSFlag(self._mss_flag)
-                    if self._take_checkpoint:
-                        take_checkpoint(self._checkpoint_path)
-                        inform(
-                            f"Took a checkpoint in {self._checkpoint_path}."
-                        )
-                        inform(
-                            "Copying process_info.txt from m5.outdir "
-                            "to checkpoint path if it exists."
-                        )
-                        copy_file(
-                            "process_info.txt",
-                            get_outdir(),
-                            self._checkpoint_path,
-                        )
+                    if self._checkpoint_schedule is not None:
+                        yield self._start_checkpoint_schedule(board)
+                    elif self._take_checkpoint:
+                        self._save_checkpoint(self._checkpoint_path)
                         self._reacted_yet = True
                         inform(
                             "Set `_reacted_yet` to True although "
                             "it's probably not going to be used."
                         )
-                        yield SimStep.STOP
+                        yield self._stop()
                     if can_switch:
                         processor.switch()
                         inform("Switched to the next processor.")
@@ -330,7 +626,7 @@ class MPIExitEventHandlerWrapper(ExitEventHandlerWrapper):
                         yield (
                             SimStep.REMAINING_TIME
                             if not self._sample_stats
-                            else self._sample_period
+                            else self._sampler.next_period(None)
                         )
                 else:
                     yield SimStep.REMAINING_TIME
@@ -351,18 +647,15 @@ class MPIExitEventHandlerWrapper(ExitEventHandlerWrapper):
                 num_work_end_received += 1
                 inform(f"Received {num_work_end_received} work_ends so far.")
                 if num_work_end_received == self._num_processes:
+                    self._warn_unused_checkpoints()
                     dump_stats()
                     inform("Dumped sim stats.")
                     not_dumped_yet = False
                     self._mss_flag += 1
                     board.setMSSFlag(self._mss_flag)
-                    yield SimStep.STOP
+                    yield self._stop()
                 else:
-                    yield (
-                        SimStep.REMAINING_TIME
-                        if not self._sample_stats
-                        else self._sample_period
-                    )
+                    yield self._resume_step()
             raise RuntimeError(
                 "Did not expect a work_end. "
                 f"Have already received {num_work_end_received} "
@@ -374,6 +667,7 @@ class MPIExitEventHandlerWrapper(ExitEventHandlerWrapper):
             ExitEvent.MAX_TICK: handle_max_tick(),
             ExitEvent.WORKBEGIN: handle_work_begin(board),
             ExitEvent.WORKEND: handle_work_end(board),
+            **self._get_scheduled_checkpoint_handlers(board),
         }
 
 
@@ -392,63 +686,224 @@ class FSWorkloadWrapper:
         self._binary_name = binary_name
         self._num_processes = num_processes
         self._exit_handler = None
+        self._snippet = None
 
+    def get_binary_name(self) -> str:
+        return self._binary_name
 
 
-    def generate_cmdline(self):
+
+    def generate_cmdline(
+        self,
+        pid_sync: str = "poll",
+        boot_wait: str = "sleep",
+        max_boot_wait: int = 120,
+        idle_load: float = 1.0,
+        symbolize: str = "guest",
+        max_rank_wait: int = 10,
+    ):
+        """Generate the runscript that launches the workload.
+
+        Args:
+            pid_sync: How the runscript waits for the pids of the ranks and
+                how the ranks wait for their maps to be written. "poll"
+                checks for the pid files and the mmap_done.txt file every
+                62.5ms. "fifo" blocks on named pipes that the annotate
+                library writes to and reads from, which avoids running
+                `find` in a loop before the ROI.
+            boot_wait: How the runscript waits for services to settle
+                before launching the workload. "sleep" always waits
+                `max_boot_wait` seconds. "quiescence" checks every second
+                and stops waiting once `systemctl is-system-running`
+                reports that booting is over and the 1 minute load average
+                is below `idle_load`, or after `max_boot_wait` seconds.
+            max_boot_wait: Upper bound on the wait in seconds.
+            idle_load: Load average below which the system counts as idle.
+            symbolize: Where the binary is disassembled. "guest" runs
+                `objdump -S` on the guest and writes the output to
+                process_info.txt. "host" only writes the path and build-id
+                of the binary so that symbolize.py can disassemble the host
+                copy of the binary after the simulation.
+            max_rank_wait: Upper bound in seconds on how long the "poll"
+                mode waits for the ranks to write their rank to their pid
+                files, e.g. when a rank died or the disk image has an
+                annotate library that leaves the files empty. Ranks that
+                are still missing are recorded as -1, which makes
+                `build_process_maps` number the ranks in order instead.
+        """
+        if pid_sync not in ["poll", "fifo"]:
+            raise ValueError(
+                f"`pid_sync` should be one of poll, fifo. Got {pid_sync}."
+            )
+        if boot_wait not in ["sleep", "quiescence"]:
+            raise ValueError(
+                "`boot_wait` should be one of sleep, quiescence. "
+                f"Got {boot_wait}."
+            )
+        if symbolize not in ["guest", "host"]:
+            raise ValueError(
+                f"`symbolize` should be one of guest, host. Got {symbolize}."
+            )
         return (
             "#! /bin/bash\n\n"
             "# Disabling ASLR.\n"
             'echo "12345" | sudo -S sysctl -w kernel.randomize_va_space=0\n\n'
-            "# Waiting for 10 minutes to make sure all services have started.\n"
-            "# This will reduce interference with the workload.\n"
-            'echo "Waiting for 120 seconds for services to start."\n'
-            "sleep 120\n"
-            'echo "Wait is over."\n\n'
+            f"{self._generate_boot_wait(boot_wait, max_boot_wait, idle_load)}"
             "# Changing directory to the right cwd.\n"
             f"cd {self._cwd}\n\n"
-            "# Dumping the object file to a text file.\n"
-            'echo "objdump" >> process_info.txt\n'
-            f"objdump -S {self._binary_name} >> process_info.txt\n\n"
-            "# Creating the directory for mmap_done.\n"
-            f"mkdir -p {self._cwd}/mmap_done\n"
-            "# Writing 0 to the mmap_done.txt file to indicate that mmap is not done yet.\n"
-            f"echo 0 > {self._cwd}/mmap_done/mmap_done.txt\n\n"
-            "# Exporting MMAP_DONE_PATH.\n"
-            f"export MMAP_DONE_PATH={self._cwd}/mmap_done/mmap_done.txt\n"
-            "# Exporting PID_DUMP_PATH.\n"
-            f"export PID_DUMP_PATH={self._cwd}/pids\n\n"
+            f"{self._generate_binary_info(symbolize)}"
+            f"{self._generate_pid_sync_setup(pid_sync)}"
             "# Running the command to launch workload.\n"
             f"{self._generate_cmdline()} &\n\n"
             f"# Storing process mmap to host.\n"
-            "# Waiting for the PID_DUMP_PATH to be created.\n"
-            "while true; do\n"
-            "\tif [[ -d $PID_DUMP_PATH ]]; then\n"
-            "\t\tnum_files=$(find $PID_DUMP_PATH -maxdepth 1 -name 'pid_*' | wc -l)\n"
-            f"\t\tif [[ $num_files -eq {self._num_processes} ]]; then\n"
-            "\t\t\tbreak\n"
-            "\t\tfi\n"
-            "\tfi\n"
-            "\tsleep 0.0625\n"
-            "done\n\n"
-            "# Detecting all pids of the workload.\n"
-            "RANK_PIDS=()\n"
-            "for file in $PID_DUMP_PATH/pid_*; do\n"
-            "\tpid=${file##*/pid_}\n"
-            "\tRANK_PIDS+=($pid)\n"
-            "done\n\n"
+            f"{self._generate_pid_wait(pid_sync, max_rank_wait)}"
             "# Writing of the mmap of each pid to a text file on guest.\n"
-            "for pid in ${RANK_PIDS[@]}; do\n"
-            '\techo "PID: $pid" >> process_info.txt\n'
+            "for i in ${!RANK_PIDS[@]}; do\n"
+            "\tpid=${RANK_PIDS[$i]}\n"
+            '\techo "PID: $pid RANK: ${RANKS[$i]}" >> process_info.txt\n'
             '\techo "12345" | sudo -S cat /proc/$pid/maps >> process_info.txt\n'
             "done\n"
             "gem5-bridge --addr=0x10010000 writefile process_info.txt\n\n"
-            "# Writing 1 to the mmap_done.txt file to indicate that mmap is done.\n"
-            "echo 1 > $MMAP_DONE_PATH\n"
+            f"{self._generate_mmap_done(pid_sync)}"
             "# Waiting for the workload to finish.\n"
             "wait\n"
         )
 
+    def _generate_boot_wait(
+        self, boot_wait: str, max_boot_wait: int, idle_load: float
+    ):
+        if boot_wait == "sleep":
+            return (
+                "# Waiting to make sure all services have started.\n"
+                "# This will reduce interference with the workload.\n"
+                f'echo "Waiting for {max_boot_wait} seconds for services to start."\n'
+                f"sleep {max_boot_wait}\n"
+                'echo "Wait is over."\n\n'
+            )
+        return (
+            "# Waiting until booting is over and the system is idle to\n"
+            "# reduce interference with the workload.\n"
+            f'echo "Waiting up to {max_boot_wait} seconds for the system to become idle."\n'
+            "SECONDS=0\n"
+            f"while (( SECONDS < {max_boot_wait} )); do\n"
+            "\tstate=$(systemctl is-system-running 2> /dev/null)\n"
+            '\tif [[ $state != "starting" && $state != "initializing" ]]; then\n'
+            "\t\tread -r load _ < /proc/loadavg\n"
+            "\t\t# /proc/loadavg has two decimals, compare in hundredths.\n"
+            "\t\tload=${load/./}\n"
+            f"\t\tif (( 10#$load < {round(idle_load * 100)} )); then\n"
+            "\t\t\tbreak\n"
+            "\t\tfi\n"
+            "\tfi\n"
+            "\tsleep 1\n"
+            "done\n"
+            'echo "Wait is over after $SECONDS seconds."\n\n'
+        )
+
+    def _generate_binary_info(self, symbolize: str):
+        if symbolize == "guest":
+            return (
+                "# Dumping the object file to a text file.\n"
+                'echo "objdump" >> process_info.txt\n'
+                f"objdump -S {self._binary_name} >> process_info.txt\n\n"
+            )
+        return (
+            "# Recording the binary to disassemble it on the host.\n"
+            f'echo "binary: $(realpath {self._binary_name})" >> process_info.txt\n'
+            f"build_id=$(readelf -n {self._binary_name} | awk '/Build ID/ {{print $3}}')\n"
+            'echo "build-id: $build_id" >> process_info.txt\n\n'
+        )
+
+    def _generate_pid_sync_setup(self, pid_sync: str):
+        if pid_sync == "poll":
+            return (
+                "# Creating the directory for mmap_done.\n"
+                f"mkdir -p {self._cwd}/mmap_done\n"
+                "# Writing 0 to the mmap_done.txt file to indicate that mmap is not done yet.\n"
+                f"echo 0 > {self._cwd}/mmap_done/mmap_done.txt\n\n"
+                "# Exporting MMAP_DONE_PATH.\n"
+                f"export MMAP_DONE_PATH={self._cwd}/mmap_done/mmap_done.txt\n"
+                "# Exporting PID_DUMP_PATH.\n"
+                f"export PID_DUMP_PATH={self._cwd}/pids\n\n"
+            )
+        return (
+            "# Creating the pipes the ranks write their pids to and read\n"
+            "# the mmap done signal from.\n"
+            f"mkdir -p {self._cwd}/pid_sync\n"
+            f"rm -f {self._cwd}/pid_sync/pids {self._cwd}/pid_sync/mmap_done\n"
+            f"mkfifo {self._cwd}/pid_sync/pids {self._cwd}/pid_sync/mmap_done\n"
+            "# Opening both pipes for reading and writing so that opening\n"
+            "# them never blocks and they stay open while ranks come and go.\n"
+            f"exec 3<>{self._cwd}/pid_sync/pids\n"
+            f"exec 4<>{self._cwd}/pid_sync/mmap_done\n\n"
+            "# Exporting PID_SYNC_FIFO.\n"
+            f"export PID_SYNC_FIFO={self._cwd}/pid_sync/pids\n"
+            "# Exporting MMAP_DONE_FIFO.\n"
+            f"export MMAP_DONE_FIFO={self._cwd}/pid_sync/mmap_done\n\n"
+        )
+
+    def _generate_pid_wait(self, pid_sync: str, max_rank_wait: int):
+        if pid_sync == "poll":
+            return (
+                "# Waiting for the PID_DUMP_PATH to be created.\n"
+                "while true; do\n"
+                "\tif [[ -d $PID_DUMP_PATH ]]; then\n"
+                "\t\tnum_files=$(find $PID_DUMP_PATH -maxdepth 1 -name 'pid_*' | wc -l)\n"
+                f"\t\tif [[ $num_files -eq {self._num_processes} ]]; then\n"
+                "\t\t\tbreak\n"
+                "\t\tfi\n"
+                "\tfi\n"
+                "\tsleep 0.0625\n"
+                "done\n\n"
+                "# Detecting all pids of the workload and their ranks.\n"
+                "RANK_PIDS=()\n"
+                "RANKS=()\n"
+                "# Polls left until the wait for ranks runs out.\n"
+                f"rank_polls={max_rank_wait * 16}\n"
+                "for file in $PID_DUMP_PATH/pid_*; do\n"
+                "\tpid=${file##*/pid_}\n"
+                '\tRANK_PIDS+=("$pid")\n'
+                "\t# The file is created before the rank is written to it.\n"
+                '\twhile [[ ! -s "$file" ]] && (( rank_polls > 0 )); do\n'
+                "\t\tsleep 0.0625\n"
+                "\t\trank_polls=$((rank_polls - 1))\n"
+                "\tdone\n"
+                "\trank=\n"
+                '\tif [[ -s "$file" ]]; then\n'
+                '\t\tread -r rank < "$file"\n'
+                "\tfi\n"
+                '\tif [[ -z "$rank" ]]; then\n'
+                '\t\techo "Warning: $file has no rank, recording rank -1."\n'
+                "\t\trank=-1\n"
+                "\tfi\n"
+                '\tRANKS+=("$rank")\n'
+                "done\n\n"
+            )
+        return (
+            "# Reading the pid and rank of every rank from PID_SYNC_FIFO.\n"
+            "# Every read blocks until a rank writes its pid.\n"
+            "RANK_PIDS=()\n"
+            "RANKS=()\n"
+            f"for ((i = 0; i < {self._num_processes}; i++)); do\n"
+            "\tread -r pid rank <&3\n"
+            '\tRANK_PIDS+=("$pid")\n'
+            '\tRANKS+=("$rank")\n'
+            "done\n\n"
+        )
+
+    def _generate_mmap_done(self, pid_sync: str):
+        if pid_sync == "poll":
+            return (
+                "# Writing 1 to the mmap_done.txt file to indicate that mmap is done.\n"
+                "echo 1 > $MMAP_DONE_PATH\n"
+            )
+        return (
+            "# Writing one byte per rank to MMAP_DONE_FIFO to release them.\n"
+            f"for ((i = 0; i < {self._num_processes}; i++)); do\n"
+            "\tprintf 1 >&4\n"
+            "done\n"
+        )
+
     def _generate_cmdline(self):
         raise NotImplementedError
 
@@ -464,10 +919,12 @@ class FSWorkloadWrapper:
     def _create_exit_event_handler(
         self,
         sample_stats: bool,
-        sample_period: str,
+        sample_period: Union[str, SamplingScheduler],
         take_checkpoint: bool,
         restore_checkpoint: bool,
         checkpoint_path: Optional[Union[str, Path]],
+        checkpoint_ticks: Optional[List[int]] = None,
+        checkpoint_insts: Optional[List[int]] = None,
     ):
         self._exit_handler = ExitEventHandlerWrapper(
             sample_stats,
@@ -475,16 +932,20 @@ class FSWorkloadWrapper:
             take_checkpoint,
             restore_checkpoint,
             checkpoint_path,
+            checkpoint_ticks,
+            checkpoint_insts,
         )
 
     def get_exit_event_handler(
         self,
         board: AbstractBoard,
         sample_stats: bool,
-        sample_period: str,
+        sample_period: Union[str, SamplingScheduler],
         take_checkpoint: bool,
         restore_checkpoint: bool,
         checkpoint_path: Optional[Union[str, Path]],
+        checkpoint_ticks: Optional[List[int]] = None,
+        checkpoint_insts: Optional[List[int]] = None,
     ):
         self._create_exit_event_handler(
             sample_stats,
@@ -492,13 +953,98 @@ class FSWorkloadWrapper:
             take_checkpoint,
             restore_checkpoint,
             checkpoint_path,
+            checkpoint_ticks,
+            checkpoint_insts,
         )
         if self._exit_handler is None:
             raise RuntimeError("Failed to create an exit event handler.")
         return self._exit_handler.get_exit_event_handler(board)
 
-    def add_workload_insights(self, board: AbstractBoard) -> None:
-        pass
+    def find_load_base(
+        self,
+        maps_dir: Optional[Path] = None,
+        binary_path: Optional[Path] = None,
+    ) -> Optional[int]:
+        """Find the address the workload's binary was loaded at.
+
+        Args:
+            maps_dir: Directory with the process_info.txt or
+                process_maps.bin of a previous run, e.g. a checkpoint.
+            binary_path: Host copy of the binary. Binaries that are not
+                position independent are always loaded at 0. It is also
+                used to resolve `symbol+0xNN` PCs in snippets.
+
+        Returns:
+            None if neither tells where the binary was loaded.
+        """
+        if binary_path is not None and not get_elf_info(binary_path).is_pie():
+            return 0
+        if maps_dir is None or not any(
+            (Path(maps_dir) / file_name).exists()
+            for file_name in ["process_info.txt", "process_maps.bin"]
+        ):
+            return None
+        return load_process_maps(maps_dir).load_base(self._binary_name)
+
+    def _compile_snippet(
+        self,
+        snippet: str,
+        maps_dir: Optional[Path],
+        binary_path: Optional[Path],
+    ):
+        load_base = self.find_load_base(maps_dir, binary_path)
+        if load_base is None:
+            if self._binary_name not in _unknown_load_bases:
+                _unknown_load_bases.add(self._binary_name)
+                warn(
+                    "Could not find the load base of "
+                    f"{self._binary_name}, using the offset in the snippet."
+                )
+        else:
+            inform(f"Rebasing snippet PCs to {hex(load_base)}.")
+        symbols = (
+            get_symbol_index(binary_path) if binary_path is not None else None
+        )
+        return (
+            compile_snippet(snippet, symbols, _snippet_cache_dir),
+            load_base,
+        )
+
+    def add_workload_insights(
+        self,
+        board: AbstractBoard,
+        maps_dir: Optional[Path] = None,
+        binary_path: Optional[Path] = None,
+    ) -> None:
+        """Register the access sites and indirect chains of the workload's
+        snippet with the board's processor, if the workload has one.
+
+        `maps_dir` defaults to the checkpoint being restored, if
+        `get_exit_event_handler` was called with `restore_checkpoint`, so
+        the snippet is rebased on the load base recorded in it.
+
+        The snippet is also written to pc_lookup.bin in the outdir as a
+        `PCLookupTable`, which is handed to the processor if it has
+        `set_pc_lookup_table`. The file is left as it is if it already
+        holds the same table.
+        """
+        if self._snippet is None:
+            return
+        if maps_dir is None and self._exit_handler is not None:
+            maps_dir = self._exit_handler.restore_checkpoint_path()
+        snippet, load_base = self._compile_snippet(
+            self._snippet, maps_dir, binary_path
+        )
+        processor = board.get_processor()
+        register_snippet(processor, snippet, load_base)
+
+        table_path = get_outdir() / "pc_lookup.bin"
+        # The file is only rewritten when the table changes, since the
+        # processor may still be reading it.
+        if PCLookupTable.from_snippet(snippet, load_base).save(table_path):
+            inform(f"Wrote the PC lookup table to {table_path}.")
+        if hasattr(processor, "set_pc_lookup_table"):
+            processor.set_pc_lookup_table(str(table_path))
 
 
 class FSMPIWorkloadWrapper(FSWorkloadWrapper):
@@ -513,10 +1059,12 @@ class FSMPIWorkloadWrapper(FSWorkloadWrapper):
     def _create_exit_event_handler(
         self,
         sample_stats: bool,
-        sample_period: str,
+        sample_period: Union[str, SamplingScheduler],
         take_checkpoint: bool,
         restore_checkpoint: bool,
         checkpoint_path: Optional[Union[str, Path]],
+        checkpoint_ticks: Optional[List[int]] = None,
+        checkpoint_insts: Optional[List[int]] = None,
     ):
         self._exit_handler = MPIExitEventHandlerWrapper(
             self._num_processes,
@@ -525,6 +1073,8 @@ class FSMPIWorkloadWrapper(FSWorkloadWrapper):
             take_checkpoint,
             restore_checkpoint,
             checkpoint_path,
+            checkpoint_ticks,
+            checkpoint_insts,
         )
 
 
@@ -568,7 +1118,15 @@ class BootWrapper(FSWorkloadWrapper):
     def __init__(self):
         super().__init__("/home/gem5", "", 1)
 
-    def generate_cmdline(self):
+    def generate_cmdline(
+        self,
+        pid_sync: str = "poll",
+        boot_wait: str = "sleep",
+        max_boot_wait: int = 120,
+        idle_load: float = 1.0,
+        symbolize: str = "guest",
+        max_rank_wait: int = 10,
+    ):
         return (
             "#! /bin/bash\n\n"
             f'# Disabling ASLR.\necho "12345" | sudo -S sysctl -w kernel.randomize_va_space=0\n\n'
@@ -588,10 +1146,13 @@ class BootWrapper(FSWorkloadWrapper):
         take_checkpoint,
         restore_checkpoint,
         checkpoint_path,
+        checkpoint_ticks=None,
+        checkpoint_insts=None,
     ):
         inform(
             "BootCommandWrapper ignores all of `sample_stats`, "
-            "`sample_period`, `take_checkpoint`, `checkpoint_path`."
+            "`sample_period`, `take_checkpoint`, `checkpoint_path`, "
+            "`checkpoint_ticks`, `checkpoint_insts`."
         )
         self._exit_handler = BootWrapper.BootExitEventHandlerWrapper()
 
@@ -703,9 +1264,7 @@ ret b17c
             f"{BransonWrapper._base_input_path}/{self._input_name}"
         )
         self._variant = variant
-        self._access_sites, self._indirect_chains = process_snippet(
-            BransonWrapper.snippet
-        )
+        self._snippet = BransonWrapper.snippet
 
     def _generate_cmdline(self):
         workload_cmd = f"./{self._binary_name} {self._input_path}"
@@ -721,31 +1280,6 @@ ret b17c
             "variant": self._variant,
         }
 
-    def add_workload_insights(self, board: AbstractBoard) -> None:
-        processor = board.get_processor()
-        for func_name, info in self._access_sites.items():
-            labels = [site.label() for site in info["access_sites"]]
-            pcs = [site.pc() for site in info["access_sites"]]
-            processor.add_function_info(
-                func_name,
-                info["ret"],
-                labels,
-                pcs,
-            )
-
-        for indirect_chain in self._indirect_chains:
-            name = f"{indirect_chain[-1].label()}[{indirect_chain[0].label()}]{indirect_chain[-1].label_version()}"
-            processor.add_indirect_chain(
-                name, [inst.pc() for inst in indirect_chain]
-            )
-
-            for override in [
-                inst.override()
-                for inst in indirect_chain
-                if inst.has_override()
-            ]:
-                processor.add_reg_index_override(override)
-
 
 class HPCGWrapper(FSMPIWorkloadWrapper):
     snippet = """
@@ -986,9 +1520,7 @@ ret c134
         self._input_file = input_file
         self._region_name = region
         self._variant = variant
-        self._access_sites, self._indirect_chains = process_snippet(
-            UMEWrapper.snippet_translator[region]
-        )
+        self._snippet = UMEWrapper.snippet_translator[region]
 
 
 
@@ -1010,31 +1542,6 @@ ret c134
             "variant": self._variant,
         }
 
-    def add_workload_insights(self, board: AbstractBoard) -> None:
-        processor = board.get_processor()
-        for func_name, info in self._access_sites.items():
-            labels = [site.label() for site in info["access_sites"]]
-            pcs = [site.pc() for site in info["access_sites"]]
-            processor.add_function_info(
-                func_name,
-                info["ret"],
-                labels,
-                pcs,
-            )
-
-        for indirect_chain in self._indirect_chains:
-            name = f"{indirect_chain[-1].label()}[{indirect_chain[0].label()}]{indirect_chain[-1].label_version()}"
-            processor.add_indirect_chain(
-                name, [inst.pc() for inst in indirect_chain]
-            )
-
-            for override in [
-                inst.override()
-                for inst in indirect_chain
-                if inst.has_override()
-            ]:
-                processor.add_reg_index_override(override)
-
 
 class NPBWrapper(FSWorkloadWrapper):
 
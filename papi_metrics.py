@@ -0,0 +1,441 @@
+import argparse
+import ast
+
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from .papi_store import PapiStore, PapiTable
+
+default_group_by = [
+    "machine",
+    "config",
+    "workload",
+    "input",
+    "backend",
+    "region",
+]
+
+# Every formula only uses events of one backend, so they are defined with
+# backend in the grouping.
+default_metrics = {
+    "l1d_miss_rate": "PAPI_L1_DCM / PAPI_L1_DCA",
+    "l1i_miss_rate": "PAPI_L1_ICM / PAPI_L1_ICA",
+    "l2_miss_rate": "PAPI_L2_TCM / PAPI_L2_TCA",
+    "l1d_accesses_per_ns": "sum(PAPI_L1_DCA) / max(real_time_nsec)",
+    "l2_accesses_per_ns": "sum(PAPI_L2_TCA) / max(real_time_nsec)",
+    "cycles_imbalance": "imbalance(cycles)",
+    "time_imbalance": "imbalance(real_time_nsec)",
+}
+
+# Formulas that combine events of different backends. They need the
+# counters of all backends of a run merged first, e.g. with
+# `papi_stitch.stitch_partitions(table).to_table()`.
+cross_backend_metrics = {
+    "l1d_mpki": "1000 * PAPI_L1_DCM / PAPI_TOT_INS",
+    "ipc": "PAPI_TOT_INS / PAPI_TOT_CYC",
+}
+
+# Events that measure the time a thread spent in a region rather than work
+# it did. The threads of a rank run concurrently, so these take the maximum
+# over threads instead of the sum.
+default_thread_max_events = ["real_time_nsec", "cycles"]
+
+_file_fields = ["machine", "config", "workload", "input", "backend"]
+
+# Columns that hold numbers instead of codes into a dictionary.
+_integer_columns = ["rank", "thread"]
+
+
+class _Samples:
+    """Counters of every (rank file, region) pair as a dense matrix with
+    the group of every pair.
+
+    Counters of all regions with the same name are summed per thread. The
+    threads are then summed, except for `thread_max_events` which take the
+    maximum over threads. Counters a rank file did not measure are NaN.
+    """
+
+    def __init__(
+        self,
+        table: PapiTable,
+        group_by: List[str],
+        where: Dict[str, Union[str, int, List[Union[str, int]]]],
+        thread_max_events: List[str],
+    ):
+        rows = np.ones(len(table), dtype=bool)
+        for name, values in where.items():
+            if isinstance(values, (str, int)):
+                values = [values]
+            if name in _integer_columns:
+                codes = [int(value) for value in values]
+            elif name in _file_fields + ["region", "event"]:
+                codes = [table.code(name, value) for value in values]
+            else:
+                raise ValueError(
+                    f"Can not filter by {name}. It should be one of "
+                    f"{_file_fields + ['region', 'event'] + _integer_columns}."
+                )
+            rows &= np.isin(table.column(name), codes)
+
+        files = table.column("file")[rows]
+        regions = table.column("region")[rows]
+        threads = table.column("thread")[rows].astype(np.int64)
+        events = table.column("event")[rows]
+        num_regions = max(len(table.dictionary("region")), 1)
+        num_events = len(table.dictionary("event"))
+        samples, sample_ids = np.unique(
+            files.astype(np.int64) * num_regions + regions,
+            return_inverse=True,
+        )
+        sample_threads, sample_thread_ids = np.unique(
+            sample_ids * (threads.max(initial=0) + 1) + threads,
+            return_inverse=True,
+        )
+        cells = sample_thread_ids * num_events + events
+        size = len(sample_threads) * num_events
+        sums = np.bincount(
+            cells, weights=table.values()[rows].astype(float), minlength=size
+        )
+        counts = np.bincount(cells, minlength=size)
+        per_thread = np.where(counts > 0, sums, np.nan).reshape(
+            len(sample_threads), num_events
+        )
+        thread_samples = sample_ids[
+            np.unique(sample_thread_ids, return_index=True)[1]
+        ]
+        thread_sums = np.zeros((len(samples), num_events))
+        np.add.at(thread_sums, thread_samples, np.nan_to_num(per_thread))
+        thread_counts = np.zeros((len(samples), num_events))
+        np.add.at(thread_counts, thread_samples, ~np.isnan(per_thread))
+        thread_maxima = np.full((len(samples), num_events), np.nan)
+        np.fmax.at(thread_maxima, thread_samples, per_thread)
+        self._events = {
+            event: index
+            for index, event in enumerate(table.dictionary("event"))
+        }
+        use_max = np.zeros(num_events, dtype=bool)
+        for event in thread_max_events:
+            if event in self._events:
+                use_max[self._events[event]] = True
+        self._matrix = np.where(
+            use_max,
+            thread_maxima,
+            np.where(thread_counts > 0, thread_sums, np.nan),
+        )
+
+        sample_files = samples // num_regions
+        key_columns = []
+        for name in group_by:
+            if name == "region":
+                key_columns.append(samples % num_regions)
+            elif name == "rank":
+                key_columns.append(table.file_column("rank")[sample_files])
+            elif name in _file_fields:
+                key_columns.append(table.file_column(name)[sample_files])
+            else:
+                raise ValueError(f"Can not group by {name}.")
+        if len(key_columns) > 0:
+            keys, self._groups = np.unique(
+                np.stack(key_columns, axis=1), axis=0, return_inverse=True
+            )
+            self._groups = self._groups.reshape(-1)
+        else:
+            keys = np.zeros((1 if len(samples) > 0 else 0, 0), dtype=int)
+            self._groups = np.zeros(len(samples), dtype=np.int64)
+        self._num_groups = len(keys)
+        self._keys = {}
+        for index, name in enumerate(group_by):
+            if name == "rank":
+                self._keys[name] = keys[:, index]
+            else:
+                dictionary = np.array(table.dictionary(name), dtype=str)
+                self._keys[name] = dictionary[keys[:, index]]
+
+    def keys(self) -> Dict[str, np.ndarray]:
+        return self._keys
+
+    def __len__(self) -> int:
+        return len(self._matrix)
+
+    def event(self, name: str) -> np.ndarray:
+        if name not in self._events:
+            return np.full(len(self._matrix), np.nan)
+        return self._matrix[:, self._events[name]]
+
+    def count(self, values: np.ndarray) -> np.ndarray:
+        return np.bincount(
+            self._groups,
+            weights=~np.isnan(values),
+            minlength=self._num_groups,
+        )
+
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        sums = np.bincount(
+            self._groups,
+            weights=np.nan_to_num(values),
+            minlength=self._num_groups,
+        )
+        return np.where(self.count(values) > 0, sums, np.nan)
+
+    def mean(self, values: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sum(values) / self.count(values)
+
+    def max(self, values: np.ndarray) -> np.ndarray:
+        result = np.full(self._num_groups, np.nan)
+        np.fmax.at(result, self._groups, values)
+        return result
+
+    def min(self, values: np.ndarray) -> np.ndarray:
+        result = np.full(self._num_groups, np.nan)
+        np.fmin.at(result, self._groups, values)
+        return result
+
+    def imbalance(self, values: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.max(values) / self.mean(values)
+
+
+_reductions = ["sum", "mean", "max", "min", "count", "imbalance"]
+_operators = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+}
+
+
+class Metric:
+    """A derived metric given as an arithmetic formula over events.
+
+    An event name in the formula stands for the sum of that event over
+    every rank of the group, where the value of a rank is the sum over its
+    threads, or the maximum for time-like events. The reductions `sum`,
+    `mean`, `max`, `min`, `count` and `imbalance` (max over mean) evaluate
+    their argument per rank and reduce it over the ranks of the group,
+    e.g. `mean(PAPI_L1_DCM / PAPI_L1_DCA)` is the mean of the per rank miss
+    rates and `imbalance(cycles)` is the rank imbalance.
+    """
+
+    def __init__(self, name: str, formula: str):
+        self._name = name
+        self._formula = formula
+        self._tree = ast.parse(formula, mode="eval").body
+        self._check(self._tree, False)
+
+    def name(self) -> str:
+        return self._name
+
+    def formula(self) -> str:
+        return self._formula
+
+    def _check(self, node, in_reduction: bool):
+        if isinstance(node, ast.BinOp) and type(node.op) in _operators:
+            self._check(node.left, in_reduction)
+            self._check(node.right, in_reduction)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            self._check(node.operand, in_reduction)
+        elif isinstance(node, ast.Constant) and isinstance(
+            node.value, (int, float)
+        ):
+            pass
+        elif isinstance(node, ast.Name):
+            pass
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in _reductions
+            and len(node.args) == 1
+            and len(node.keywords) == 0
+            and not in_reduction
+        ):
+            self._check(node.args[0], True)
+        else:
+            raise ValueError(
+                f"Unsupported expression in the formula of {self._name}: "
+                f"{ast.unparse(node)}"
+            )
+
+    def _evaluate(self, node, samples: _Samples, in_reduction: bool):
+        if isinstance(node, ast.BinOp):
+            return _operators[type(node.op)](
+                self._evaluate(node.left, samples, in_reduction),
+                self._evaluate(node.right, samples, in_reduction),
+            )
+        if isinstance(node, ast.UnaryOp):
+            return -self._evaluate(node.operand, samples, in_reduction)
+        if isinstance(node, ast.Constant):
+            return float(node.value)
+        if isinstance(node, ast.Name):
+            values = samples.event(node.id)
+            return values if in_reduction else samples.sum(values)
+        values = self._evaluate(node.args[0], samples, True)
+        if np.ndim(values) == 0:
+            values = np.full(len(samples), values)
+        return getattr(samples, node.func.id)(values)
+
+    def evaluate(self, samples: _Samples) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._evaluate(self._tree, samples, False)
+
+    def __str__(self) -> str:
+        return f"Metric({self._name} = {self._formula})"
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+class MetricTable:
+    """Metrics of every group, one row per group."""
+
+    def __init__(
+        self, keys: Dict[str, np.ndarray], metrics: Dict[str, np.ndarray]
+    ):
+        self._keys = keys
+        self._metrics = metrics
+
+    def key_names(self) -> List[str]:
+        return list(self._keys.keys())
+
+    def metric_names(self) -> List[str]:
+        return list(self._metrics.keys())
+
+    def key(self, name: str) -> np.ndarray:
+        return self._keys[name]
+
+    def metric(self, name: str) -> np.ndarray:
+        return self._metrics[name]
+
+    def rows(self) -> List[Dict]:
+        columns = {**self._keys, **self._metrics}
+        return [
+            {name: column[index].item() for name, column in columns.items()}
+            for index in range(len(self))
+        ]
+
+    def to_csv(self, path: Path):
+        names = self.key_names() + self.metric_names()
+        with open(path, "w") as output:
+            output.write(",".join(names) + "\n")
+            for row in self.rows():
+                output.write(",".join(str(row[name]) for name in names) + "\n")
+
+    def __len__(self) -> int:
+        if len(self._keys) > 0:
+            return len(next(iter(self._keys.values())))
+        if len(self._metrics) > 0:
+            return len(next(iter(self._metrics.values())))
+        return 0
+
+    def __str__(self) -> str:
+        return (
+            f"MetricTable(groups: {len(self)}, "
+            f"metrics: {self.metric_names()})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+def evaluate_metrics(
+    table: PapiTable,
+    metrics: Optional[Dict[str, str]] = None,
+    group_by: Optional[List[str]] = None,
+    where: Optional[Dict[str, Union[str, int, List[Union[str, int]]]]] = None,
+    thread_max_events: Optional[List[str]] = None,
+) -> MetricTable:
+    """Evaluates `metrics` for every group of the rows of `table`.
+
+    Args:
+        table: Counters to evaluate the metrics over.
+        metrics: Metric names and their formulas. Defaults to
+            `default_metrics`.
+        group_by: Columns to group by, out of machine, config, workload,
+            input, backend, region and rank. Defaults to
+            `default_group_by`.
+        where: Only use rows whose column has the given value or one of
+            the given values, e.g. `{"workload": "branson"}`. rank and
+            thread are compared as integers, e.g. `{"rank": [0, 1]}`.
+        thread_max_events: Events that take the maximum over the threads of
+            a rank instead of the sum. Defaults to
+            `default_thread_max_events`.
+
+    Metrics that need events of rank files from different backends, like
+    `cross_backend_metrics`, are NaN if `group_by` contains backend. Merge
+    the backends with `papi_stitch.stitch_partitions` to evaluate them.
+    """
+    metrics = [
+        Metric(name, formula)
+        for name, formula in (metrics or default_metrics).items()
+    ]
+    samples = _Samples(
+        table,
+        default_group_by if group_by is None else group_by,
+        where or {},
+        (
+            default_thread_max_events
+            if thread_max_events is None
+            else thread_max_events
+        ),
+    )
+    return MetricTable(
+        samples.keys(),
+        {metric.name(): metric.evaluate(samples) for metric in metrics},
+    )
+
+
+def _parse_where(items: List[str]) -> Dict[str, List[str]]:
+    where = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        where.setdefault(name, []).append(value)
+    return where
+
+
+def get_inputs():
+    parser = argparse.ArgumentParser(
+        description="Evaluate derived metrics over a PAPI counter store."
+    )
+    parser.add_argument("store", type=str, help="Directory of the store.")
+    parser.add_argument(
+        "--metric",
+        type=str,
+        action="append",
+        default=[],
+        help="Metric as name=formula. Defaults to the built in metrics.",
+    )
+    parser.add_argument(
+        "--group-by",
+        type=str,
+        default=",".join(default_group_by),
+        help="Comma separated columns to group by.",
+    )
+    parser.add_argument(
+        "--where",
+        type=str,
+        action="append",
+        default=[],
+        help="Only use rows where column=value. Can be repeated.",
+    )
+    parser.add_argument("--output", type=str, default="metrics.csv")
+
+    args = parser.parse_args()
+    metrics = dict(metric.split("=", 1) for metric in args.metric) or None
+    group_by = [name for name in args.group_by.split(",") if name != ""]
+    return (
+        Path(args.store),
+        metrics,
+        group_by,
+        _parse_where(args.where),
+        Path(args.output),
+    )
+
+
+if __name__ == "__main__":
+    store_dir, metrics, group_by, where, output = get_inputs()
+    table = PapiStore(store_dir).load()
+    result = evaluate_metrics(table, metrics, group_by, where)
+    result.to_csv(output)
+    print(f"Wrote {result} to {output}.")
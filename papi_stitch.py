@@ -0,0 +1,317 @@
+import argparse
+import warnings
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .papi_store import PapiStore, PapiTable
+
+_run_fields = ["machine", "config", "workload", "input"]
+
+
+def _positions(run_ids: np.ndarray, backends: np.ndarray, ranks: np.ndarray):
+    """Returns the position of every file among the files of the same run
+    and backend, ordered by rank.
+
+    Runs without MPI name their only rank file after the pid, so ranks are
+    aligned by position instead of by the rank in the file name.
+    """
+    order = np.lexsort((ranks, backends, run_ids))
+    groups = run_ids[order].astype(np.int64) * (backends.max() + 1)
+    groups += backends[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    lengths = np.diff(np.r_[starts, len(order)])
+    positions = np.empty(len(order), dtype=np.int64)
+    positions[order] = np.arange(len(order)) - np.repeat(starts, lengths)
+    return positions
+
+
+def _warn_uneven_partitions(
+    table: PapiTable,
+    runs: np.ndarray,
+    run_ids: np.ndarray,
+    backends: np.ndarray,
+):
+    """Warns about runs whose partitions have different numbers of rank
+    files, since their ranks can not be aligned by position."""
+    pairs, counts = np.unique(
+        np.stack([run_ids, backends], axis=1), axis=0, return_counts=True
+    )
+    for run in np.unique(pairs[:, 0]):
+        run_counts = counts[pairs[:, 0] == run]
+        if run_counts.min() != run_counts.max():
+            names = [
+                table.dictionary(name)[code]
+                for name, code in zip(_run_fields, runs[run])
+            ]
+            warnings.warn(
+                f"Partitions of run {'/'.join(names)} have between "
+                f"{run_counts.min()} and {run_counts.max()} rank files, so "
+                "some of their ranks are misaligned."
+            )
+
+
+class StitchedCounters:
+    """Counters of all partitions of the same runs merged per (rank, thread,
+    region).
+
+    Every partition is one rerun of the same workload with a different
+    group of events, stored as a backend. Counters of a partition are
+    scaled so that its reference event matches the mean of the reference
+    event over all partitions, and events measured by several partitions
+    are averaged. `variation` is the coefficient of variation over the
+    partitions of the events every partition measured.
+    """
+
+    def __init__(
+        self,
+        keys: Dict[str, np.ndarray],
+        events: List[str],
+        counters: np.ndarray,
+        common_events: List[str],
+        variation: np.ndarray,
+        num_partitions: np.ndarray,
+    ):
+        self._keys = keys
+        self._events = events
+        self._counters = counters
+        self._common_events = common_events
+        self._variation = variation
+        self._num_partitions = num_partitions
+
+    def key(self, name: str) -> np.ndarray:
+        return self._keys[name]
+
+    def key_names(self) -> List[str]:
+        return list(self._keys.keys())
+
+    def events(self) -> List[str]:
+        return self._events
+
+    def counters(self) -> np.ndarray:
+        """Merged counters with one row per (rank, thread, region) and one
+        column per event. Events no partition measured are NaN."""
+        return self._counters
+
+    def event(self, name: str) -> np.ndarray:
+        return self._counters[:, self._events.index(name)]
+
+    def common_events(self) -> List[str]:
+        return self._common_events
+
+    def variation(self, name: str) -> np.ndarray:
+        return self._variation[:, self._common_events.index(name)]
+
+    def num_partitions(self) -> np.ndarray:
+        return self._num_partitions
+
+    def to_table(self, backend: str = "stitched") -> PapiTable:
+        """Returns the merged counters as a table with one rank file per
+        (run, rank), so that metrics can combine events of different
+        partitions."""
+        run_keys = np.stack(
+            [self._keys[name] for name in _run_fields + ["rank"]], axis=1
+        )
+        files, file_ids = np.unique(run_keys, axis=0, return_inverse=True)
+        dictionaries = {"backend": [backend], "path": [""]}
+        file_columns = {
+            "backend": np.zeros(len(files), dtype=np.int32),
+            "path": np.zeros(len(files), dtype=np.int32),
+            "rank": files[:, -1].astype(np.int64),
+        }
+        for index, name in enumerate(_run_fields):
+            dictionary, codes = np.unique(files[:, index], return_inverse=True)
+            dictionaries[name] = dictionary.tolist()
+            file_columns[name] = codes.astype(np.int32)
+
+        rows, events = np.nonzero(~np.isnan(self._counters))
+        regions, region_codes = np.unique(
+            self._keys["region"], return_inverse=True
+        )
+        dictionaries["region"] = regions.tolist()
+        dictionaries["event"] = list(self._events)
+        row_columns = {
+            "file": file_ids.reshape(-1)[rows].astype(np.int32),
+            "thread": self._keys["thread"][rows].astype(np.int32),
+            "region_id": region_codes[rows].astype(np.int32),
+            "parent_region_id": np.full(len(rows), -1, dtype=np.int32),
+            "region": region_codes[rows].astype(np.int32),
+            "event": events.astype(np.int32),
+            "value": np.rint(self._counters[rows, events]).astype(np.int64),
+        }
+        return PapiTable(dictionaries, file_columns, row_columns)
+
+    def to_csv(self, path: Path):
+        names = (
+            self.key_names()
+            + ["partitions"]
+            + self._events
+            + [f"cv.{event}" for event in self._common_events]
+        )
+        columns = (
+            [self._keys[name] for name in self.key_names()]
+            + [self._num_partitions]
+            + [self._counters[:, index] for index in range(len(self._events))]
+            + [
+                self._variation[:, index]
+                for index in range(len(self._common_events))
+            ]
+        )
+        with open(path, "w") as output:
+            output.write(",".join(names) + "\n")
+            for index in range(len(self)):
+                output.write(
+                    ",".join(str(column[index]) for column in columns) + "\n"
+                )
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def __str__(self) -> str:
+        return (
+            f"StitchedCounters(rows: {len(self)}, events: {len(self._events)}"
+            f", common events: {self._common_events})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+def stitch_partitions(
+    table: PapiTable, reference_event: Optional[str] = "cycles"
+) -> StitchedCounters:
+    """Aligns the partitions of every run by (rank, thread, region) and
+    merges their counters.
+
+    A run is a (machine, config, workload, input) and its partitions are
+    the backends it was measured with.
+
+    Args:
+        table: Counters of the partitions.
+        reference_event: Event every partition measured that the counters
+            of each partition are normalized by. If it is None the counters
+            are merged as they are.
+    """
+    files = table.column("file")
+    run_keys = np.stack(
+        [table.file_column(name) for name in _run_fields], axis=1
+    )
+    runs, run_ids = np.unique(run_keys, axis=0, return_inverse=True)
+    run_ids = run_ids.reshape(-1)
+    backends = table.file_column("backend").astype(np.int64)
+    positions = _positions(run_ids, backends, table.file_column("rank"))
+    _warn_uneven_partitions(table, runs, run_ids, backends)
+
+    threads = table.column("thread").astype(np.int64)
+    regions = table.column("region").astype(np.int64)
+    dims = (
+        max(len(runs), 1),
+        int(positions.max(initial=0)) + 1,
+        int(threads.max(initial=0)) + 1,
+        max(len(table.dictionary("region")), 1),
+    )
+    units, unit_ids = np.unique(
+        np.ravel_multi_index(
+            (run_ids[files], positions[files], threads, regions), dims
+        ),
+        return_inverse=True,
+    )
+    backend_codes, partition_of_file = np.unique(backends, return_inverse=True)
+    partitions = partition_of_file.reshape(-1)[files]
+    num_partitions = max(len(backend_codes), 1)
+    num_events = len(table.dictionary("event"))
+
+    shape = (len(units), num_partitions, num_events)
+    cells = np.ravel_multi_index(
+        (unit_ids, partitions, table.column("event")), shape
+    )
+    size = len(units) * num_partitions * num_events
+    sums = np.bincount(
+        cells, weights=table.values().astype(float), minlength=size
+    )
+    counts = np.bincount(cells, minlength=size)
+    raw = np.where(counts > 0, sums, np.nan).reshape(shape)
+
+    measured = ~np.isnan(raw)
+    present = measured.any(axis=2)
+    unit_partitions = present.sum(axis=1)
+    common = (measured | ~present[:, :, None]).all(axis=1)
+    common_events = [
+        event
+        for index, event in enumerate(table.dictionary("event"))
+        if len(units) > 0 and common[:, index].all()
+    ]
+    common_ids = [
+        table.dictionary("event").index(event) for event in common_events
+    ]
+
+    cube = raw
+    with warnings.catch_warnings():
+        # Events that no partition of a unit measured stay NaN.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if reference_event is not None:
+            if reference_event not in common_events:
+                raise ValueError(
+                    f"{reference_event} was not measured by every partition."
+                )
+            reference = cube[
+                :, :, table.dictionary("event").index(reference_event)
+            ]
+            # A partition that counted no reference events can not be
+            # scaled, so it is left out of the unit like a missing one.
+            reference = np.where(reference > 0, reference, np.nan)
+            scale = np.nanmean(reference, axis=1, keepdims=True) / reference
+            cube = cube * scale[:, :, None]
+        counters = np.nanmean(cube, axis=1)
+        common_values = raw[:, :, common_ids]
+        variation = np.nanstd(common_values, axis=1) / np.nanmean(
+            common_values, axis=1
+        )
+
+    run_index, position, thread, region = np.unravel_index(units, dims)
+    keys = {}
+    for index, name in enumerate(_run_fields):
+        dictionary = np.array(table.dictionary(name), dtype=str)
+        keys[name] = dictionary[runs[run_index, index]]
+    keys["rank"] = position
+    keys["thread"] = thread
+    keys["region"] = np.array(table.dictionary("region"), dtype=str)[region]
+    return StitchedCounters(
+        keys,
+        list(table.dictionary("event")),
+        counters,
+        common_events,
+        variation,
+        unit_partitions,
+    )
+
+
+def get_inputs():
+    parser = argparse.ArgumentParser(
+        description="Merge the counters of runs measured with different "
+        "groups of events."
+    )
+    parser.add_argument("store", type=str, help="Directory of the store.")
+    parser.add_argument(
+        "--reference-event",
+        type=str,
+        default="cycles",
+        help="Event to normalize partitions by, or 'none'.",
+    )
+    parser.add_argument("--output", type=str, default="stitched.csv")
+
+    args = parser.parse_args()
+    reference_event = (
+        None if args.reference_event == "none" else args.reference_event
+    )
+    return Path(args.store), reference_event, Path(args.output)
+
+
+if __name__ == "__main__":
+    store_dir, reference_event, output = get_inputs()
+    table = PapiStore(store_dir).load()
+    stitched = stitch_partitions(table, reference_event)
+    stitched.to_csv(output)
+    print(f"Wrote {stitched} to {output}.")
@@ -0,0 +1,526 @@
+import argparse
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .file_hash import hash_file
+
+_version = 1
+_manifest_file_name = "manifest.json"
+_file_fields = ["machine", "config", "workload", "input", "backend"]
+_row_fields = ["region", "event"]
+_ignored_region_keys = {"name", "parent_region_id"}
+
+
+def parse_rank_path(root: Path, path: Path) -> Dict[str, str]:
+    """Returns what a rank file measured based on where it is under `root`.
+
+    Rank files live in either
+    `<machine>-<config>/<workload>/<input>/<backend>_data/papi_hl_output` or
+    `<machine>/<config>/<workload>/<input>/<backend>_data/papi_hl_output`.
+    """
+    parts = Path(path).relative_to(root).parts
+    if len(parts) < 6 or parts[-2] != "papi_hl_output":
+        raise ValueError(f"{path} is not a papi_hl_output rank file.")
+    prefix = parts[:-5]
+    if len(prefix) == 1:
+        machine, _, config = prefix[0].partition("-")
+    else:
+        machine, config = prefix[0], "/".join(prefix[1:])
+    backend = parts[-3]
+    if backend.endswith("_data"):
+        backend = backend[: -len("_data")]
+    return {
+        "machine": machine,
+        "config": config,
+        "workload": parts[-5],
+        "input": parts[-4],
+        "backend": backend,
+    }
+
+
+def find_rank_files(root: Path) -> List[Path]:
+    return sorted(Path(root).glob("**/papi_hl_output/rank_*.json"))
+
+
+def _rank_from_name(path: Path) -> int:
+    return int(Path(path).stem[len("rank_") :])
+
+
+def _parse_rank_file(path: Path) -> Tuple[List[str], List[str], np.ndarray]:
+    """Flattens the threads, regions and counters of a rank file.
+
+    Returns the region names and event names of the file and one row per
+    counter with columns thread, region_id, parent_region_id, region and
+    event, where region and event index into the returned names.
+    """
+    with open(path, "r") as rank_file:
+        data = json.load(rank_file)
+
+    regions = []
+    region_codes = {}
+    events = []
+    event_codes = {}
+    rows = []
+    for thread, thread_data in data.get("threads", {}).items():
+        for region_id, region in thread_data.get("regions", {}).items():
+            name = region.get("name", "")
+            if name not in region_codes:
+                region_codes[name] = len(regions)
+                regions.append(name)
+            parent = int(region.get("parent_region_id", -1))
+            for event, value in region.items():
+                if event in _ignored_region_keys:
+                    continue
+                try:
+                    value = int(value)
+                except ValueError:
+                    continue
+                if event not in event_codes:
+                    event_codes[event] = len(events)
+                    events.append(event)
+                rows.append(
+                    (
+                        int(thread),
+                        int(region_id),
+                        parent,
+                        region_codes[name],
+                        event_codes[event],
+                        value,
+                    )
+                )
+    return regions, events, np.array(rows, dtype=np.int64).reshape(-1, 6)
+
+
+def _encode(
+    values: List[str], codes: Dict[str, int], dictionary: List[str]
+) -> np.ndarray:
+    for value in values:
+        if value not in codes:
+            codes[value] = len(dictionary)
+            dictionary.append(value)
+    return np.array([codes[value] for value in values], dtype=np.int32)
+
+
+class PapiTable:
+    """Counters of many papi_hl_output rank files as one columnar table.
+
+    Every row is one counter of one region of one thread of one rank file.
+    Columns that describe the whole rank file (machine, config, workload,
+    input, backend, rank and path) are stored once per file and indexed by
+    the `file` column. String columns are stored as int32 codes into a
+    dictionary per column.
+    """
+
+    def __init__(
+        self,
+        dictionaries: Dict[str, List[str]],
+        file_columns: Dict[str, np.ndarray],
+        row_columns: Dict[str, np.ndarray],
+    ):
+        self._dictionaries = dictionaries
+        self._file_columns = file_columns
+        self._row_columns = row_columns
+
+    @classmethod
+    def empty(cls) -> "PapiTable":
+        return cls(
+            {name: [] for name in _file_fields + _row_fields + ["path"]},
+            {
+                name: np.zeros(
+                    0, dtype=np.int64 if name == "rank" else np.int32
+                )
+                for name in _file_fields + ["rank", "path"]
+            },
+            {
+                name: np.zeros(
+                    0, dtype=np.int64 if name == "value" else np.int32
+                )
+                for name in [
+                    "file",
+                    "thread",
+                    "region_id",
+                    "parent_region_id",
+                    "region",
+                    "event",
+                    "value",
+                ]
+            },
+        )
+
+    def num_files(self) -> int:
+        return len(self._file_columns["rank"])
+
+    def dictionary(self, name: str) -> List[str]:
+        return self._dictionaries[name]
+
+    def paths(self) -> List[str]:
+        paths = self._dictionaries["path"]
+        return [paths[code] for code in self._file_columns["path"]]
+
+    def file_column(self, name: str) -> np.ndarray:
+        return self._file_columns[name]
+
+    def column(self, name: str) -> np.ndarray:
+        """Returns a column with one entry per row. File level columns are
+        expanded through the `file` column."""
+        if name in self._row_columns:
+            return self._row_columns[name]
+        return self._file_columns[name][self._row_columns["file"]]
+
+    def code(self, name: str, value: str) -> int:
+        """Returns the code of `value` in the dictionary of `name` or -1."""
+        try:
+            return self._dictionaries[name].index(value)
+        except ValueError:
+            return -1
+
+    def values(self) -> np.ndarray:
+        return self._row_columns["value"]
+
+    def take_files(self, keep: np.ndarray) -> "PapiTable":
+        """Returns a table with the files where the boolean mask `keep` is
+        set and their rows."""
+        keep = np.asarray(keep, dtype=bool)
+        file_ids = np.full(len(keep), -1, dtype=np.int32)
+        file_ids[keep] = np.arange(np.count_nonzero(keep), dtype=np.int32)
+        rows = keep[self._row_columns["file"]]
+        row_columns = {
+            name: column[rows] for name, column in self._row_columns.items()
+        }
+        row_columns["file"] = file_ids[row_columns["file"]]
+        return PapiTable(
+            self._dictionaries,
+            {
+                name: column[keep]
+                for name, column in self._file_columns.items()
+            },
+            row_columns,
+        )
+
+    def __len__(self) -> int:
+        return len(self._row_columns["value"])
+
+    def __str__(self) -> str:
+        return (
+            f"PapiTable(files: {self.num_files()}, rows: {len(self)}, "
+            f"events: {len(self._dictionaries['event'])})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+    @classmethod
+    def concat(cls, tables: Iterable["PapiTable"]) -> "PapiTable":
+        """Concatenates tables, merging their dictionaries."""
+        result = cls.empty()
+        dictionaries = result._dictionaries
+        codes = {name: {} for name in dictionaries}
+        file_parts = {name: [] for name in result._file_columns}
+        row_parts = {name: [] for name in result._row_columns}
+        num_files = 0
+        for table in tables:
+            remaps = {
+                name: _encode(dictionary, codes[name], dictionaries[name])
+                for name, dictionary in table._dictionaries.items()
+            }
+            for name, column in table._file_columns.items():
+                file_parts[name].append(
+                    remaps[name][column] if name in remaps else column
+                )
+            for name, column in table._row_columns.items():
+                if name in remaps:
+                    column = remaps[name][column]
+                elif name == "file":
+                    column = column + num_files
+                row_parts[name].append(column)
+            num_files += table.num_files()
+        for name, parts in file_parts.items():
+            if len(parts) > 0:
+                result._file_columns[name] = np.concatenate(parts)
+        for name, parts in row_parts.items():
+            if len(parts) > 0:
+                result._row_columns[name] = np.concatenate(parts).astype(
+                    result._row_columns[name].dtype
+                )
+        return result
+
+    def save(self, path: Path):
+        arrays = {"version": np.array(_version)}
+        for name, dictionary in self._dictionaries.items():
+            arrays[f"dictionary.{name}"] = np.array(dictionary, dtype=str)
+        for name, column in self._file_columns.items():
+            arrays[f"file.{name}"] = column
+        for name, column in self._row_columns.items():
+            arrays[f"row.{name}"] = column
+        tmp_path = Path(f"{path}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "PapiTable":
+        with np.load(path, allow_pickle=False) as arrays:
+            if "version" not in arrays or int(arrays["version"]) != _version:
+                raise ValueError(f"{path} is not a PAPI counter store.")
+            dictionaries = {}
+            file_columns = {}
+            row_columns = {}
+            for key in arrays.files:
+                kind, _, name = key.partition(".")
+                if kind == "dictionary":
+                    dictionaries[name] = arrays[key].tolist()
+                elif kind == "file":
+                    file_columns[name] = arrays[key]
+                elif kind == "row":
+                    row_columns[name] = arrays[key]
+        return cls(dictionaries, file_columns, row_columns)
+
+
+def load_rank_files(
+    root: Path, paths: List[Path], max_workers: Optional[int] = None
+) -> PapiTable:
+    """Parses `paths` in a process pool and builds one table from them.
+
+    Args:
+        root: Root of the data tree, used to tell what every file measured.
+        paths: Rank files under `root`.
+        max_workers: Number of worker processes. Defaults to the number of
+            CPUs.
+    """
+    table = PapiTable.empty()
+    dictionaries = table._dictionaries
+    codes = {name: {} for name in dictionaries}
+    file_values = {name: [] for name in _file_fields + ["path"]}
+    ranks = []
+    row_parts = []
+    region_parts = []
+    event_parts = []
+    file_parts = []
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            _parse_rank_file,
+            paths,
+            chunksize=max(1, len(paths) // (8 * (os.cpu_count() or 1))),
+        )
+        for file_id, (path, (regions, events, rows)) in enumerate(
+            zip(paths, results)
+        ):
+            for name, value in parse_rank_path(root, path).items():
+                file_values[name].append(value)
+            file_values["path"].append(str(Path(path).relative_to(root)))
+            ranks.append(_rank_from_name(path))
+            region_parts.append(
+                _encode(regions, codes["region"], dictionaries["region"])[
+                    rows[:, 3]
+                ]
+            )
+            event_parts.append(
+                _encode(events, codes["event"], dictionaries["event"])[
+                    rows[:, 4]
+                ]
+            )
+            file_parts.append(np.full(len(rows), file_id, dtype=np.int32))
+            row_parts.append(rows)
+
+    for name, values in file_values.items():
+        table._file_columns[name] = _encode(
+            values, codes[name], dictionaries[name]
+        )
+    table._file_columns["rank"] = np.array(ranks, dtype=np.int64)
+    if len(row_parts) > 0:
+        rows = np.concatenate(row_parts)
+        columns = table._row_columns
+        columns["file"] = np.concatenate(file_parts)
+        columns["thread"] = rows[:, 0].astype(np.int32)
+        columns["region_id"] = rows[:, 1].astype(np.int32)
+        columns["parent_region_id"] = rows[:, 2].astype(np.int32)
+        columns["region"] = np.concatenate(region_parts)
+        columns["event"] = np.concatenate(event_parts)
+        columns["value"] = rows[:, 5]
+    return table
+
+
+def ingest(root: Path, max_workers: Optional[int] = None) -> PapiTable:
+    """Loads every papi_hl_output rank file under `root`."""
+    root = Path(root)
+    return load_rank_files(root, find_rank_files(root), max_workers)
+
+
+class PapiStore:
+    """Columnar store of a data tree that is kept up to date incrementally.
+
+    The store is a directory of parts, each a `PapiTable` of the rank files
+    parsed by one `refresh`, and a manifest with the size, mtime, content
+    hash, part and index in the part of every rank file. Only new rank
+    files and rank files whose content changed are parsed again. The copy
+    of a changed or removed file in an older part stays in that part, but
+    it is dropped when loading since the manifest no longer points at it.
+    """
+
+    def __init__(self, store_dir: Path):
+        self._store_dir = Path(store_dir)
+        self._store_dir.mkdir(parents=True, exist_ok=True)
+        self._manifest_path = self._store_dir / _manifest_file_name
+        self._manifest = {"version": _version, "parts": {}, "files": {}}
+        if self._manifest_path.exists():
+            self._manifest = json.loads(self._manifest_path.read_text())
+            if self._manifest.get("version") != _version:
+                raise ValueError(
+                    f"{self._manifest_path} is from an incompatible version "
+                    "of the PAPI counter store."
+                )
+
+    def _save_manifest(self):
+        tmp_path = self._manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self._manifest, indent=2))
+        os.replace(tmp_path, self._manifest_path)
+
+    def num_files(self) -> int:
+        return len(self._manifest["files"])
+
+    def num_dead_files(self) -> int:
+        """Number of files in the parts the manifest no longer points at."""
+        return sum(self._manifest["parts"].values()) - self.num_files()
+
+    def _next_part_name(self) -> str:
+        numbers = [
+            int(name[len("part-") : -len(".npz")])
+            for name in self._manifest["parts"]
+        ]
+        return f"part-{max(numbers, default=-1) + 1:05d}.npz"
+
+    def refresh(
+        self, root: Path, max_workers: Optional[int] = None
+    ) -> List[str]:
+        """Parses the rank files under `root` that are new or changed since
+        the last refresh and forgets the ones that were removed.
+
+        The content of a file is only hashed if its size or mtime changed.
+        Returns the paths, relative to `root`, of the files that were
+        parsed.
+        """
+        root = Path(root)
+        files = self._manifest["files"]
+        current = set()
+        to_parse = []
+        for path in find_rank_files(root):
+            name = str(path.relative_to(root))
+            current.add(name)
+            stat = path.stat()
+            entry = files.get(name)
+            if (
+                entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns
+            ):
+                continue
+            digest = hash_file(path)
+            if entry is not None and entry["sha256"] == digest:
+                entry["size"] = stat.st_size
+                entry["mtime_ns"] = stat.st_mtime_ns
+                continue
+            to_parse.append((path, name, stat, digest))
+        removed = [name for name in files if name not in current]
+        for name in removed:
+            del files[name]
+
+        if len(to_parse) > 0:
+            table = load_rank_files(
+                root, [path for path, _, _, _ in to_parse], max_workers
+            )
+            part_name = self._next_part_name()
+            table.save(self._store_dir / part_name)
+            self._manifest["parts"][part_name] = table.num_files()
+            for index, (_, name, stat, digest) in enumerate(to_parse):
+                files[name] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "sha256": digest,
+                    "part": part_name,
+                    "index": index,
+                }
+        self._save_manifest()
+        return [name for _, name, _, _ in to_parse]
+
+    def _load_part(self, part_name: str) -> PapiTable:
+        table = PapiTable.load(self._store_dir / part_name)
+        files = self._manifest["files"]
+        keep = np.array(
+            [
+                files.get(name, {}).get("part") == part_name
+                and files[name]["index"] == index
+                for index, name in enumerate(table.paths())
+            ],
+            dtype=bool,
+        )
+        return table if keep.all() else table.take_files(keep)
+
+    def load(self) -> PapiTable:
+        """Returns the current files of every part as one table."""
+        return PapiTable.concat(
+            self._load_part(part_name) for part_name in self._manifest["parts"]
+        )
+
+    def compact(self):
+        """Rewrites the store as a single part without dead files."""
+        table = self.load()
+        part_name = self._next_part_name()
+        table.save(self._store_dir / part_name)
+        old_parts = list(self._manifest["parts"])
+        files = self._manifest["files"]
+        for index, name in enumerate(table.paths()):
+            files[name]["part"] = part_name
+            files[name]["index"] = index
+        self._manifest["parts"] = {part_name: table.num_files()}
+        self._save_manifest()
+        for old_part in old_parts:
+            (self._store_dir / old_part).unlink(missing_ok=True)
+
+    def __str__(self) -> str:
+        return (
+            f"PapiStore({self._store_dir}, files: {self.num_files()}, "
+            f"parts: {len(self._manifest['parts'])})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+def get_inputs():
+    parser = argparse.ArgumentParser(
+        description="Load the papi_hl_output rank files of a data tree into "
+        "a columnar store, parsing only files that are new or changed."
+    )
+    parser.add_argument("root", type=str, help="Root of the data tree.")
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="Directory of the store. Defaults to root/papi_store.",
+    )
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Rewrite the store as a single part after refreshing it.",
+    )
+
+    args = parser.parse_args()
+    root = Path(args.root)
+    store_dir = Path(args.store) if args.store else root / "papi_store"
+    return root, store_dir, args.jobs, args.compact
+
+
+if __name__ == "__main__":
+    root, store_dir, jobs, compact = get_inputs()
+    store = PapiStore(store_dir)
+    parsed = store.refresh(root, jobs)
+    if compact:
+        store.compact()
+    print(f"Parsed {len(parsed)} rank files. {store}")
@@ -0,0 +1,362 @@
+import argparse
+import json
+import re
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .stats_dumps import StatsDumpReader, parse_stats_dump
+
+# Alternatives for the committed instructions of a core, most preferred
+# first. The first group is the core, so that only one of them is counted
+# for a core that has several.
+_default_insts_patterns = [
+    r"^(.*)\.commitStats0\.numInsts$",
+    r"^(.*)\.committedInsts$",
+]
+_default_cycles_pattern = r"\.numCycles$"
+_default_miss_patterns = {
+    "l1d": r"l1d.*\.demandMisses::total$",
+    "l1i": r"l1i.*\.demandMisses::total$",
+    "l2": r"l2.*\.demandMisses::total$",
+}
+_default_inst_mix_pattern = r"committedInstType::(\w+)$"
+
+
+class IntervalFeatures:
+    """Per-interval feature vectors built from consecutive stats dumps.
+
+    Stats are not reset between sampled dumps, so interval `i` is the
+    difference between dump `i` and dump `i - 1`. The first interval is
+    measured from the stats reset at the start of the ROI.
+
+    `ticks` are the absolute ticks of the dumps and `roi_begin_tick` is the
+    tick of the stats reset at the start of the ROI.
+    """
+
+    def __init__(
+        self,
+        dump_ids: List[int],
+        ticks: List[int],
+        insts: "np.ndarray",
+        feature_names: List[str],
+        features: "np.ndarray",
+        roi_begin_tick: int = 0,
+    ):
+        self._dump_ids = dump_ids
+        self._ticks = ticks
+        self._roi_begin_tick = roi_begin_tick
+        self._insts = insts
+        self._feature_names = feature_names
+        self._features = features
+
+    def dump_ids(self) -> List[int]:
+        return self._dump_ids
+
+    def ticks(self) -> List[int]:
+        return self._ticks
+
+    def roi_begin_tick(self) -> int:
+        return self._roi_begin_tick
+
+    def insts(self) -> "np.ndarray":
+        return self._insts
+
+    def feature_names(self) -> List[str]:
+        return self._feature_names
+
+    def features(self) -> "np.ndarray":
+        return self._features
+
+    def __len__(self) -> int:
+        return len(self._dump_ids)
+
+
+def _sum_matching(stats: Dict[str, float], pattern: re.Pattern) -> float:
+    return sum(value for name, value in stats.items() if pattern.search(name))
+
+
+def _sum_per_core(stats: Dict[str, float], patterns: List[re.Pattern]):
+    values = {}
+    for name, value in stats.items():
+        for priority, pattern in enumerate(patterns):
+            if (match := pattern.search(name)) is not None:
+                core = match.group(1)
+                if core not in values or priority < values[core][0]:
+                    values[core] = (priority, value)
+                break
+    return sum(value for _, value in values.values())
+
+
+def build_interval_features(
+    outdir: Path,
+    insts_patterns: Optional[List[str]] = None,
+    cycles_pattern: str = _default_cycles_pattern,
+    miss_patterns: Optional[Dict[str, str]] = None,
+    inst_mix_pattern: str = _default_inst_mix_pattern,
+) -> IntervalFeatures:
+    if insts_patterns is None:
+        insts_patterns = _default_insts_patterns
+    if miss_patterns is None:
+        miss_patterns = _default_miss_patterns
+    insts_regexes = [re.compile(pattern) for pattern in insts_patterns]
+    cycles_regex = re.compile(cycles_pattern)
+    miss_regexes = {
+        name: re.compile(pattern) for name, pattern in miss_patterns.items()
+    }
+    inst_mix_regex = re.compile(inst_mix_pattern)
+
+    dump_ids = []
+    ticks = []
+    roi_begin_tick = None
+    counters = []
+    inst_classes = {}
+    with StatsDumpReader(outdir) as reader:
+        # Earlier runs in the same outdir restarted the stats, so only the
+        # dumps of the latest run are differenced.
+        dumps = reader.dumps(reader.latest_run())
+        for dump in sorted(dumps, key=lambda dump: dump.dump_id()):
+            stats = parse_stats_dump(reader.get_dump(dump.dump_id()))
+            inst_mix = {}
+            for name, value in stats.items():
+                if (match := inst_mix_regex.search(name)) is not None:
+                    inst_class = match.group(1)
+                    if inst_class not in inst_classes:
+                        inst_classes[inst_class] = len(inst_classes)
+                    inst_mix[inst_class] = inst_mix.get(inst_class, 0) + value
+            if roi_begin_tick is None:
+                # simTicks counts the ticks since the stats reset at the
+                # start of the ROI.
+                if "simTicks" not in stats:
+                    raise ValueError(
+                        f"Dump {dump.dump_id()} in {outdir} has no simTicks "
+                        "to find the start of the ROI with."
+                    )
+                roi_begin_tick = dump.tick() - int(stats["simTicks"])
+            dump_ids.append(dump.dump_id())
+            ticks.append(dump.tick())
+            counters.append(
+                (
+                    _sum_per_core(stats, insts_regexes),
+                    _sum_matching(stats, cycles_regex),
+                    [
+                        _sum_matching(stats, regex)
+                        for regex in miss_regexes.values()
+                    ],
+                    inst_mix,
+                )
+            )
+    if len(dump_ids) == 0:
+        raise ValueError(f"There are no stats dumps in {outdir}.")
+
+    num_misses = len(miss_regexes)
+    cumulative = np.zeros((len(counters), 2 + num_misses + len(inst_classes)))
+    for row, (insts, cycles, misses, inst_mix) in enumerate(counters):
+        cumulative[row, 0] = insts
+        cumulative[row, 1] = cycles
+        cumulative[row, 2 : 2 + num_misses] = misses
+        for inst_class, value in inst_mix.items():
+            cumulative[row, 2 + num_misses + inst_classes[inst_class]] = value
+    deltas = np.diff(cumulative, axis=0, prepend=0)
+
+    insts = deltas[:, 0]
+    safe_insts = np.where(insts > 0, insts, 1)
+    ipc = insts / np.where(deltas[:, 1] > 0, deltas[:, 1], 1)
+    mpki = deltas[:, 2 : 2 + num_misses] * 1000 / safe_insts[:, None]
+    inst_mix = deltas[:, 2 + num_misses :] / safe_insts[:, None]
+
+    feature_names = (
+        ["ipc"]
+        + [f"{name}_mpki" for name in miss_regexes.keys()]
+        + [f"mix_{inst_class}" for inst_class in inst_classes.keys()]
+    )
+    features = np.column_stack([ipc, mpki, inst_mix])
+    return IntervalFeatures(
+        dump_ids, ticks, insts, feature_names, features, roi_begin_tick
+    )
+
+
+def _normalize(features: "np.ndarray") -> "np.ndarray":
+    std = features.std(axis=0)
+    return (features - features.mean(axis=0)) / np.where(std > 0, std, 1)
+
+
+def kmeans(
+    points: "np.ndarray",
+    k: int,
+    rng: "np.random.Generator",
+    max_iterations: int = 100,
+):
+    # k-means++ seeding.
+    centroids = np.empty((k, points.shape[1]))
+    centroids[0] = points[rng.integers(len(points))]
+    distances = ((points - centroids[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = distances.sum()
+        if total == 0:
+            centroids[i:] = centroids[0]
+            break
+        centroids[i] = points[rng.choice(len(points), p=distances / total)]
+        distances = np.minimum(
+            distances, ((points - centroids[i]) ** 2).sum(axis=1)
+        )
+
+    assignments = None
+    for _ in range(max_iterations):
+        all_distances = (
+            (points[:, None, :] - centroids[None, :, :]) ** 2
+        ).sum(axis=2)
+        new_assignments = all_distances.argmin(axis=1)
+        if assignments is not None and np.array_equal(
+            assignments, new_assignments
+        ):
+            break
+        assignments = new_assignments
+        for i in range(k):
+            members = points[assignments == i]
+            if len(members) > 0:
+                centroids[i] = members.mean(axis=0)
+    sse = ((points - centroids[assignments]) ** 2).sum()
+    return centroids, assignments, sse
+
+
+def _bic(points: "np.ndarray", assignments: "np.ndarray", sse: float, k):
+    # The BIC score used by SimPoint to pick the number of clusters.
+    num_points, num_dims = points.shape
+    if num_points <= k:
+        return -np.inf
+    variance = max(sse / (num_points - k), 1e-12)
+    log_likelihood = 0.0
+    for i in range(k):
+        size = np.count_nonzero(assignments == i)
+        if size == 0:
+            continue
+        log_likelihood += (
+            size * np.log(size)
+            - size * np.log(num_points)
+            - size * np.log(2 * np.pi) / 2
+            - size * num_dims * np.log(variance) / 2
+            - (size - k) / 2
+        )
+    num_parameters = k * (num_dims + 1)
+    return log_likelihood - num_parameters * np.log(num_points) / 2
+
+
+def select_phases(
+    intervals: IntervalFeatures,
+    max_k: int = 10,
+    bic_threshold: float = 0.9,
+    num_seeds: int = 5,
+    seed: int = 0,
+) -> List[Dict]:
+    """Cluster the intervals and pick one representative per cluster.
+
+    Like SimPoint, every k up to `max_k` is tried with `num_seeds` random
+    seeds and the smallest k whose BIC score reaches `bic_threshold` of the
+    range of scores is chosen. The representative of a cluster is the
+    interval closest to its centroid and its weight is the fraction of the
+    ROI's instructions that fall in the cluster.
+
+    The ticks and instructions of a phase are counted from the start of the
+    ROI, so a phase's `start_tick` or `start_insts` can be passed as is in
+    the `checkpoint_ticks` or `checkpoint_insts` of the wrappers.
+    """
+    points = _normalize(intervals.features())
+    rng = np.random.default_rng(seed)
+    max_k = min(max_k, len(points))
+
+    results = []
+    for k in range(1, max_k + 1):
+        best = None
+        for _ in range(num_seeds):
+            centroids, assignments, sse = kmeans(points, k, rng)
+            if best is None or sse < best[2]:
+                best = (centroids, assignments, sse)
+        results.append((k, *best, _bic(points, best[1], best[2], k)))
+
+    scores = np.array([result[-1] for result in results])
+    finite_scores = scores[np.isfinite(scores)]
+    chosen = results[-1]
+    if len(finite_scores) > 0:
+        low, high = finite_scores.min(), finite_scores.max()
+        for result in results:
+            if result[-1] >= low + bic_threshold * (high - low):
+                chosen = result
+                break
+    k, centroids, assignments, _, _ = chosen
+
+    insts = intervals.insts()
+    roi_begin_tick = intervals.roi_begin_tick()
+    weights_base = insts if insts.sum() > 0 else np.ones(len(points))
+    cumulative_insts = np.cumsum(insts)
+    phases = []
+    for cluster in range(k):
+        members = np.flatnonzero(assignments == cluster)
+        if len(members) == 0:
+            continue
+        distances = ((points[members] - centroids[cluster]) ** 2).sum(axis=1)
+        interval = int(members[distances.argmin()])
+        phases.append(
+            {
+                "cluster": cluster,
+                "interval": interval,
+                "dump_id": intervals.dump_ids()[interval],
+                "start_tick": (
+                    intervals.ticks()[interval - 1] - roi_begin_tick
+                    if interval > 0
+                    else 0
+                ),
+                "end_tick": intervals.ticks()[interval] - roi_begin_tick,
+                "start_insts": int(
+                    cumulative_insts[interval] - insts[interval]
+                ),
+                "end_insts": int(cumulative_insts[interval]),
+                "num_intervals": len(members),
+                "weight": float(
+                    weights_base[members].sum() / weights_base.sum()
+                ),
+            }
+        )
+    return sorted(phases, key=lambda phase: phase["interval"])
+
+
+def get_inputs():
+    parser = argparse.ArgumentParser(
+        description="Pick representative ROI intervals from sampled stats."
+    )
+    parser.add_argument(
+        "outdir", type=str, help="gem5 outdir with the sampled stats dumps."
+    )
+    parser.add_argument("--max-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Path to write the phases to. Defaults to outdir/phases.json.",
+    )
+
+    args = parser.parse_args()
+    outdir = Path(args.outdir)
+    output = Path(args.output) if args.output else outdir / "phases.json"
+    return outdir, args.max_k, args.seed, output
+
+
+if __name__ == "__main__":
+    outdir, max_k, seed, output = get_inputs()
+    intervals = build_interval_features(outdir)
+    phases = select_phases(intervals, max_k=max_k, seed=seed)
+    with open(output, "w") as phases_file:
+        json.dump(
+            {"feature_names": intervals.feature_names(), "phases": phases},
+            phases_file,
+            indent=2,
+        )
+    for phase in phases:
+        print(
+            f"interval {phase['interval']} (dump {phase['dump_id']}): "
+            f"weight {phase['weight']:.3f}, "
+            f"insts [{phase['start_insts']}, {phase['end_insts']})"
+        )
@@ -0,0 +1,341 @@
+import bisect
+import struct
+import sys
+
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_magic = b"PMAP"
+_version = 1
+_header_format = "<4sIII"
+_rank_header_format = "<qqQ"
+
+PERM_READ = 1
+PERM_WRITE = 2
+PERM_EXEC = 4
+PERM_SHARED = 8
+
+
+def _perms_to_flags(perms: str) -> int:
+    flags = 0
+    if perms[0] == "r":
+        flags |= PERM_READ
+    if perms[1] == "w":
+        flags |= PERM_WRITE
+    if perms[2] == "x":
+        flags |= PERM_EXEC
+    if perms[3] == "s":
+        flags |= PERM_SHARED
+    return flags
+
+
+def _flags_to_perms(flags: int) -> str:
+    return (
+        ("r" if flags & PERM_READ else "-")
+        + ("w" if flags & PERM_WRITE else "-")
+        + ("x" if flags & PERM_EXEC else "-")
+        + ("s" if flags & PERM_SHARED else "p")
+    )
+
+
+class Mapping:
+    def __init__(
+        self, start: int, end: int, offset: int, perms: str, path: str
+    ):
+        self._start = start
+        self._end = end
+        self._offset = offset
+        self._perms = perms
+        self._path = path
+
+    def start(self) -> int:
+        return self._start
+
+    def end(self) -> int:
+        return self._end
+
+    def offset(self) -> int:
+        return self._offset
+
+    def perms(self) -> str:
+        return self._perms
+
+    def path(self) -> str:
+        return self._path
+
+    def __str__(self) -> str:
+        return (
+            f"Mapping({hex(self._start)}-{hex(self._end)}, "
+            f"perms: {self._perms}, offset: {hex(self._offset)}, "
+            f"path: {self._path})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+class RankMaps:
+    """Mappings of one rank stored as flat arrays sorted by start address.
+
+    `path_ids` index into the path table of the `ProcessMaps` the rank
+    belongs to and are -1 for anonymous mappings.
+    """
+
+    def __init__(
+        self,
+        pid: int,
+        rank: int,
+        paths: List[str],
+        starts: array,
+        ends: array,
+        offsets: array,
+        perms: array,
+        path_ids: array,
+    ):
+        self._pid = pid
+        self._rank = rank
+        self._paths = paths
+        self._starts = starts
+        self._ends = ends
+        self._offsets = offsets
+        self._perms = perms
+        self._path_ids = path_ids
+
+    def pid(self) -> int:
+        return self._pid
+
+    def rank(self) -> int:
+        return self._rank
+
+    def mapping(self, index: int) -> Mapping:
+        path_id = self._path_ids[index]
+        return Mapping(
+            self._starts[index],
+            self._ends[index],
+            self._offsets[index],
+            _flags_to_perms(self._perms[index]),
+            self._paths[path_id] if path_id >= 0 else "",
+        )
+
+    def mappings(self) -> List[Mapping]:
+        return [self.mapping(index) for index in range(len(self))]
+
+    def columns(self) -> List[array]:
+        return [
+            self._starts,
+            self._ends,
+            self._offsets,
+            self._perms,
+            self._path_ids,
+        ]
+
+    def load_base(self, binary_name: str) -> Optional[int]:
+        """Returns the address the binary named `binary_name` was loaded at,
+        i.e. the start of its lowest mapping minus that mapping's offset."""
+        for index in range(len(self)):
+            path_id = self._path_ids[index]
+            if path_id >= 0 and Path(self._paths[path_id]).name == binary_name:
+                return self._starts[index] - self._offsets[index]
+        return None
+
+    def find(self, address: int) -> Optional[Mapping]:
+        """Returns the mapping that contains `address`, if any."""
+        index = bisect.bisect_right(self._starts, address) - 1
+        if index >= 0 and address < self._ends[index]:
+            return self.mapping(index)
+        return None
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __str__(self) -> str:
+        return (
+            f"RankMaps(pid: {self._pid}, rank: {self._rank}, "
+            f"mappings: {len(self)})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+class ProcessMaps:
+    def __init__(self, paths: List[str], ranks: List[RankMaps]):
+        self._paths = paths
+        self._ranks = ranks
+        self._by_pid = {rank_maps.pid(): rank_maps for rank_maps in ranks}
+        self._by_rank = {rank_maps.rank(): rank_maps for rank_maps in ranks}
+
+    def paths(self) -> List[str]:
+        return self._paths
+
+    def ranks(self) -> List[RankMaps]:
+        return self._ranks
+
+    def get_pid(self, pid: int) -> RankMaps:
+        return self._by_pid[pid]
+
+    def get_rank(self, rank: int) -> RankMaps:
+        return self._by_rank[rank]
+
+    def load_base(self, binary_name: str) -> Optional[int]:
+        """Returns the load base of `binary_name`, which has to be the same
+        for every rank that mapped it."""
+        load_bases = {
+            rank_maps.load_base(binary_name) for rank_maps in self._ranks
+        } - {None}
+        if len(load_bases) > 1:
+            raise ValueError(
+                f"{binary_name} is loaded at different addresses in different "
+                f"ranks: {[hex(base) for base in sorted(load_bases)]}."
+            )
+        return load_bases.pop() if len(load_bases) == 1 else None
+
+    def __str__(self) -> str:
+        return f"ProcessMaps(ranks: {self._ranks})"
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+def _parse_maps(
+    lines: List[str], paths: List[str], path_ids: Dict[str, int]
+) -> List[tuple]:
+    entries = []
+    for line in lines:
+        tokens = line.split(None, 5)
+        if len(tokens) < 5 or "-" not in tokens[0]:
+            continue
+        start, end = tokens[0].split("-")
+        path = tokens[5].strip() if len(tokens) == 6 else ""
+        if path == "":
+            path_id = -1
+        else:
+            if path not in path_ids:
+                path_ids[path] = len(paths)
+                paths.append(path)
+            path_id = path_ids[path]
+        entries.append(
+            (
+                int(start, 16),
+                int(end, 16),
+                int(tokens[2], 16),
+                _perms_to_flags(tokens[1]),
+                path_id,
+            )
+        )
+    return sorted(entries)
+
+
+def _make_rank_maps(pid, rank, paths, entries) -> RankMaps:
+    return RankMaps(
+        pid,
+        rank,
+        paths,
+        array("Q", [entry[0] for entry in entries]),
+        array("Q", [entry[1] for entry in entries]),
+        array("Q", [entry[2] for entry in entries]),
+        array("B", [entry[3] for entry in entries]),
+        array("i", [entry[4] for entry in entries]),
+    )
+
+
+def build_process_maps(process_info_path: Path) -> ProcessMaps:
+    """Builds the maps of every rank from a process_info.txt.
+
+    Every rank's maps start with a `PID: <pid>` line, optionally followed by
+    `RANK: <rank>` on the same line. If any rank is missing, the ranks are
+    numbered in the order they appear instead.
+    """
+    sections = []
+    with open(process_info_path, "r", errors="replace") as process_info:
+        for line in process_info:
+            if line.startswith("PID: "):
+                tokens = line.split()
+                rank = (
+                    int(tokens[3])
+                    if len(tokens) >= 4 and tokens[2] == "RANK:"
+                    else -1
+                )
+                sections.append((int(tokens[1]), rank, []))
+            elif len(sections) > 0:
+                sections[-1][2].append(line)
+
+    paths = []
+    path_ids = {}
+    ranks = []
+    has_ranks = all(rank >= 0 for _, rank, _ in sections)
+    for index, (pid, rank, lines) in enumerate(sections):
+        entries = _parse_maps(lines, paths, path_ids)
+        ranks.append(
+            _make_rank_maps(pid, rank if has_ranks else index, paths, entries)
+        )
+    return ProcessMaps(paths, ranks)
+
+
+def write_process_maps(process_maps: ProcessMaps, path: Path):
+    with open(path, "wb") as output:
+        output.write(
+            struct.pack(
+                _header_format,
+                _magic,
+                _version,
+                len(process_maps.ranks()),
+                len(process_maps.paths()),
+            )
+        )
+        for map_path in process_maps.paths():
+            encoded = map_path.encode()
+            output.write(struct.pack("<I", len(encoded)))
+            output.write(encoded)
+        for rank_maps in process_maps.ranks():
+            output.write(
+                struct.pack(
+                    _rank_header_format,
+                    rank_maps.pid(),
+                    rank_maps.rank(),
+                    len(rank_maps),
+                )
+            )
+            for column in rank_maps.columns():
+                # The columns are little-endian like the headers.
+                if sys.byteorder != "little":
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                column.tofile(output)
+
+
+def read_process_maps(path: Path) -> ProcessMaps:
+    with open(path, "rb") as binary:
+        data = binary.read()
+    magic, version, num_ranks, num_paths = struct.unpack_from(
+        _header_format, data
+    )
+    if magic != _magic or version != _version:
+        raise ValueError(f"{path} is not a process maps file.")
+    position = struct.calcsize(_header_format)
+
+    paths = []
+    for _ in range(num_paths):
+        (length,) = struct.unpack_from("<I", data, position)
+        position += 4
+        paths.append(data[position : position + length].decode())
+        position += length
+
+    ranks = []
+    for _ in range(num_ranks):
+        pid, rank, num_mappings = struct.unpack_from(
+            _rank_header_format, data, position
+        )
+        position += struct.calcsize(_rank_header_format)
+        columns = []
+        for typecode in ["Q", "Q", "Q", "B", "i"]:
+            column = array(typecode)
+            size = column.itemsize * num_mappings
+            column.frombytes(data[position : position + size])
+            if sys.byteorder != "little":
+                column.byteswap()
+            position += size
+            columns.append(column)
+        ranks.append(RankMaps(pid, rank, paths, *columns))
+    return ProcessMaps(paths, ranks)
@@ -0,0 +1,206 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import warnings
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+from .file_hash import hash_file
+
+_manifest_file_name = "manifest.json"
+_lock_file_name = "lock"
+_default_result_patterns = [
+    "stats.txt",
+    "stats_dump_*.txt",
+    "stats_dump_index.txt",
+    "process_info.txt",
+    "process_maps.bin",
+    "pc_lookup.bin",
+    # The chunks of an NPZStatsSink, wherever it is put in the outdir.
+    "**/chunk_*.npz",
+    "**/stat_names.txt",
+]
+
+
+def result_key(
+    workload,
+    board_config: str,
+    binary_path: Optional[Path] = None,
+    cmdline: Optional[str] = None,
+) -> str:
+    """Key of the results of simulating `workload` on a board.
+
+    The key combines the workload's id string, the runscript the run uses,
+    the board configuration and the content of the workload's binary if
+    `binary_path` points to a host copy of it. Without `binary_path` only
+    the binary's name in the runscript is part of the key.
+
+    `cmdline` is the runscript the run uses. It defaults to the runscript
+    `workload.generate_cmdline()` generates with its default options.
+    """
+    if cmdline is None:
+        cmdline = workload.generate_cmdline()
+    digest = hashlib.sha256()
+    digest.update(workload.generate_id_string().encode())
+    digest.update(b"\0")
+    digest.update(hashlib.sha256(cmdline.encode()).digest())
+    digest.update(b"\0")
+    digest.update(board_config.encode())
+    if binary_path is not None:
+        digest.update(b"\0")
+        digest.update(hash_file(binary_path).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Keeps the results of finished simulations by `result_key`.
+
+    Every entry is a directory with a copy of the files in the run's outdir
+    that match `result_patterns`, at the same path relative to the outdir.
+    The entries are evicted in least recently used order once they take more
+    than `max_bytes` in total, and results larger than that are not stored.
+
+    Several processes can share `cache_dir`, e.g. two sweeps. The manifest
+    is only read and written while holding an `flock` on the cache's lock
+    file.
+
+    The cache is used by `Sweep` and not by the wrappers: a wrapper only
+    runs once gem5 has started, too late to skip the simulation.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_bytes: int,
+        result_patterns: Optional[List[str]] = None,
+    ):
+        self._cache_dir = Path(cache_dir)
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._result_patterns = result_patterns or _default_result_patterns
+        self._manifest_path = self._cache_dir / _manifest_file_name
+        self._lock_path = self._cache_dir / _lock_file_name
+        # flock does not exclude threads of the same process from each
+        # other, so they are serialized with a threading lock first.
+        self._lock = threading.Lock()
+        self._manifest = {}
+
+    def _load_manifest(self):
+        self._manifest = {}
+        if self._manifest_path.exists():
+            self._manifest = json.loads(self._manifest_path.read_text())
+
+    def _save_manifest(self):
+        tmp_path = self._manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self._manifest, indent=2))
+        os.replace(tmp_path, self._manifest_path)
+
+    @contextmanager
+    def _locked(self):
+        """Holds the cache's locks and the manifest as it is on disk."""
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._load_manifest()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _total_bytes(self) -> int:
+        return sum(entry["bytes"] for entry in self._manifest.values())
+
+    def total_bytes(self) -> int:
+        with self._locked():
+            return self._total_bytes()
+
+    def __contains__(self, key: str) -> bool:
+        with self._locked():
+            return key in self._manifest
+
+    def restore(self, key: str, outdir: Path) -> bool:
+        """Copy the results stored under `key` into `outdir`.
+
+        Returns:
+            True if there was an entry for `key`.
+        """
+        with self._locked():
+            if key not in self._manifest:
+                return False
+            entry_dir = self._cache_dir / key
+            outdir = Path(outdir)
+            outdir.mkdir(parents=True, exist_ok=True)
+            for file_name in self._manifest[key]["files"]:
+                (outdir / file_name).parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(entry_dir / file_name, outdir / file_name)
+            self._manifest[key]["last_used"] = time.time()
+            self._save_manifest()
+            return True
+
+    def store(self, key: str, outdir: Path) -> bool:
+        """Copy the results in `outdir` into the cache under `key`.
+
+        Returns:
+            False if the results take more than `max_bytes` and were not
+            stored.
+        """
+        outdir = Path(outdir)
+        files = sorted(
+            {
+                path
+                for pattern in self._result_patterns
+                for path in outdir.glob(pattern)
+                if path.is_file()
+            }
+        )
+        num_bytes = sum(path.stat().st_size for path in files)
+        if num_bytes > self._max_bytes:
+            warnings.warn(
+                f"Not caching the results in {outdir}, they take {num_bytes} "
+                f"bytes and the cache only holds {self._max_bytes}."
+            )
+            return False
+
+        # The files are copied before taking the locks, to a directory no
+        # other thread or process uses.
+        tmp_dir = (
+            self._cache_dir
+            / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        for path in files:
+            file_name = path.relative_to(outdir)
+            (tmp_dir / file_name).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, tmp_dir / file_name)
+
+        with self._locked():
+            entry_dir = self._cache_dir / key
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self._manifest[key] = {
+                "files": [
+                    path.relative_to(outdir).as_posix() for path in files
+                ],
+                "bytes": num_bytes,
+                "last_used": time.time(),
+            }
+            self._evict()
+            self._save_manifest()
+        return True
+
+    def _evict(self):
+        total_bytes = self._total_bytes()
+        for key in sorted(
+            self._manifest, key=lambda key: self._manifest[key]["last_used"]
+        ):
+            if total_bytes <= self._max_bytes:
+                break
+            total_bytes -= self._manifest[key]["bytes"]
+            shutil.rmtree(self._cache_dir / key, ignore_errors=True)
+            del self._manifest[key]
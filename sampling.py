@@ -0,0 +1,156 @@
+from .stats_dumps import StatsDump, parse_stats_dump, read_stats_dump
+
+from pathlib import Path
+from typing import List, Optional
+
+from m5 import options as m5_options
+from m5.util.convert import toLatency
+
+
+def to_period(seconds: float) -> str:
+    return f"{max(1, round(seconds * 1e12))}ps"
+
+
+class SamplingScheduler:
+    """Decides how long to simulate before the next stats dump.
+
+    `next_period` is called with `None` for the first period after the ROI
+    begins and with the dump that was just taken for every period after
+    that. `current_period` returns the last period without advancing.
+    """
+
+    def next_period(self, dump: Optional[StatsDump]) -> str:
+        raise NotImplementedError
+
+    def current_period(self) -> str:
+        raise NotImplementedError
+
+
+class FixedSamplingScheduler(SamplingScheduler):
+    def __init__(self, period: str):
+        self._period = period
+
+    def next_period(self, dump: Optional[StatsDump]) -> str:
+        return self._period
+
+    def current_period(self) -> str:
+        return self._period
+
+
+class GeometricWarmupSamplingScheduler(SamplingScheduler):
+    """Starts at `initial_period` and multiplies it by `factor` after every
+    dump until it reaches `final_period`."""
+
+    def __init__(
+        self, initial_period: str, final_period: str, factor: float = 2.0
+    ):
+        if factor <= 1:
+            raise ValueError("`factor` should be larger than 1.")
+        self._period = toLatency(initial_period)
+        self._final_period = toLatency(final_period)
+        if self._period > self._final_period:
+            raise ValueError(
+                "`initial_period` should not be longer than `final_period`."
+            )
+        self._factor = factor
+
+    def next_period(self, dump: Optional[StatsDump]) -> str:
+        if dump is not None:
+            self._period = min(self._period * self._factor, self._final_period)
+        return to_period(self._period)
+
+    def current_period(self) -> str:
+        return to_period(self._period)
+
+
+class PhaseAdaptiveSamplingScheduler(SamplingScheduler):
+    """Shrinks the period when `stat_names` change quickly and grows it when
+    they are stable.
+
+    `stat_names` should be counters that keep accumulating across dumps,
+    e.g. committed instructions or cache misses. After every dump their rate
+    per tick over the last period is compared with the rate over the period
+    before. If the largest relative change is above `shrink_threshold` the
+    period is divided by `factor`, if it is below `grow_threshold` the period
+    is multiplied by `factor`, always staying within
+    [`min_period`, `max_period`].
+    """
+
+    def __init__(
+        self,
+        initial_period: str,
+        min_period: str,
+        max_period: str,
+        stat_names: List[str],
+        shrink_threshold: float = 0.1,
+        grow_threshold: float = 0.02,
+        factor: float = 2.0,
+        stats_path: Optional[Path] = None,
+    ):
+        if len(stat_names) == 0:
+            raise ValueError("`stat_names` should not be empty.")
+        if factor <= 1:
+            raise ValueError("`factor` should be larger than 1.")
+        if grow_threshold > shrink_threshold:
+            raise ValueError(
+                "`grow_threshold` should not be larger than "
+                "`shrink_threshold`."
+            )
+        self._period = toLatency(initial_period)
+        self._min_period = toLatency(min_period)
+        self._max_period = toLatency(max_period)
+        if not self._min_period <= self._period <= self._max_period:
+            raise ValueError(
+                "`initial_period` should be between `min_period` and "
+                "`max_period`."
+            )
+        self._stat_names = stat_names
+        self._shrink_threshold = shrink_threshold
+        self._grow_threshold = grow_threshold
+        self._factor = factor
+        self._stats_path = stats_path
+
+        self._last_tick = None
+        self._last_values = None
+        self._last_rates = None
+
+    def _read_values(self, dump: StatsDump) -> List[float]:
+        if self._stats_path is None:
+            self._stats_path = Path(m5_options.outdir) / "stats.txt"
+        stats = parse_stats_dump(read_stats_dump(self._stats_path, dump))
+        return [stats.get(name, 0.0) for name in self._stat_names]
+
+    def next_period(self, dump: Optional[StatsDump]) -> str:
+        if dump is None:
+            return to_period(self._period)
+
+        values = self._read_values(dump)
+        rates = None
+        if self._last_values is not None and dump.tick() > self._last_tick:
+            ticks = dump.tick() - self._last_tick
+            rates = [
+                (value - last_value) / ticks
+                for value, last_value in zip(values, self._last_values)
+            ]
+        if rates is not None and self._last_rates is not None:
+            change = max(
+                abs(rate - last_rate) / max(abs(last_rate), 1e-12)
+                for rate, last_rate in zip(rates, self._last_rates)
+            )
+            if change > self._shrink_threshold:
+                self._period = max(
+                    self._period / self._factor, self._min_period
+                )
+            elif change < self._grow_threshold:
+                self._period = min(
+                    self._period * self._factor, self._max_period
+                )
+
+        self._last_tick = dump.tick()
+        self._last_values = values
+        if rates is not None:
+            self._last_rates = rates
+        return to_period(self._period)
+
+    def current_period(self) -> str:
+        return to_period(self._period)
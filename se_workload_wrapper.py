@@ -1,4 +1,5 @@
-import struct
+from .elf_info import get_elf_info
+
 import platform
 
 from pathlib import Path
@@ -33,50 +34,14 @@ class SEWorkloadWrapper:
             },
         )
 
+    def _elf_info(self):
+        return get_elf_info(self._binary_path)
+
     def _dynamically_linked(self):
-        with open(self._binary_path, "rb") as binary:
-            if binary.read(4) != b"\x7fELF":
-                raise ValueError(f"{self._binary_path} is not an ELF binary")
-
-            binary.seek(4)
-            ei_class = binary.read(1)
-            is_64 = ei_class == b"\x02"
-
-            binary.seek(0x20 if is_64 else 0x1C)
-            e_phoff = struct.unpack(
-                "<Q" if is_64 else "<I", binary.read(8 if is_64 else 4)
-            )[0]
-
-            binary.seek(0x36 if is_64 else 0x2A)
-            e_phentsize = struct.unpack("<H", binary.read(2))[0]
-            e_phnum = struct.unpack("<H", binary.read(2))[0]
-
-            for i in range(e_phnum):
-                binary.seek(e_phoff + i * e_phentsize)
-                p_type = struct.unpack("<I", binary.read(4))[0]
-                if p_type == 3:
-                    return True
-            return False
+        return self._elf_info().is_dynamically_linked()
 
     def _get_architecture(self):
-        with open(self._binary_path, "rb") as binary:
-            if binary.read(4) != b"\x7fELF":
-                raise ValueError(f"{self._binary_path} is not an ELF binary")
-
-            binary.seek(18)
-            e_machine = struct.unpack("<H", binary.read(2))[0]
-
-        # ELF e_machine mapping
-        elf_arch_map = {
-            0x03: "x86",
-            0x3E: "x86_64",
-            0x28: "arm",
-            0xB7: "aarch64",
-            0xF3: "riscv",
-            0x08: "mips",
-        }
-
-        return elf_arch_map.get(e_machine, f"unknown({e_machine})")
+        return self._elf_info().architecture()
 
     def _compatible_with_host(self):
         binary_arch = self._get_architecture()
@@ -0,0 +1,518 @@
+import mmap
+import os
+import queue
+import re
+import threading
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+_index_file_name = "stats_dump_index.txt"
+_dump_name_pattern = re.compile(r"^stats_dump_(\d+)\.txt$")
+
+
+class StatsDump:
+    @classmethod
+    def process_line(cls, line) -> Optional["StatsDump"]:
+        line_no_comment = line.split("#")[0]
+        tokens = line_no_comment.split()
+        if len(tokens) == 0:
+            return None
+        # Indexes written before runs were recorded have no run id.
+        if len(tokens) not in (4, 5):
+            raise ValueError(
+                f"Index line `{line.rstrip()}` should look like "
+                "`[dump id] [byte offset] [byte length] [tick] [run id]`."
+            )
+        return cls(*[int(token) for token in tokens])
+
+    def __init__(
+        self,
+        dump_id: int,
+        offset: int,
+        length: int,
+        tick: int,
+        run_id: int = 0,
+    ):
+        self._dump_id = dump_id
+        self._offset = offset
+        self._length = length
+        self._tick = tick
+        self._run_id = run_id
+
+    def dump_id(self) -> int:
+        return self._dump_id
+
+    def offset(self) -> int:
+        return self._offset
+
+    def length(self) -> int:
+        return self._length
+
+    def tick(self) -> int:
+        return self._tick
+
+    def run_id(self) -> int:
+        return self._run_id
+
+    def to_line(self) -> str:
+        return (
+            f"{self._dump_id} {self._offset} {self._length} {self._tick} "
+            f"{self._run_id}\n"
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"StatsDump(dump_id: {self._dump_id}, offset: {self._offset}, "
+            f"length: {self._length}, tick: {self._tick}, "
+            f"run_id: {self._run_id})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+def read_index(index_path: Path) -> List[StatsDump]:
+    dumps = []
+    if not index_path.exists():
+        return dumps
+    with open(index_path, "r") as index_file:
+        for line in index_file:
+            if (dump := StatsDump.process_line(line)) is not None:
+                dumps.append(dump)
+    return dumps
+
+
+def read_stats_dump(stats_path: Path, dump: StatsDump) -> bytes:
+    with open(stats_path, "rb") as stats_file:
+        return os.pread(stats_file.fileno(), dump.length(), dump.offset())
+
+
+def parse_stats_dump(data: Union[bytes, memoryview, str]) -> Dict[str, float]:
+    if not isinstance(data, str):
+        data = str(data, "utf-8")
+    stats = {}
+    for line in data.splitlines():
+        if len(line) == 0 or line.startswith("-"):
+            continue
+        tokens = line.split(None, 2)
+        if len(tokens) < 2:
+            continue
+        try:
+            stats[tokens[0]] = float(tokens[1])
+        except ValueError:
+            continue
+    return stats
+
+
+class StatsDumpWriter:
+    """Splits stats.txt into one `stats_dump_N.txt` file per stats dump.
+
+    Every dump is also recorded in `stats_dump_index.txt` so the dump counter
+    carries on from where a previous run in the same outdir stopped. gem5
+    truncates stats.txt when it starts, so every writer records its dumps
+    under a new run id and only the dumps of the latest run can be read back
+    from stats.txt. Call `begin_dump` right before every dump, since a dump
+    starts at the size stats.txt has then. Stats dumped by anything else,
+    e.g. `m5 dumpstats` in the guest, are then left out of the next dump.
+
+    With `copy_dumps=False` only the index is written and the dumps are read
+    back out of stats.txt through `StatsDumpReader`. If a `sink` is given,
+    every dump is also handed to its `add_dump` method (see `NPZStatsSink`).
+    Sinks also need `flush` and `close` methods.
+    """
+
+    def __init__(self, outdir: Path, copy_dumps: bool = True, sink=None):
+        self._outdir = outdir
+        self._copy_dumps = copy_dumps
+        self._sink = sink
+        self._stats_path = outdir / "stats.txt"
+        self._index_path = outdir / _index_file_name
+
+        self._run_id = 0
+        if self._index_path.exists():
+            dumps = read_index(self._index_path)
+            self._next_dump_id = dumps[-1].dump_id() + 1 if dumps else 0
+            self._run_id = dumps[-1].run_id() + 1 if dumps else 0
+        else:
+            # Outdirs written before the index existed only have the dump
+            # files themselves, so scan for them once.
+            dump_ids = [
+                int(match.group(1))
+                for f in outdir.iterdir()
+                if (match := _dump_name_pattern.fullmatch(f.name))
+            ]
+            self._next_dump_id = max(dump_ids) + 1 if dump_ids else 0
+
+        self._stats_file = None
+        self._index_file = None
+        self._offset = self._stats_size()
+
+    def stats_path(self) -> Path:
+        return self._stats_path
+
+    def index_path(self) -> Path:
+        return self._index_path
+
+    def next_dump_id(self) -> int:
+        return self._next_dump_id
+
+    def run_id(self) -> int:
+        return self._run_id
+
+    def copy_dumps(self) -> bool:
+        return self._copy_dumps
+
+    def _stats_size(self) -> int:
+        if self._stats_file is not None:
+            return os.fstat(self._stats_file.fileno()).st_size
+        try:
+            return os.path.getsize(self._stats_path)
+        except OSError:
+            return 0
+
+    def begin_dump(self):
+        """Marks the current end of stats.txt as the start of the next
+        dump."""
+        self._offset = self._stats_size()
+
+    def write_dump(self, tick: int) -> Optional[StatsDump]:
+        dump = self._take_dump(tick)
+        if dump is not None:
+            self._persist_dump(dump)
+        return dump
+
+    def _take_dump(self, tick: int) -> Optional[StatsDump]:
+        if self._stats_file is None:
+            self._stats_file = open(self._stats_path, "rb")
+        length = self._stats_size() - self._offset
+        if length <= 0:
+            return None
+
+        dump = StatsDump(
+            self._next_dump_id, self._offset, length, tick, self._run_id
+        )
+        self._offset += dump.length()
+        self._next_dump_id += 1
+        return dump
+
+    def _persist_dump(self, dump: StatsDump):
+        new_data = None
+        if self._copy_dumps or self._sink is not None:
+            new_data = os.pread(
+                self._stats_file.fileno(), dump.length(), dump.offset()
+            )
+        if self._copy_dumps:
+            with open(
+                self._outdir / f"stats_dump_{dump.dump_id()}.txt", "wb"
+            ) as dump_file:
+                dump_file.write(new_data)
+        self._append_to_index(dump)
+        if self._sink is not None:
+            self._sink.add_dump(dump, new_data)
+
+    def _append_to_index(self, dump: StatsDump):
+        if self._index_file is None:
+            self._index_file = open(self._index_path, "a")
+        self._index_file.write(dump.to_line())
+        self._index_file.flush()
+
+    def flush(self):
+        if self._sink is not None:
+            self._sink.flush()
+
+    def close(self):
+        if self._stats_file is not None:
+            self._stats_file.close()
+            self._stats_file = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+        if self._sink is not None:
+            self._sink.close()
+
+
+class AsyncStatsDumpWriter(StatsDumpWriter):
+    """A `StatsDumpWriter` that persists dumps on a background thread.
+
+    `write_dump` only records the byte range of the new dump and queues it.
+    Reading it back, writing `stats_dump_N.txt`, the index and the sink all
+    happen on the writer thread. At most `max_pending` dumps are queued
+    before `write_dump` blocks. Errors from the writer thread are raised by
+    the next call to `write_dump`, `flush` or `close`.
+    """
+
+    def __init__(
+        self,
+        outdir: Path,
+        copy_dumps: bool = True,
+        sink=None,
+        max_pending: int = 64,
+    ):
+        super().__init__(outdir, copy_dumps, sink)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name="stats-dump-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            dump = self._queue.get()
+            try:
+                if dump is None:
+                    return
+                if self._error is None:
+                    self._persist_dump(dump)
+            except Exception as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise RuntimeError(
+                "Failed to write a stats dump in the background."
+            ) from error
+
+    def write_dump(self, tick: int) -> Optional[StatsDump]:
+        self._raise_error()
+        dump = self._take_dump(tick)
+        if dump is not None:
+            self._queue.put(dump)
+        return dump
+
+    def flush(self):
+        self._queue.join()
+        self._raise_error()
+        super().flush()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        super().close()
+        self._raise_error()
+
+
+class StatsDumpReader:
+    """Gives access to the stats dumps recorded in `stats_dump_index.txt`.
+
+    Dumps that were copied to their own `stats_dump_N.txt` are read from that
+    file. Otherwise the dump is returned as a slice of a memory map of
+    stats.txt without copying it, which only works for dumps of the latest
+    run since every run overwrites stats.txt.
+    """
+
+    def __init__(self, outdir: Path):
+        self._outdir = Path(outdir)
+        self._stats_path = self._outdir / "stats.txt"
+        self._index_path = self._outdir / _index_file_name
+        self._dumps = {}
+        self._latest_run = None
+        self._stats_file = None
+        self._stats_map = None
+        self.refresh()
+
+    def refresh(self):
+        self._dumps = {
+            dump.dump_id(): dump for dump in read_index(self._index_path)
+        }
+        self._latest_run = max(
+            (dump.run_id() for dump in self._dumps.values()), default=None
+        )
+
+    def latest_run(self) -> Optional[int]:
+        return self._latest_run
+
+    def dumps(self, run_id: Optional[int] = None) -> List[StatsDump]:
+        """Returns the recorded dumps, only those of `run_id` if given."""
+        return [
+            dump
+            for dump in self._dumps.values()
+            if run_id is None or dump.run_id() == run_id
+        ]
+
+    def get_dump_info(self, dump_id: int) -> StatsDump:
+        if dump_id not in self._dumps:
+            self.refresh()
+        if dump_id not in self._dumps:
+            raise ValueError(
+                f"Dump {dump_id} is not recorded in {self._index_path}."
+            )
+        return self._dumps[dump_id]
+
+    def get_dump(self, dump_id: int) -> memoryview:
+        dump = self.get_dump_info(dump_id)
+        dump_path = self._outdir / f"stats_dump_{dump_id}.txt"
+        if dump_path.exists():
+            return memoryview(dump_path.read_bytes())
+        if dump.run_id() != self._latest_run:
+            raise ValueError(
+                f"Dump {dump_id} is from run {dump.run_id()} and was not "
+                f"copied, but {self._stats_path} was overwritten by run "
+                f"{self._latest_run}."
+            )
+
+        end = dump.offset() + dump.length()
+        stats_map = self._map_stats(end)
+        return memoryview(stats_map)[dump.offset() : end]
+
+    def get_dump_text(self, dump_id: int) -> str:
+        return str(self.get_dump(dump_id), "utf-8")
+
+    def _map_stats(self, end: int) -> mmap.mmap:
+        if self._stats_map is None or len(self._stats_map) < end:
+            if self._stats_file is None:
+                self._stats_file = open(self._stats_path, "rb")
+            # stats.txt may have grown since it was last mapped. The old map
+            # is left to the garbage collector since slices of it may still
+            # be in use.
+            self._stats_map = mmap.mmap(
+                self._stats_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        if len(self._stats_map) < end:
+            raise ValueError(
+                f"{self._stats_path} ends before byte {end}. It was probably "
+                "overwritten by a later run in the same outdir."
+            )
+        return self._stats_map
+
+    def close(self):
+        self._stats_map = None
+        if self._stats_file is not None:
+            self._stats_file.close()
+            self._stats_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class NPZStatsSink:
+    """Stores parsed stats dumps as rows of a float64 table in NPZ chunks.
+
+    The columns are fixed by `stat_names` or, if not given, by the stats in
+    the first dump. Values missing from a later dump are stored as NaN and
+    stats that are not columns are dropped. Every `chunk_size` dumps are
+    written to `chunk_K.npz` under `path` with `dump_ids`, `ticks` and
+    `values` arrays. Use `load_npz_stats` to read all chunks back.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        chunk_size: int = 256,
+        stat_names: Optional[List[str]] = None,
+    ):
+        if np is None:
+            raise RuntimeError("NPZStatsSink requires numpy.")
+        if chunk_size < 1:
+            raise ValueError("`chunk_size` should be at least 1.")
+        self._path = Path(path)
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._chunk_size = chunk_size
+
+        names_path = self._path / "stat_names.txt"
+        if names_path.exists():
+            stored_names = names_path.read_text().splitlines()
+            if stat_names is not None and stat_names != stored_names:
+                raise ValueError(
+                    f"`stat_names` does not match the names in {names_path}."
+                )
+            stat_names = stored_names
+        self._stat_names = None
+        self._columns = None
+        if stat_names is not None:
+            self._set_stat_names(stat_names)
+
+        self._next_chunk_id = len(list(self._path.glob("chunk_*.npz")))
+        self._dump_ids = []
+        self._ticks = []
+        self._values = None
+        self._num_rows = 0
+
+    def _set_stat_names(self, stat_names: List[str]):
+        self._stat_names = list(stat_names)
+        self._columns = {name: i for i, name in enumerate(self._stat_names)}
+        names_path = self._path / "stat_names.txt"
+        if not names_path.exists():
+            names_path.write_text("\n".join(self._stat_names) + "\n")
+
+    def stat_names(self) -> Optional[List[str]]:
+        return self._stat_names
+
+    def add_dump(self, dump: StatsDump, data: Union[bytes, memoryview]):
+        stats = parse_stats_dump(data)
+        if self._stat_names is None:
+            self._set_stat_names(list(stats.keys()))
+        if self._values is None:
+            self._values = np.full(
+                (self._chunk_size, len(self._stat_names)), np.nan
+            )
+
+        row = self._values[self._num_rows]
+        for name, value in stats.items():
+            if (column := self._columns.get(name)) is not None:
+                row[column] = value
+        self._dump_ids.append(dump.dump_id())
+        self._ticks.append(dump.tick())
+        self._num_rows += 1
+        if self._num_rows == self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._num_rows == 0:
+            return
+        np.savez(
+            self._path / f"chunk_{self._next_chunk_id}.npz",
+            dump_ids=np.array(self._dump_ids, dtype=np.int64),
+            ticks=np.array(self._ticks, dtype=np.int64),
+            values=self._values[: self._num_rows],
+        )
+        self._next_chunk_id += 1
+        self._dump_ids = []
+        self._ticks = []
+        self._values = None
+        self._num_rows = 0
+
+    def close(self):
+        self.flush()
+
+
+def load_npz_stats(
+    path: Path,
+) -> Tuple[List[str], "np.ndarray", "np.ndarray", "np.ndarray"]:
+    if np is None:
+        raise RuntimeError("load_npz_stats requires numpy.")
+    path = Path(path)
+    stat_names = (path / "stat_names.txt").read_text().splitlines()
+    chunk_paths = sorted(
+        path.glob("chunk_*.npz"),
+        key=lambda chunk_path: int(chunk_path.stem.split("_")[-1]),
+    )
+    if not chunk_paths:
+        return (
+            stat_names,
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty((0, len(stat_names))),
+        )
+    chunks = [np.load(chunk_path) for chunk_path in chunk_paths]
+    return (
+        stat_names,
+        np.concatenate([chunk["dump_ids"] for chunk in chunks]),
+        np.concatenate([chunk["ticks"] for chunk in chunks]),
+        np.concatenate([chunk["values"] for chunk in chunks]),
+    )
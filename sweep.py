@@ -0,0 +1,388 @@
+from .file_hash import hash_file
+from .result_cache import ResultCache, result_key
+
+import argparse
+import importlib
+import itertools
+import os
+import subprocess
+import sys
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+_done_file_name = "sweep_done"
+_log_file_name = "sweep.log"
+
+
+def expand_grid(grid: Dict[str, Sequence]) -> List[List[str]]:
+    """Expand a parameter grid into command line argument lists.
+
+    `grid` maps option names (with or without the leading `--`) to the
+    values to sweep, e.g. `{"dim-x": [16, 32], "variant": ["ref", "hov"]}`.
+    """
+    options = [
+        option if option.startswith("--") else f"--{option}"
+        for option in grid.keys()
+    ]
+    return [
+        list(
+            itertools.chain.from_iterable(
+                (option, str(value)) for option, value in zip(options, values)
+            )
+        )
+        for values in itertools.product(*grid.values())
+    ]
+
+
+def _available_memory() -> Optional[int]:
+    try:
+        with open("/proc/meminfo", "r") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError):
+        return None
+
+
+def default_num_workers(memory_per_run: Optional[int] = None) -> int:
+    num_workers = os.cpu_count() or 1
+    if memory_per_run is not None:
+        available_memory = _available_memory()
+        if available_memory is not None:
+            num_workers = min(num_workers, available_memory // memory_per_run)
+    return max(1, num_workers)
+
+
+class SweepRun:
+    def __init__(
+        self,
+        id_string: str,
+        args: List[str],
+        outdir: Path,
+        cache_key: Optional[str] = None,
+    ):
+        self._id_string = id_string
+        self._args = args
+        self._outdir = outdir
+        self._cache_key = cache_key
+
+    def id_string(self) -> str:
+        return self._id_string
+
+    def args(self) -> List[str]:
+        return self._args
+
+    def outdir(self) -> Path:
+        return self._outdir
+
+    def cache_key(self) -> Optional[str]:
+        return self._cache_key
+
+    def is_done(self) -> bool:
+        return (self._outdir / _done_file_name).exists()
+
+    def __str__(self) -> str:
+        return f"SweepRun(id: {self._id_string}, args: {self._args})"
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+class Sweep:
+    """Runs gem5 once for every point of a parameter grid of a workload.
+
+    Every point is turned into the command line arguments of
+    `wrapper_class.parse_args`, and the resulting wrapper's
+    `generate_id_string` names the run. Points with the same id are only
+    run once. Each run writes to `outdir_base/<id>` and gets a
+    `sweep_done` file there once gem5 exits successfully, which is how
+    finished runs are skipped when the sweep is resumed.
+
+    gem5 is invoked as
+    `gem5_binary [gem5_args] --outdir=<outdir> config_script [config_args]
+    [workload args]`.
+
+    This module does not import m5. The wrapper classes do, so
+    `wrapper_class` is imported by the caller, e.g. `get_inputs` imports
+    the wrapper named on the command line only once it is needed.
+
+    If a `cache` is given, runs whose results are already in it are
+    restored from it instead of simulated, and the results of new runs are
+    added to it. The board part of the key is the gem5 binary, the config
+    script and the gem5 and config arguments. The workload part is the
+    runscript generated with `cmdline_kwargs`, which have to be the options
+    the config script passes to `generate_cmdline`, and, if
+    `host_binary_dir` is given, the content of the host copy of the
+    workload's binary in it.
+    """
+
+    def __init__(
+        self,
+        wrapper_class,
+        grid: Dict[str, Sequence],
+        gem5_binary: Path,
+        config_script: Path,
+        outdir_base: Path,
+        gem5_args: Optional[List[str]] = None,
+        config_args: Optional[List[str]] = None,
+        cache: Optional[ResultCache] = None,
+        cmdline_kwargs: Optional[Dict] = None,
+        host_binary_dir: Optional[Path] = None,
+    ):
+        self._wrapper_class = wrapper_class
+        self._grid = grid
+        self._gem5_binary = Path(gem5_binary)
+        self._config_script = Path(config_script)
+        self._outdir_base = Path(outdir_base)
+        self._gem5_args = gem5_args or []
+        self._config_args = config_args or []
+        self._cache = cache
+        self._cmdline_kwargs = cmdline_kwargs or {}
+        self._host_binary_dir = (
+            Path(host_binary_dir) if host_binary_dir is not None else None
+        )
+
+    def _board_config(self) -> str:
+        return "\n".join(
+            [hash_file(self._gem5_binary), self._config_script.read_text()]
+            + self._gem5_args
+            + self._config_args
+        )
+
+    def _cache_key(self, workload, board_config: str) -> str:
+        binary_path = (
+            self._host_binary_dir / workload.get_binary_name()
+            if self._host_binary_dir is not None
+            else None
+        )
+        return result_key(
+            workload,
+            board_config,
+            binary_path,
+            workload.generate_cmdline(**self._cmdline_kwargs),
+        )
+
+    def runs(self) -> List[SweepRun]:
+        runs = {}
+        board_config = self._board_config() if self._cache else None
+        for args in expand_grid(self._grid):
+            workload = self._wrapper_class(
+                *self._wrapper_class.parse_args(args)
+            )
+            id_string = workload.generate_id_string()
+            if id_string in runs:
+                print(f"Skipping {args} since it is the same as {id_string}.")
+                continue
+            runs[id_string] = SweepRun(
+                id_string,
+                args,
+                self._outdir_base / id_string,
+                (
+                    self._cache_key(workload, board_config)
+                    if self._cache
+                    else None
+                ),
+            )
+        return list(runs.values())
+
+    def _command(self, sweep_run: SweepRun) -> List[str]:
+        return (
+            [str(self._gem5_binary)]
+            + self._gem5_args
+            + [f"--outdir={sweep_run.outdir()}", str(self._config_script)]
+            + self._config_args
+            + sweep_run.args()
+        )
+
+    def _run_one(self, sweep_run: SweepRun) -> int:
+        sweep_run.outdir().mkdir(parents=True, exist_ok=True)
+        command = self._command(sweep_run)
+        if self._cache and self._cache.restore(
+            sweep_run.cache_key(), sweep_run.outdir()
+        ):
+            print(f"Restored {sweep_run.id_string()} from the cache.")
+            (sweep_run.outdir() / _done_file_name).write_text(
+                " ".join(command) + "\n"
+            )
+            return 0
+        with open(sweep_run.outdir() / _log_file_name, "w") as log:
+            returncode = subprocess.run(
+                command, stdout=log, stderr=subprocess.STDOUT
+            ).returncode
+        if returncode == 0:
+            if self._cache:
+                self._cache.store(sweep_run.cache_key(), sweep_run.outdir())
+            (sweep_run.outdir() / _done_file_name).write_text(
+                " ".join(command) + "\n"
+            )
+        return returncode
+
+    def run(
+        self,
+        num_workers: Optional[int] = None,
+        memory_per_run: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """Run every unfinished point of the grid.
+
+        Args:
+            num_workers: Number of gem5 processes to run at the same time.
+                Defaults to the number of cores, limited by
+                `memory_per_run` if it is given.
+            memory_per_run: Expected peak memory of one gem5 run in bytes.
+
+        Returns:
+            The exit code of every run that was launched, by id string.
+        """
+        pending = []
+        for sweep_run in self.runs():
+            if sweep_run.is_done():
+                print(f"Skipping {sweep_run.id_string()}, already done.")
+            else:
+                pending.append(sweep_run)
+        if num_workers is None:
+            num_workers = default_num_workers(memory_per_run)
+        print(f"Running {len(pending)} runs on {num_workers} workers.")
+
+        returncodes = {}
+        # Every run is its own gem5 process, so threads are enough to wait
+        # on them.
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {
+                executor.submit(self._run_one, sweep_run): sweep_run
+                for sweep_run in pending
+            }
+            for future in as_completed(futures):
+                sweep_run = futures[future]
+                returncode = future.result()
+                returncodes[sweep_run.id_string()] = returncode
+                if returncode == 0:
+                    print(f"Finished {sweep_run.id_string()}.")
+                else:
+                    print(
+                        f"{sweep_run.id_string()} failed with exit code "
+                        f"{returncode}. See "
+                        f"{sweep_run.outdir() / _log_file_name}.",
+                        file=sys.stderr,
+                    )
+        return returncodes
+
+
+def _parse_value(value: str):
+    for convert in [int, float]:
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def get_inputs():
+    parser = argparse.ArgumentParser(
+        description="Run gem5 once for every point of a parameter grid of a "
+        "workload, skipping points that are already done."
+    )
+    parser.add_argument(
+        "workload",
+        type=str,
+        help="Name of the wrapper class, e.g. HPCGWrapper.",
+    )
+    parser.add_argument("gem5_binary", type=str)
+    parser.add_argument("config_script", type=str)
+    parser.add_argument("outdir_base", type=str)
+    parser.add_argument(
+        "--param",
+        type=str,
+        action="append",
+        default=[],
+        help="Swept option as name=value1,value2. Can be repeated.",
+    )
+    parser.add_argument(
+        "--gem5-arg",
+        type=str,
+        action="append",
+        default=[],
+        help="Argument passed to gem5, e.g. --gem5-arg=--debug-flags=Exec.",
+    )
+    parser.add_argument(
+        "--config-arg",
+        type=str,
+        action="append",
+        default=[],
+        help="Argument passed to the config script before the workload's.",
+    )
+    parser.add_argument("--num-workers", type=int, default=None)
+    parser.add_argument(
+        "--memory-per-run",
+        type=int,
+        default=None,
+        help="Expected peak memory of one gem5 run in bytes.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory of the result cache. No cache is used by default.",
+    )
+    parser.add_argument(
+        "--cache-max-bytes",
+        type=int,
+        default=64 * 1024**3,
+    )
+    parser.add_argument(
+        "--cmdline-option",
+        type=str,
+        action="append",
+        default=[],
+        help="Option the config script passes to generate_cmdline as "
+        "name=value, for the cache key. Can be repeated.",
+    )
+    parser.add_argument(
+        "--host-binary-dir",
+        type=str,
+        default=None,
+        help="Directory with host copies of the workloads' binaries.",
+    )
+
+    args = parser.parse_args()
+    # The package imports the module of a wrapper, and with it m5, only
+    # when the wrapper is looked up.
+    package = importlib.import_module(__package__)
+    wrapper_class = getattr(package, args.workload)
+    grid = {}
+    for param in args.param:
+        name, _, values = param.partition("=")
+        grid[name] = values.split(",")
+    cache = (
+        ResultCache(Path(args.cache_dir), args.cache_max_bytes)
+        if args.cache_dir
+        else None
+    )
+    cmdline_kwargs = {}
+    for option in args.cmdline_option:
+        name, _, value = option.partition("=")
+        cmdline_kwargs[name] = _parse_value(value)
+    sweep = Sweep(
+        wrapper_class,
+        grid,
+        Path(args.gem5_binary),
+        Path(args.config_script),
+        Path(args.outdir_base),
+        args.gem5_arg,
+        args.config_arg,
+        cache,
+        cmdline_kwargs,
+        Path(args.host_binary_dir) if args.host_binary_dir else None,
+    )
+    return sweep, args.num_workers, args.memory_per_run
+
+
+if __name__ == "__main__":
+    sweep, num_workers, memory_per_run = get_inputs()
+    returncodes = sweep.run(num_workers, memory_per_run)
+    sys.exit(0 if all(code == 0 for code in returncodes.values()) else 1)
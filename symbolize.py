@@ -0,0 +1,169 @@
+import argparse
+import os
+import subprocess
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .elf_info import get_elf_info
+from .file_hash import hash_file
+
+_default_cache_dir = Path.home() / ".cache" / "gem5-workloads" / "objdump"
+
+
+class ProcessInfo:
+    """Contents of the process_info.txt a runscript writes on the guest.
+
+    Depending on how the runscript was generated it holds either the
+    disassembly of the binary (`objdump`) or only its path and build-id
+    (`binary:` and `build-id:` lines), followed by the maps of every rank
+    (`PID:` lines followed by the content of /proc/pid/maps).
+    """
+
+    def __init__(
+        self,
+        binary: Optional[str],
+        build_id: Optional[str],
+        objdump: Optional[str],
+        maps: Dict[int, List[str]],
+    ):
+        self._binary = binary
+        self._build_id = build_id
+        self._objdump = objdump
+        self._maps = maps
+
+    def binary(self) -> Optional[str]:
+        return self._binary
+
+    def build_id(self) -> Optional[str]:
+        return self._build_id
+
+    def objdump(self) -> Optional[str]:
+        return self._objdump
+
+    def maps(self) -> Dict[int, List[str]]:
+        return self._maps
+
+    def __str__(self) -> str:
+        return (
+            f"ProcessInfo(binary: {self._binary}, build_id: {self._build_id}, "
+            f"pids: {list(self._maps.keys())})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+def parse_process_info(path: Path) -> ProcessInfo:
+    binary = None
+    build_id = None
+    objdump_lines = None
+    maps = {}
+    current_maps = None
+    with open(path, "r", errors="replace") as process_info:
+        for line in process_info:
+            if line.startswith("PID: "):
+                current_maps = maps.setdefault(int(line.split()[1]), [])
+            elif current_maps is not None:
+                current_maps.append(line.rstrip("\n"))
+            elif line.startswith("binary: "):
+                binary = line[len("binary: ") :].strip()
+            elif line.startswith("build-id: "):
+                build_id = line[len("build-id: ") :].strip() or None
+            elif line.rstrip("\n") == "objdump" and objdump_lines is None:
+                objdump_lines = []
+            elif objdump_lines is not None:
+                objdump_lines.append(line)
+    return ProcessInfo(
+        binary,
+        build_id,
+        "".join(objdump_lines) if objdump_lines is not None else None,
+        maps,
+    )
+
+
+class Symbolizer:
+    """Disassembles binaries on the host and caches the result per build-id.
+
+    Binaries without a build-id are cached by the hash of their content.
+    """
+
+    def __init__(
+        self, cache_dir: Path = _default_cache_dir, objdump="objdump"
+    ):
+        self._cache_dir = Path(cache_dir)
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._objdump = objdump
+
+    def _cache_key(self, binary_path: Path) -> str:
+        build_id = get_elf_info(binary_path).build_id()
+        if build_id is not None:
+            return build_id
+        return f"sha256-{hash_file(binary_path)}"
+
+    def disassemble(
+        self, binary_path: Path, build_id: Optional[str] = None
+    ) -> Path:
+        """Returns the path to the `objdump -S` output of `binary_path`.
+
+        Args:
+            binary_path: Host copy of the binary that ran on the guest.
+            build_id: Build-id recorded on the guest. If it is given it has
+                to match the build-id of `binary_path`.
+        """
+        key = self._cache_key(binary_path)
+        if build_id is not None and build_id != key:
+            raise ValueError(
+                f"Build-id of {binary_path} is {key}, but the guest ran a "
+                f"binary with build-id {build_id}."
+            )
+        cache_path = self._cache_dir / f"{key}.objdump"
+        if not cache_path.exists():
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w") as output:
+                subprocess.run(
+                    [self._objdump, "-S", str(binary_path)],
+                    stdout=output,
+                    check=True,
+                )
+            os.replace(tmp_path, cache_path)
+        return cache_path
+
+
+def get_inputs():
+    parser = argparse.ArgumentParser(
+        description="Disassemble the binary recorded in process_info.txt "
+        "from its host copy."
+    )
+    parser.add_argument(
+        "outdir", type=str, help="gem5 outdir with the process_info.txt."
+    )
+    parser.add_argument(
+        "binary", type=str, help="Host copy of the binary the guest ran."
+    )
+    parser.add_argument(
+        "--objdump",
+        type=str,
+        default="objdump",
+        help="objdump to use, e.g. aarch64-linux-gnu-objdump.",
+    )
+    parser.add_argument(
+        "--cache-dir", type=str, default=str(_default_cache_dir)
+    )
+
+    args = parser.parse_args()
+    return (
+        Path(args.outdir),
+        Path(args.binary),
+        args.objdump,
+        Path(args.cache_dir),
+    )
+
+
+if __name__ == "__main__":
+    outdir, binary, objdump, cache_dir = get_inputs()
+    process_info = parse_process_info(outdir / "process_info.txt")
+    symbolizer = Symbolizer(cache_dir, objdump)
+    disassembly = symbolizer.disassemble(binary, process_info.build_id())
+    (outdir / "objdump.txt").write_text(disassembly.read_text())
+    print(f"Wrote the disassembly of {binary} to {outdir / 'objdump.txt'}.")
@@ -0,0 +1,19 @@
+import importlib.util
+import sys
+
+from pathlib import Path
+
+# The modules use relative imports, so the checkout is imported as the
+# `workloads` package whatever its directory is called. The package imports
+# the gem5 wrappers lazily, so this works without m5.
+_package_dir = Path(__file__).parent.parent
+
+if "workloads" not in sys.modules:
+    _spec = importlib.util.spec_from_file_location(
+        "workloads",
+        _package_dir / "__init__.py",
+        submodule_search_locations=[str(_package_dir)],
+    )
+    _package = importlib.util.module_from_spec(_spec)
+    sys.modules["workloads"] = _package
+    _spec.loader.exec_module(_package)
@@ -0,0 +1,131 @@
+import os
+import struct
+
+from workloads.elf_info import (
+    ET_DYN,
+    PT_INTERP,
+    PT_NOTE,
+    SHT_SYMTAB,
+    STT_FUNC,
+    ElfFile,
+    get_elf_info,
+    get_symbol_index,
+)
+
+_interpreter = b"/lib/ld-linux-aarch64.so.1\0"
+_build_id = bytes.fromhex("0123456789abcdef")
+_strtab = b"\0main\0_Z6helperi\0"
+
+
+def _write_elf(path, e_type=ET_DYN):
+    """Writes a 64-bit little-endian aarch64 ELF with an interpreter, a
+    build-id note and two function symbols."""
+    phoff = 64
+    interp_offset = phoff + 2 * 56
+    note = (
+        struct.pack("<III", 4, len(_build_id), 3) + b"GNU\0" + _build_id
+    )
+    note_offset = interp_offset + len(_interpreter)
+    strtab_offset = note_offset + len(note)
+    symtab_offset = strtab_offset + len(_strtab)
+    symtab = (
+        struct.pack("<IBBHQQ", 0, 0, 0, 0, 0, 0)
+        + struct.pack("<IBBHQQ", 1, STT_FUNC, 0, 1, 0x1000, 0x40)
+        + struct.pack("<IBBHQQ", 6, STT_FUNC, 0, 1, 0x1040, 0x20)
+    )
+    shoff = symtab_offset + len(symtab)
+
+    header = b"\x7fELF" + bytes([2, 1, 1]) + bytes(9)
+    header += struct.pack(
+        "<HHIQQQIHHHHHH",
+        e_type,
+        0xB7,
+        1,
+        0x1000,
+        phoff,
+        shoff,
+        0,
+        64,
+        56,
+        2,
+        64,
+        3,
+        0,
+    )
+    program_headers = struct.pack(
+        "<IIQQQQQQ",
+        PT_INTERP,
+        4,
+        interp_offset,
+        0,
+        0,
+        len(_interpreter),
+        len(_interpreter),
+        1,
+    ) + struct.pack(
+        "<IIQQQQQQ", PT_NOTE, 4, note_offset, 0, 0, len(note), len(note), 4
+    )
+    section_headers = (
+        bytes(64)
+        + struct.pack(
+            "<IIQQQQIIQQ",
+            0,
+            SHT_SYMTAB,
+            0,
+            0,
+            symtab_offset,
+            len(symtab),
+            2,
+            1,
+            8,
+            24,
+        )
+        + struct.pack(
+            "<IIQQQQIIQQ", 0, 3, 0, 0, strtab_offset, len(_strtab), 0, 0, 1, 0
+        )
+    )
+    path.write_bytes(
+        header
+        + program_headers
+        + _interpreter
+        + note
+        + _strtab
+        + symtab
+        + section_headers
+    )
+    return path
+
+
+def test_headers(tmp_path):
+    elf = ElfFile(_write_elf(tmp_path / "binary"))
+    assert elf.is_64()
+    assert elf.architecture() == "aarch64"
+    assert elf.is_pie()
+    assert [header.type() for header in elf.program_headers()] == [
+        PT_INTERP,
+        PT_NOTE,
+    ]
+    assert elf.interpreter() == "/lib/ld-linux-aarch64.so.1"
+    assert elf.build_id() == _build_id.hex()
+
+
+def test_function_symbols(tmp_path):
+    symbols = get_symbol_index(_write_elf(tmp_path / "binary"))
+    assert symbols.address("main") == 0x1000
+    assert symbols.address("helper") == 0x1040
+    assert symbols.symbolize(0x1044) == ("_Z6helperi", 4)
+    assert symbols.symbolize(0x1060) is None
+
+
+def test_get_elf_info_replaces_changed_binaries(tmp_path):
+    path = _write_elf(tmp_path / "binary")
+    first = get_elf_info(path)
+    assert get_elf_info(path) is first
+
+    _write_elf(path, e_type=2)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    second = get_elf_info(path)
+    assert second is not first
+    assert first._data.closed
+    assert not second.is_pie()
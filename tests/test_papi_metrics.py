@@ -0,0 +1,68 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from test_papi_store import write_rank_file
+from workloads.papi_metrics import Metric, evaluate_metrics
+from workloads.papi_store import ingest
+
+
+@pytest.fixture
+def table(tmp_path):
+    write_rank_file(
+        tmp_path,
+        0,
+        {
+            0: {"spmv": {"PAPI_L1_DCM": 10, "PAPI_L1_DCA": 100, "cycles": 50}},
+            1: {"spmv": {"PAPI_L1_DCM": 30, "PAPI_L1_DCA": 100, "cycles": 70}},
+        },
+    )
+    write_rank_file(
+        tmp_path,
+        1,
+        {0: {"spmv": {"PAPI_L1_DCM": 20, "PAPI_L1_DCA": 200, "cycles": 30}}},
+    )
+    return ingest(tmp_path, max_workers=1)
+
+
+def test_events_sum_over_threads_and_ranks(table):
+    result = evaluate_metrics(
+        table, {"l1d_miss_rate": "PAPI_L1_DCM / PAPI_L1_DCA"}
+    )
+    assert len(result) == 1
+    assert result.key("region").tolist() == ["spmv"]
+    assert result.metric("l1d_miss_rate").tolist() == [60 / 400]
+
+
+def test_time_like_events_take_the_maximum_over_threads(table):
+    result = evaluate_metrics(
+        table,
+        {"cycles": "cycles", "imbalance": "imbalance(cycles)"},
+        group_by=["region"],
+    )
+    assert result.metric("cycles").tolist() == [70 + 30]
+    assert result.metric("imbalance").tolist() == [70 / 50]
+
+
+def test_group_by_and_where(table):
+    result = evaluate_metrics(
+        table,
+        {"misses": "sum(PAPI_L1_DCM)", "rate": "mean(PAPI_L1_DCM / 100)"},
+        group_by=["rank"],
+        where={"region": "spmv", "thread": 0},
+    )
+    assert result.key("rank").tolist() == [0, 1]
+    assert result.metric("misses").tolist() == [10, 20]
+    assert result.metric("rate").tolist() == [0.1, 0.2]
+
+
+def test_missing_events_are_nan(table):
+    result = evaluate_metrics(table, {"ipc": "PAPI_TOT_INS / PAPI_TOT_CYC"})
+    assert np.isnan(result.metric("ipc")).all()
+
+
+def test_rejects_unsupported_formulas():
+    with pytest.raises(ValueError):
+        Metric("bad", "__import__('os')")
+    with pytest.raises(ValueError):
+        Metric("nested", "sum(mean(cycles))")
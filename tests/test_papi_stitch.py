@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from test_papi_store import write_rank_file
+from workloads.papi_metrics import evaluate_metrics
+from workloads.papi_stitch import stitch_partitions
+from workloads.papi_store import ingest
+
+_run = "grace-eight-core/hpcg/small"
+
+
+def _write_partitions(root, num_ranks_b=1):
+    write_rank_file(
+        root,
+        0,
+        {0: {"spmv": {"cycles": 100, "PAPI_TOT_INS": 200}}},
+        f"{_run}/papi_a_data/papi_hl_output",
+    )
+    for rank in range(num_ranks_b):
+        write_rank_file(
+            root,
+            rank,
+            {0: {"spmv": {"cycles": 200, "PAPI_TOT_CYC": 400}}},
+            f"{_run}/papi_b_data/papi_hl_output",
+        )
+
+
+def test_partitions_are_scaled_to_the_mean_reference(tmp_path):
+    _write_partitions(tmp_path)
+    stitched = stitch_partitions(ingest(tmp_path, max_workers=1))
+    assert len(stitched) == 1
+    assert stitched.num_partitions().tolist() == [2]
+    # Both partitions are scaled to the mean of 150 cycles.
+    assert stitched.event("cycles").tolist() == [150]
+    assert stitched.event("PAPI_TOT_INS").tolist() == [300]
+    assert stitched.event("PAPI_TOT_CYC").tolist() == [300]
+    assert stitched.common_events() == ["cycles"]
+    assert stitched.variation("cycles")[0] == pytest.approx(1 / 3)
+
+
+def test_stitched_table_combines_events_of_partitions(tmp_path):
+    _write_partitions(tmp_path)
+    table = stitch_partitions(ingest(tmp_path, max_workers=1)).to_table()
+    result = evaluate_metrics(table, {"ipc": "PAPI_TOT_INS / PAPI_TOT_CYC"})
+    assert result.metric("ipc").tolist() == [1.0]
+
+
+def test_warns_about_uneven_partitions(tmp_path):
+    _write_partitions(tmp_path, num_ranks_b=2)
+    with pytest.warns(UserWarning):
+        stitch_partitions(ingest(tmp_path, max_workers=1))
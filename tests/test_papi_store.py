@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from workloads.papi_store import PapiStore, ingest, parse_rank_path
+
+_run_dir = "grace-eight-core/hpcg/small/papi_cache_data/papi_hl_output"
+
+
+def write_rank_file(root, rank, threads, run_dir=_run_dir):
+    """Writes a papi_hl_output rank file. `threads` maps a thread to its
+    regions, which map a region name to its counters."""
+    path = root / run_dir / f"rank_{rank}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps(
+            {
+                "threads": {
+                    str(thread): {
+                        "regions": {
+                            str(region_id): {
+                                "name": name,
+                                "parent_region_id": "-1",
+                                **{
+                                    event: str(value)
+                                    for event, value in counters.items()
+                                },
+                            }
+                            for region_id, (name, counters) in enumerate(
+                                regions.items()
+                            )
+                        }
+                    }
+                    for thread, regions in threads.items()
+                }
+            }
+        )
+    )
+    return path
+
+
+def test_parse_rank_path(tmp_path):
+    path = tmp_path / _run_dir / "rank_0.json"
+    assert parse_rank_path(tmp_path, path) == {
+        "machine": "grace",
+        "config": "eight-core",
+        "workload": "hpcg",
+        "input": "small",
+        "backend": "papi_cache",
+    }
+    with pytest.raises(ValueError):
+        parse_rank_path(tmp_path, tmp_path / "rank_0.json")
+
+
+def test_ingest(tmp_path):
+    write_rank_file(tmp_path, 0, {0: {"spmv": {"PAPI_L1_DCM": 5}}})
+    write_rank_file(
+        tmp_path,
+        1,
+        {0: {"spmv": {"PAPI_L1_DCM": 7}}, 1: {"spmv": {"PAPI_L1_DCM": 9}}},
+    )
+    table = ingest(tmp_path, max_workers=1)
+    assert table.num_files() == 2
+    assert len(table) == 3
+    assert sorted(table.file_column("rank").tolist()) == [0, 1]
+    assert sorted(table.values().tolist()) == [5, 7, 9]
+    assert table.dictionary("event") == ["PAPI_L1_DCM"]
+
+
+def test_refresh_only_parses_new_or_changed_files(tmp_path):
+    root = tmp_path / "data"
+    store = PapiStore(tmp_path / "store")
+    write_rank_file(root, 0, {0: {"spmv": {"PAPI_L1_DCM": 5}}})
+    write_rank_file(root, 1, {0: {"spmv": {"PAPI_L1_DCM": 7}}})
+    assert len(store.refresh(root, max_workers=1)) == 2
+    assert store.refresh(root, max_workers=1) == []
+
+    changed = write_rank_file(root, 1, {0: {"spmv": {"PAPI_L1_DCM": 8}}})
+    # The new content has the same size, so make sure the mtime moves.
+    stat = changed.stat()
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert store.refresh(root, max_workers=1) == [
+        str(changed.relative_to(root))
+    ]
+    assert store.num_dead_files() == 1
+    assert sorted(store.load().values().tolist()) == [5, 8]
+
+    # A reopened store picks up where the last one stopped.
+    store = PapiStore(tmp_path / "store")
+    store.compact()
+    assert store.num_dead_files() == 0
+    assert sorted(store.load().values().tolist()) == [5, 8]
+
+    changed.unlink()
+    assert store.refresh(root, max_workers=1) == []
+    assert store.load().values().tolist() == [5]
@@ -0,0 +1,79 @@
+import struct
+import types
+
+import pytest
+
+from workloads import process_maps
+from workloads.process_maps import (
+    build_process_maps,
+    read_process_maps,
+    write_process_maps,
+)
+
+_process_info = """objdump
+PID: 100 RANK: 1
+aaaaaaab0000-aaaaaaab2000 r--p 00010000 08:01 12 /home/ubuntu/hpcg/xhpcg
+aaaaaaaa0000-aaaaaaaa8000 r-xp 00000000 08:01 12 /home/ubuntu/hpcg/xhpcg
+ffff00000000-ffff00001000 rw-p 00000000 00:00 0
+PID: 101 RANK: 0
+aaaaaaaa0000-aaaaaaaa8000 r-xp 00000000 08:01 12 /home/ubuntu/hpcg/xhpcg
+"""
+
+
+def _build(tmp_path, text=_process_info):
+    (tmp_path / "process_info.txt").write_text(text)
+    return build_process_maps(tmp_path / "process_info.txt")
+
+
+def test_build_process_maps(tmp_path):
+    maps = _build(tmp_path)
+    assert [rank_maps.rank() for rank_maps in maps.ranks()] == [1, 0]
+    rank_maps = maps.get_pid(100)
+    assert [mapping.start() for mapping in rank_maps.mappings()] == [
+        0xAAAAAAAA0000,
+        0xAAAAAAAB0000,
+        0xFFFF00000000,
+    ]
+    assert rank_maps.find(0xAAAAAAAA0010).perms() == "r-xp"
+    assert rank_maps.find(0xFFFF00000010).path() == ""
+    assert rank_maps.find(0xAAAAAAAA9000) is None
+    assert maps.load_base("xhpcg") == 0xAAAAAAAA0000
+    assert maps.load_base("other") is None
+
+
+def test_ranks_are_numbered_in_order_if_one_is_missing(tmp_path):
+    text = _process_info.replace("PID: 101 RANK: 0", "PID: 101")
+    maps = _build(tmp_path, text)
+    assert [rank_maps.rank() for rank_maps in maps.ranks()] == [0, 1]
+
+
+@pytest.mark.parametrize("byteorder", ["little", "big"])
+def test_round_trip(tmp_path, monkeypatch, byteorder):
+    maps = _build(tmp_path)
+    monkeypatch.setattr(
+        process_maps, "sys", types.SimpleNamespace(byteorder=byteorder)
+    )
+    write_process_maps(maps, tmp_path / "process_maps.bin")
+    loaded = read_process_maps(tmp_path / "process_maps.bin")
+    assert loaded.paths() == maps.paths()
+    for rank_maps, loaded_maps in zip(maps.ranks(), loaded.ranks()):
+        assert (loaded_maps.pid(), loaded_maps.rank()) == (
+            rank_maps.pid(),
+            rank_maps.rank(),
+        )
+        assert [str(m) for m in loaded_maps.mappings()] == [
+            str(m) for m in rank_maps.mappings()
+        ]
+
+
+def test_columns_are_little_endian(tmp_path):
+    maps = _build(tmp_path)
+    write_process_maps(maps, tmp_path / "process_maps.bin")
+    data = (tmp_path / "process_maps.bin").read_bytes()
+    # The first column after the header, the path table and the rank's
+    # header is the start of the rank's lowest mapping.
+    position = struct.calcsize(process_maps._header_format)
+    for path in maps.paths():
+        position += 4 + len(path.encode())
+    position += struct.calcsize(process_maps._rank_header_format)
+    assert struct.unpack_from("<Q", data, position) == (0xAAAAAAAA0000,)
@@ -0,0 +1,75 @@
+import pytest
+
+from workloads.result_cache import ResultCache, result_key
+
+
+class _Workload:
+    def __init__(self, id_string):
+        self._id_string = id_string
+
+    def generate_id_string(self):
+        return self._id_string
+
+    def generate_cmdline(self):
+        return "#! /bin/bash\n"
+
+
+def _make_outdir(path, size=4):
+    (path / "npz").mkdir(parents=True)
+    (path / "stats.txt").write_bytes(b"s" * size)
+    (path / "pc_lookup.bin").write_bytes(b"p")
+    (path / "npz" / "chunk_0.npz").write_bytes(b"n")
+    (path / "simout.txt").write_bytes(b"o")
+    return path
+
+
+def test_result_key():
+    assert result_key(_Workload("A"), "board") == result_key(
+        _Workload("A"), "board"
+    )
+    assert result_key(_Workload("A"), "board") != result_key(
+        _Workload("B"), "board"
+    )
+    assert result_key(_Workload("A"), "board") != result_key(
+        _Workload("A"), "board", cmdline="#! /bin/sh\n"
+    )
+
+
+def test_store_and_restore(tmp_path):
+    cache = ResultCache(tmp_path / "cache", 1 << 20)
+    assert cache.store("key", _make_outdir(tmp_path / "run"))
+    assert "key" in cache
+    assert cache.restore("key", tmp_path / "restored")
+    restored = sorted(
+        path.relative_to(tmp_path / "restored").as_posix()
+        for path in (tmp_path / "restored").rglob("*")
+        if path.is_file()
+    )
+    assert restored == ["npz/chunk_0.npz", "pc_lookup.bin", "stats.txt"]
+    assert not cache.restore("other", tmp_path / "other")
+
+
+def test_caches_sharing_a_directory_keep_each_others_entries(tmp_path):
+    first = ResultCache(tmp_path / "cache", 1 << 20)
+    second = ResultCache(tmp_path / "cache", 1 << 20)
+    first.store("a", _make_outdir(tmp_path / "a"))
+    second.store("b", _make_outdir(tmp_path / "b"))
+    assert "a" in first and "b" in first
+    assert "a" in second and "b" in second
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(tmp_path / "cache", 15)
+    cache.store("a", _make_outdir(tmp_path / "a", 8))
+    cache.store("b", _make_outdir(tmp_path / "b", 8))
+    assert "a" not in cache
+    assert "b" in cache
+    assert not (tmp_path / "cache" / "a").exists()
+
+
+def test_skips_results_larger_than_the_cache(tmp_path):
+    cache = ResultCache(tmp_path / "cache", 4)
+    with pytest.warns(UserWarning):
+        assert not cache.store("a", _make_outdir(tmp_path / "a", 8))
+    assert "a" not in cache
+    assert cache.total_bytes() == 0
@@ -0,0 +1,160 @@
+import pytest
+
+from workloads.stats_dumps import (
+    AsyncStatsDumpWriter,
+    StatsDump,
+    StatsDumpReader,
+    StatsDumpWriter,
+    parse_stats_dump,
+    read_index,
+    read_stats_dump,
+)
+
+_begin = b"---------- Begin Simulation Statistics ----------\n"
+_dump_0 = _begin + b"simTicks 100 # a\n"
+_dump_1 = _begin + b"simTicks 250 # b\n"
+
+
+def _append(path, data):
+    with open(path, "ab") as stats_file:
+        stats_file.write(data)
+
+
+def test_index_line_round_trip():
+    dump = StatsDump(3, 10, 20, 1000, 2)
+    parsed = StatsDump.process_line(dump.to_line())
+    assert parsed.to_line() == dump.to_line()
+    # Lines written before runs were recorded have no run id.
+    assert StatsDump.process_line("3 10 20 1000\n").run_id() == 0
+    assert StatsDump.process_line("# comment\n") is None
+
+
+def test_parse_stats_dump():
+    stats = parse_stats_dump(_dump_0 + b"name text # c\nbad\n")
+    assert stats == {"simTicks": 100}
+
+
+def test_writer_splits_stats_into_dumps(tmp_path):
+    writer = StatsDumpWriter(tmp_path)
+    for tick, data in [(100, _dump_0), (250, _dump_1)]:
+        writer.begin_dump()
+        _append(tmp_path / "stats.txt", data)
+        writer.write_dump(tick)
+    # Nothing was appended, so there is no dump to write.
+    writer.begin_dump()
+    assert writer.write_dump(300) is None
+    writer.close()
+
+    assert (tmp_path / "stats_dump_0.txt").read_bytes() == _dump_0
+    assert (tmp_path / "stats_dump_1.txt").read_bytes() == _dump_1
+    dumps = read_index(tmp_path / "stats_dump_index.txt")
+    assert [(dump.dump_id(), dump.tick()) for dump in dumps] == [
+        (0, 100),
+        (1, 250),
+    ]
+    assert read_stats_dump(tmp_path / "stats.txt", dumps[1]) == _dump_1
+
+
+def test_writer_leaves_out_stats_dumped_by_others(tmp_path):
+    writer = StatsDumpWriter(tmp_path)
+    _append(tmp_path / "stats.txt", _dump_0)
+    writer.begin_dump()
+    _append(tmp_path / "stats.txt", _dump_1)
+    dump = writer.write_dump(250)
+    writer.close()
+    assert read_stats_dump(tmp_path / "stats.txt", dump) == _dump_1
+
+
+def test_writer_carries_on_from_the_index(tmp_path):
+    writer = StatsDumpWriter(tmp_path)
+    _append(tmp_path / "stats.txt", _dump_0)
+    writer.write_dump(100)
+    writer.close()
+
+    # gem5 truncates stats.txt when it starts again.
+    (tmp_path / "stats.txt").write_bytes(b"")
+    writer = StatsDumpWriter(tmp_path)
+    _append(tmp_path / "stats.txt", _dump_1)
+    dump = writer.write_dump(250)
+    writer.close()
+    assert (dump.dump_id(), dump.run_id(), dump.offset()) == (1, 1, 0)
+
+
+def test_reader_slices_dumps_out_of_stats(tmp_path):
+    writer = StatsDumpWriter(tmp_path, copy_dumps=False)
+    for tick, data in [(100, _dump_0), (250, _dump_1)]:
+        writer.begin_dump()
+        _append(tmp_path / "stats.txt", data)
+        writer.write_dump(tick)
+    writer.close()
+    assert not (tmp_path / "stats_dump_0.txt").exists()
+
+    with StatsDumpReader(tmp_path) as reader:
+        assert [dump.dump_id() for dump in reader.dumps()] == [0, 1]
+        assert bytes(reader.get_dump(0)) == _dump_0
+        assert reader.get_dump_text(1) == _dump_1.decode()
+        with pytest.raises(ValueError):
+            reader.get_dump(2)
+
+
+def test_reader_refuses_dumps_of_overwritten_runs(tmp_path):
+    writer = StatsDumpWriter(tmp_path, copy_dumps=False)
+    _append(tmp_path / "stats.txt", _dump_0)
+    writer.write_dump(100)
+    writer.close()
+    (tmp_path / "stats.txt").write_bytes(b"")
+    writer = StatsDumpWriter(tmp_path, copy_dumps=False)
+    _append(tmp_path / "stats.txt", _dump_1)
+    writer.write_dump(250)
+    writer.close()
+
+    with StatsDumpReader(tmp_path) as reader:
+        assert reader.latest_run() == 1
+        assert [dump.dump_id() for dump in reader.dumps(1)] == [1]
+        assert bytes(reader.get_dump(1)) == _dump_1
+        with pytest.raises(ValueError):
+            reader.get_dump(0)
+
+
+class _Sink:
+    def __init__(self, fail=False):
+        self.dumps = []
+        self.fail = fail
+        self.flushed = False
+        self.closed = False
+
+    def add_dump(self, dump, data):
+        if self.fail:
+            raise OSError("disk full")
+        self.dumps.append((dump.dump_id(), bytes(data)))
+
+    def flush(self):
+        self.flushed = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_async_writer_persists_dumps_in_order(tmp_path):
+    sink = _Sink()
+    writer = AsyncStatsDumpWriter(tmp_path, sink=sink, max_pending=1)
+    for tick, data in [(100, _dump_0), (250, _dump_1)]:
+        writer.begin_dump()
+        _append(tmp_path / "stats.txt", data)
+        writer.write_dump(tick)
+    writer.flush()
+    assert sink.flushed
+    assert sink.dumps == [(0, _dump_0), (1, _dump_1)]
+    assert (tmp_path / "stats_dump_1.txt").read_bytes() == _dump_1
+    writer.close()
+    assert sink.closed
+    assert len(read_index(tmp_path / "stats_dump_index.txt")) == 2
+
+
+def test_async_writer_raises_errors_of_the_writer_thread(tmp_path):
+    writer = AsyncStatsDumpWriter(tmp_path, sink=_Sink(fail=True))
+    _append(tmp_path / "stats.txt", _dump_0)
+    writer.write_dump(100)
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    writer.close()
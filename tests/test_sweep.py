@@ -0,0 +1,48 @@
+import argparse
+
+from workloads.sweep import Sweep, expand_grid
+
+
+class _Wrapper:
+    @staticmethod
+    def parse_args(args):
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--size", type=int, required=True)
+        parser.add_argument("--variant", type=str, required=True)
+        parsed_args = parser.parse_args(args)
+        return [parsed_args.size, parsed_args.variant]
+
+    def __init__(self, size, variant):
+        self._size = size
+        self._variant = variant
+
+    def generate_id_string(self):
+        # The variant does not change the run for small sizes.
+        if self._size < 32:
+            return f"SIZE.{self._size}"
+        return f"SIZE.{self._size}-VARIANT.{self._variant}"
+
+
+def test_expand_grid():
+    assert expand_grid({"size": [16, 32], "--variant": ["ref"]}) == [
+        ["--size", "16", "--variant", "ref"],
+        ["--size", "32", "--variant", "ref"],
+    ]
+
+
+def test_runs_are_named_by_id_string_and_deduplicated(tmp_path):
+    sweep = Sweep(
+        _Wrapper,
+        {"size": [16, 32], "variant": ["ref", "hov"]},
+        tmp_path / "gem5",
+        tmp_path / "config.py",
+        tmp_path / "out",
+    )
+    runs = sweep.runs()
+    assert [run.id_string() for run in runs] == [
+        "SIZE.16",
+        "SIZE.32-VARIANT.ref",
+        "SIZE.32-VARIANT.hov",
+    ]
+    assert runs[0].outdir() == tmp_path / "out" / "SIZE.16"
+    assert not runs[0].is_done()
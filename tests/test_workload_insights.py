@@ -0,0 +1,154 @@
+import struct
+import types
+
+import pytest
+
+from workloads import workload_insights
+from workloads.workload_insights import (
+    CompiledSnippet,
+    PCLookupTable,
+    compile_snippet,
+    generate_snippet,
+    process_snippet,
+    register_snippet,
+)
+
+_snippet = """
+offset: 1000
+func kernel:
+    100:  ldr     w1, [x1, x0, lsl #2]    label:  index       main
+    104:  sxtw    x6, w1
+    108:  ldr@0   d0, [x7, x6, lsl #3]    label:  value       main
+
+ret 10c
+"""
+
+
+class _Processor:
+    def __init__(self):
+        self.calls = []
+
+    def add_function_info(self, *args):
+        self.calls.append(("add_function_info", args))
+
+    def add_indirect_chain(self, *args):
+        self.calls.append(("add_indirect_chain", args))
+
+    def add_reg_index_override(self, *args):
+        self.calls.append(("add_reg_index_override", args))
+
+
+def test_register_snippet():
+    processor = _Processor()
+    register_snippet(processor, compile_snippet(_snippet), 0x2000)
+    assert processor.calls == [
+        (
+            "add_function_info",
+            ("main", -1, ["index", "value"], [0x2100, 0x2108]),
+        ),
+        (
+            "add_indirect_chain",
+            ("value[index]0", [0x2100, 0x2104, 0x2108]),
+        ),
+        ("add_reg_index_override", ((0x2108, 0),)),
+    ]
+
+
+def _objdump(instructions):
+    lines = ["0000000000400100 <kernel>:"]
+    for pc, mnemonic, operands in instructions:
+        lines.append(f"  {pc:x}:\t00000000 \t{mnemonic}\t{operands}")
+    return "\n".join(lines) + "\n"
+
+
+# One index load feeding two gathers.
+_shared_index = _objdump(
+    [
+        (0x400100, "ldr", "x0, [x1]"),
+        (0x400104, "ldr", "x2, [x3, x0, lsl #3]"),
+        (0x400108, "ldr", "x4, [x5, x0, lsl #3]"),
+        (0x40010C, "ret", ""),
+    ]
+)
+
+# Two index loads feeding one gather.
+_shared_value = _objdump(
+    [
+        (0x400100, "ldr", "x0, [x1]"),
+        (0x400104, "ldr", "x6, [x7]"),
+        (0x400108, "add", "x0, x0, x6"),
+        (0x40010C, "ldr", "x2, [x3, x0, lsl #3]"),
+        (0x400110, "ret", ""),
+    ]
+)
+
+
+def _chain_names(objdump):
+    snippet = generate_snippet(objdump, ["kernel"])
+    return [name for name, _, _ in compile_snippet(snippet).chains()]
+
+
+def test_shared_index_load_is_labeled_in_every_chain():
+    snippet = generate_snippet(_shared_index, ["kernel"])
+    _, chains = process_snippet(snippet)
+    assert len(chains) == 2
+    assert [chain[0].label() for chain in chains] == ["idx_400100"] * 2
+    assert [chain[0].label_version() for chain in chains] == [0, 1]
+    assert _chain_names(_shared_index) == [
+        "val_400104[idx_400100]0",
+        "val_400108[idx_400100]0",
+    ]
+
+
+def test_shared_value_access_gets_a_new_version_per_chain():
+    names = _chain_names(_shared_value)
+    assert names == [
+        "val_40010c[idx_400100]0",
+        "val_40010c[idx_400104]1",
+    ]
+
+
+def test_compiled_snippet_round_trip(tmp_path):
+    snippet = generate_snippet(_shared_index, ["kernel"])
+    compiled = compile_snippet(snippet)
+    compiled.save(tmp_path / "snippet")
+    loaded = CompiledSnippet.load(tmp_path / "snippet")
+    assert loaded.functions(0x1000) == compiled.functions(0x1000)
+    assert loaded.chains(0x1000) == compiled.chains(0x1000)
+
+
+def test_pc_lookup_table_round_trip(tmp_path):
+    table = PCLookupTable.from_snippet(compile_snippet(_snippet), 0x2000)
+    assert table.save(tmp_path / "pc_lookup.bin")
+    assert not table.save(tmp_path / "pc_lookup.bin")
+    loaded = PCLookupTable.load(tmp_path / "pc_lookup.bin")
+    assert loaded.lookup(0x2108) == {
+        "label": "value",
+        "scope": "main",
+        "override": 0,
+        "chains": ["value[index]0"],
+    }
+    assert loaded.lookup(0x2104)["chains"] == ["value[index]0"]
+    assert loaded.lookup(0x2200) is None
+
+
+def test_pc_lookup_table_is_little_endian():
+    table = PCLookupTable.from_snippet(compile_snippet(_snippet), 0x2000)
+    data = table.to_bytes()
+    # The PCs are the first section after the header.
+    header_size = struct.calcsize(PCLookupTable._header_format)
+    position = header_size + -header_size % 8
+    assert struct.unpack_from("<Q", data, position) == (0x2100,)
+
+
+@pytest.mark.parametrize("byteorder", ["little", "big"])
+def test_pc_lookup_table_round_trip_on_any_host(
+    tmp_path, monkeypatch, byteorder
+):
+    table = PCLookupTable.from_snippet(compile_snippet(_snippet), 0x2000)
+    monkeypatch.setattr(
+        workload_insights, "sys", types.SimpleNamespace(byteorder=byteorder)
+    )
+    table.save(tmp_path / "pc_lookup.bin")
+    loaded = PCLookupTable.load(tmp_path / "pc_lookup.bin")
+    assert loaded.lookup(0x2108) == table.lookup(0x2108)
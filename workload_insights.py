@@ -1,9 +1,39 @@
-from typing import Tuple, Union
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import struct
+import sys
+
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+
+def resolve_pc(text: str, offset: int, symbols=None) -> int:
+    """Turns the PC of a snippet line into an address.
+
+    PCs are either hex numbers or `symbol+0xNN`, which is resolved with
+    `symbols.address(symbol)`, e.g. a `SymbolIndex`.
+    """
+    text = text.strip()
+    if "+" not in text:
+        return int(text, 16) + offset
+    name, displacement = text.split("+", 1)
+    if symbols is None:
+        raise ValueError(
+            f"PC {text} is relative to a symbol, but there is no symbol "
+            "table to resolve it with."
+        )
+    return symbols.address(name.strip()) + int(displacement, 16) + offset
 
 
 class AccessSite:
     @classmethod
-    def process_line(cls, line, offset) -> Union["AccessSite", None]:
+    def process_line(
+        cls, line, offset, symbols=None
+    ) -> Union["AccessSite", None]:
         tokens = line.split("label:")
         if len(tokens) == 1:
             return None
@@ -13,7 +43,7 @@ class AccessSite:
                 "If instruction line has a label it should have another "
                 "string specifying the allocation site (scope) for that label."
             )
-        pc = int(tokens[0].split(":")[0], 16) + offset
+        pc = resolve_pc(tokens[0].split(":")[0], offset, symbols)
         label = right_tokens[0].split("@")[0]
         allocation_site = right_tokens[1]
         return cls(pc, label, allocation_site)
@@ -41,7 +71,7 @@ class AccessSite:
 
 class Instruction:
     @classmethod
-    def process_line(cls, line, offset) -> "Instruction":
+    def process_line(cls, line, offset, symbols=None) -> "Instruction":
         tokens = line.split("label:")
 
         left_tokens = tokens[0].split(":")
@@ -49,7 +79,7 @@ class Instruction:
             raise ValueError(
                 f"Synatx error before at line {line} before `label:`"
             )
-        pc = int(left_tokens[0], 16) + offset
+        pc = resolve_pc(left_tokens[0], offset, symbols)
         pneumonic_tokens = left_tokens[1].split()
         inst_tokens = pneumonic_tokens[0].split("@")
         dest_idx_override = -1
@@ -105,6 +135,9 @@ class Instruction:
     def label(self) -> str:
         return self._label
 
+    def pneumonic(self) -> str:
+        return self._pneuomonic
+
     def label_version(self) -> int:
         return self._label_version
 
@@ -121,7 +154,8 @@ class Instruction:
         return str(self)
 
 
-def process_snippet(snippet):
+def _parse_snippet(snippet, symbols=None):
+    # PCs are parsed without the offset, which is returned separately.
     offset = 0
     access_sites = {}
     indirect_chains = []
@@ -155,7 +189,7 @@ def process_snippet(snippet):
                 raise ValueError(
                     f"Function termination lines should look like `ret [pc of ret instruction]`."
                 )
-            ret_pc = int(tokens[1], 16) + offset
+            ret_pc = resolve_pc(tokens[1], 0, symbols)
             if current_scope in access_sites:
                 access_sites[current_scope]["ret"] = ret_pc
             current_scope = None
@@ -165,7 +199,7 @@ def process_snippet(snippet):
             current_chain = []
             continue
         if (
-            access_site := AccessSite.process_line(line_no_comment, offset)
+            access_site := AccessSite.process_line(line_no_comment, 0, symbols)
         ) is not None:
             if access_site.allocation_site() not in access_sites:
                 access_sites[access_site.allocation_site()] = {
@@ -175,6 +209,840 @@ def process_snippet(snippet):
             access_sites[access_site.allocation_site()]["access_sites"].append(
                 access_site
             )
-        current_chain.append(Instruction.process_line(line_no_comment, offset))
+        current_chain.append(
+            Instruction.process_line(line_no_comment, 0, symbols)
+        )
+
+    return offset, access_sites, indirect_chains
+
+
+class CompiledSnippet:
+    """A parsed snippet stored as flat arrays and a string table.
+
+    PCs are stored without the snippet's offset so the same compiled
+    snippet can be used with any load base. Labels, pneumonics and
+    function names are ids into `strings`. Sites of function `i` are
+    `[site_ends[i - 1], site_ends[i])` and instructions of chain `i` are
+    `[chain_ends[i - 1], chain_ends[i])`.
+    """
+
+    _magic = b"SNIP"
+    _version = 3
+    _header_format = "<4sIqIIII"
+    _columns = [
+        ("func_name_ids", "i"),
+        ("func_rets", "q"),
+        ("site_ends", "I"),
+        ("site_pcs", "Q"),
+        ("site_label_ids", "i"),
+        ("inst_pcs", "Q"),
+        ("inst_pneumonic_ids", "i"),
+        ("inst_overrides", "i"),
+        ("inst_label_ids", "i"),
+        ("inst_label_versions", "i"),
+        ("chain_ends", "I"),
+    ]
+
+    @classmethod
+    def from_parsed(cls, offset, access_sites, indirect_chains):
+        strings = []
+        string_ids = {}
+
+        def string_id(string):
+            if string not in string_ids:
+                string_ids[string] = len(strings)
+                strings.append(string)
+            return string_ids[string]
+
+        columns = {name: array(typecode) for name, typecode in cls._columns}
+        for func_name, info in access_sites.items():
+            columns["func_name_ids"].append(string_id(func_name))
+            columns["func_rets"].append(info["ret"])
+            for site in info["access_sites"]:
+                columns["site_pcs"].append(site.pc())
+                columns["site_label_ids"].append(string_id(site.label()))
+            columns["site_ends"].append(len(columns["site_pcs"]))
+        for indirect_chain in indirect_chains:
+            for inst in indirect_chain:
+                columns["inst_pcs"].append(inst.pc())
+                columns["inst_pneumonic_ids"].append(
+                    string_id(inst.pneumonic())
+                )
+                columns["inst_overrides"].append(inst.override()[1])
+                columns["inst_label_ids"].append(string_id(inst.label()))
+                columns["inst_label_versions"].append(inst.label_version())
+            columns["chain_ends"].append(len(columns["inst_pcs"]))
+        return cls(offset, strings, columns)
+
+    def __init__(self, offset: int, strings: List[str], columns: Dict):
+        self._offset = offset
+        self._strings = strings
+        self._columns = columns
+
+    def offset(self) -> int:
+        return self._offset
+
+    def _ranges(self, ends_name: str):
+        start = 0
+        for end in self._columns[ends_name]:
+            yield start, end
+            start = end
+
+    def functions(self, load_base: Optional[int] = None):
+        """Returns (name, ret pc, labels, pcs) of every function."""
+        base = self._offset if load_base is None else load_base
+        columns = self._columns
+        functions = []
+        for i, (start, end) in enumerate(self._ranges("site_ends")):
+            ret = columns["func_rets"][i]
+            functions.append(
+                (
+                    self._strings[columns["func_name_ids"][i]],
+                    ret + base if ret != -1 else -1,
+                    [
+                        self._strings[label_id]
+                        for label_id in columns["site_label_ids"][start:end]
+                    ],
+                    [pc + base for pc in columns["site_pcs"][start:end]],
+                )
+            )
+        return functions
+
+    def chains(self, load_base: Optional[int] = None):
+        """Returns (name, pcs, register index overrides) of every non-empty
+        indirect chain."""
+        base = self._offset if load_base is None else load_base
+        columns = self._columns
+        chains = []
+        for start, end in self._ranges("chain_ends"):
+            if start == end:
+                continue
+            labels = columns["inst_label_ids"]
+            name = (
+                f"{self._strings[labels[end - 1]]}"
+                f"[{self._strings[labels[start]]}]"
+                f"{columns['inst_label_versions'][end - 1]}"
+            )
+            pcs = [pc + base for pc in columns["inst_pcs"][start:end]]
+            overrides = [
+                (pc, override)
+                for pc, override in zip(
+                    pcs, columns["inst_overrides"][start:end]
+                )
+                if override != -1
+            ]
+            chains.append((name, pcs, overrides))
+        return chains
+
+    def expand(self, load_base: Optional[int] = None):
+        """Returns the access sites and indirect chains like
+        `process_snippet`."""
+        base = self._offset if load_base is None else load_base
+        columns = self._columns
+        access_sites = {}
+        for name, ret, labels, pcs in self.functions(base):
+            access_sites[name] = {
+                "ret": ret,
+                "access_sites": [
+                    AccessSite(pc, label, name)
+                    for pc, label in zip(pcs, labels)
+                ],
+            }
+        indirect_chains = []
+        for start, end in self._ranges("chain_ends"):
+            indirect_chains.append(
+                [
+                    Instruction(
+                        columns["inst_pcs"][i] + base,
+                        self._strings[columns["inst_pneumonic_ids"][i]],
+                        columns["inst_overrides"][i],
+                        self._strings[columns["inst_label_ids"][i]],
+                        columns["inst_label_versions"][i],
+                    )
+                    for i in range(start, end)
+                ]
+            )
+        return access_sites, indirect_chains
+
+    def save(self, path: Path):
+        encoded_strings = json.dumps(self._strings).encode()
+        with open(path, "wb") as output:
+            output.write(
+                struct.pack(
+                    CompiledSnippet._header_format,
+                    CompiledSnippet._magic,
+                    CompiledSnippet._version,
+                    self._offset,
+                    len(encoded_strings),
+                    len(self._columns["func_name_ids"]),
+                    len(self._columns["site_pcs"]),
+                    len(self._columns["inst_pcs"]),
+                )
+            )
+            output.write(encoded_strings)
+            output.write(struct.pack("<I", len(self._columns["chain_ends"])))
+            for name, _ in CompiledSnippet._columns:
+                self._columns[name].tofile(output)
+
+    @classmethod
+    def load(cls, path: Path) -> "CompiledSnippet":
+        with open(path, "rb") as binary:
+            data = binary.read()
+        (
+            magic,
+            version,
+            offset,
+            strings_size,
+            num_functions,
+            num_sites,
+            num_insts,
+        ) = struct.unpack_from(cls._header_format, data)
+        if magic != cls._magic or version != cls._version:
+            raise ValueError(f"{path} is not a compiled snippet.")
+        position = struct.calcsize(cls._header_format)
+        strings = json.loads(data[position : position + strings_size])
+        position += strings_size
+        (num_chains,) = struct.unpack_from("<I", data, position)
+        position += 4
+
+        lengths = {
+            "func_name_ids": num_functions,
+            "func_rets": num_functions,
+            "site_ends": num_functions,
+            "site_pcs": num_sites,
+            "site_label_ids": num_sites,
+            "inst_pcs": num_insts,
+            "inst_pneumonic_ids": num_insts,
+            "inst_overrides": num_insts,
+            "inst_label_ids": num_insts,
+            "inst_label_versions": num_insts,
+            "chain_ends": num_chains,
+        }
+        columns = {}
+        for name, typecode in cls._columns:
+            column = array(typecode)
+            size = column.itemsize * lengths[name]
+            column.frombytes(data[position : position + size])
+            position += size
+            columns[name] = column
+        return cls(offset, strings, columns)
+
+
+_compiled_snippets = {}
+
+
+def compile_snippet(
+    snippet: str, symbols=None, cache_dir: Optional[Path] = None
+) -> CompiledSnippet:
+    """Returns the compiled form of `snippet`, memoized by its hash.
+
+    Args:
+        symbols: Used to resolve `symbol+0xNN` PCs, see `resolve_pc`. It
+            should have a `fingerprint()` that changes with its content.
+        cache_dir: If given, compiled snippets are also stored in and
+            loaded from this directory.
+    """
+    digest = hashlib.sha256(snippet.encode())
+    if symbols is not None:
+        digest.update(symbols.fingerprint().encode())
+    key = digest.hexdigest()
+    if key in _compiled_snippets:
+        return _compiled_snippets[key]
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = Path(cache_dir) / f"{key}.snippet"
+    if cache_path is not None and cache_path.exists():
+        compiled = CompiledSnippet.load(cache_path)
+    else:
+        compiled = CompiledSnippet.from_parsed(
+            *_parse_snippet(snippet, symbols)
+        )
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            compiled.save(tmp_path)
+            os.replace(tmp_path, cache_path)
+    _compiled_snippets[key] = compiled
+    return compiled
+
+
+def process_snippet(snippet, load_base: Optional[int] = None, symbols=None):
+    """Parses a snippet into access sites and indirect chains.
+
+    PCs in the snippet are relative to the `offset:` line at its start. If
+    `load_base` is given it is used instead of that offset. PCs written as
+    `symbol+0xNN` are resolved with `symbols`, see `resolve_pc`.
+    """
+    return compile_snippet(snippet, symbols).expand(load_base)
+
+
+def register_snippet(
+    processor, snippet: CompiledSnippet, load_base: Optional[int] = None
+) -> None:
+    """Register the access sites, indirect chains and register index
+    overrides of `snippet` with `processor` through its
+    `add_function_info`, `add_indirect_chain` and `add_reg_index_override`
+    methods."""
+    for function_info in snippet.functions(load_base):
+        processor.add_function_info(*function_info)
+    for name, pcs, overrides in snippet.chains(load_base):
+        processor.add_indirect_chain(name, pcs)
+        for override in overrides:
+            processor.add_reg_index_override(override)
+
+
+class PCLookupTable:
+    """Maps the PC of every instruction in a snippet to what it is.
+
+    For every PC the table has the label and allocation scope of the access
+    site at it (or the label of the chain instruction if it is not an access
+    site), the destination register override and the ids of the indirect
+    chains it belongs to. PCs are sorted so a lookup is a binary search.
+
+    `save` writes a little-endian blob that can be mmapped as is. Every
+    section starts at a multiple of 8 bytes:
+        header: magic "PCLT", u32 version, u64 num_pcs, u64 num_chains,
+            u64 num_chain_refs, u64 num_strings, u64 strings_size
+        u64 pcs[num_pcs]
+        i32 label_ids[num_pcs], -1 if there is no label
+        i32 scope_ids[num_pcs], -1 if it is not an access site
+        i32 overrides[num_pcs], -1 if there is no override
+        u32 chain_ref_offsets[num_pcs + 1]
+        u32 chain_refs[num_chain_refs], the chains of PC i are
+            chain_refs[chain_ref_offsets[i]:chain_ref_offsets[i + 1]]
+        i32 chain_name_ids[num_chains]
+        u32 string_offsets[num_strings + 1]
+        char strings[strings_size], not null terminated
+    """
+
+    _magic = b"PCLT"
+    _version = 1
+    _header_format = "<4sIQQQQQ"
+
+    @classmethod
+    def from_snippet(
+        cls, snippet: CompiledSnippet, load_base: Optional[int] = None
+    ) -> "PCLookupTable":
+        strings = []
+        string_ids = {}
+
+        def string_id(string):
+            if string not in string_ids:
+                string_ids[string] = len(strings)
+                strings.append(string)
+            return string_ids[string]
+
+        # pc -> [label id, scope id, override, chain ids]
+        entries = {}
+
+        def entry(pc):
+            if pc not in entries:
+                entries[pc] = [-1, -1, -1, []]
+            return entries[pc]
+
+        for func_name, _, labels, pcs in snippet.functions(load_base):
+            for label, pc in zip(labels, pcs):
+                pc_entry = entry(pc)
+                pc_entry[0] = string_id(label)
+                pc_entry[1] = string_id(func_name)
+
+        _, indirect_chains = snippet.expand(load_base)
+        chain_name_ids = array("i")
+        for name, pcs, overrides in snippet.chains(load_base):
+            chain_id = len(chain_name_ids)
+            chain_name_ids.append(string_id(name))
+            for pc in pcs:
+                if chain_id not in entry(pc)[3]:
+                    entry(pc)[3].append(chain_id)
+            for pc, override in overrides:
+                entry(pc)[2] = override
+        for indirect_chain in indirect_chains:
+            for inst in indirect_chain:
+                pc_entry = entry(inst.pc())
+                if pc_entry[0] == -1 and inst.label() != "n/a":
+                    pc_entry[0] = string_id(inst.label())
+
+        table = cls()
+        for pc in sorted(entries):
+            label_id, scope_id, override, chain_ids = entries[pc]
+            table._pcs.append(pc)
+            table._label_ids.append(label_id)
+            table._scope_ids.append(scope_id)
+            table._overrides.append(override)
+            table._chain_refs.extend(chain_ids)
+            table._chain_ref_offsets.append(len(table._chain_refs))
+        table._chain_name_ids = chain_name_ids
+        table._strings = strings
+        return table
+
+    def __init__(self):
+        self._pcs = array("Q")
+        self._label_ids = array("i")
+        self._scope_ids = array("i")
+        self._overrides = array("i")
+        self._chain_ref_offsets = array("I", [0])
+        self._chain_refs = array("I")
+        self._chain_name_ids = array("i")
+        self._strings = []
+
+    def _string(self, string_id: int) -> Optional[str]:
+        return self._strings[string_id] if string_id >= 0 else None
+
+    def lookup(self, pc: int) -> Optional[Dict]:
+        """Returns the label, scope, override and chains of `pc`, or None
+        if `pc` is not in the snippet."""
+        index = bisect.bisect_left(self._pcs, pc)
+        if index == len(self._pcs) or self._pcs[index] != pc:
+            return None
+        start = self._chain_ref_offsets[index]
+        end = self._chain_ref_offsets[index + 1]
+        return {
+            "label": self._string(self._label_ids[index]),
+            "scope": self._string(self._scope_ids[index]),
+            "override": self._overrides[index],
+            "chains": [
+                self._string(self._chain_name_ids[chain_id])
+                for chain_id in self._chain_refs[start:end]
+            ],
+        }
+
+    def __len__(self) -> int:
+        return len(self._pcs)
+
+    def _sections(self):
+        encoded_strings = [string.encode() for string in self._strings]
+        string_offsets = array("I", [0])
+        for encoded in encoded_strings:
+            string_offsets.append(string_offsets[-1] + len(encoded))
+        return [
+            self._pcs,
+            self._label_ids,
+            self._scope_ids,
+            self._overrides,
+            self._chain_ref_offsets,
+            self._chain_refs,
+            self._chain_name_ids,
+            string_offsets,
+            b"".join(encoded_strings),
+        ]
+
+    def to_bytes(self) -> bytes:
+        sections = self._sections()
+        data = bytearray(
+            struct.pack(
+                PCLookupTable._header_format,
+                PCLookupTable._magic,
+                PCLookupTable._version,
+                len(self._pcs),
+                len(self._chain_name_ids),
+                len(self._chain_refs),
+                len(self._strings),
+                len(sections[-1]),
+            )
+        )
+        for section in sections:
+            data += b"\0" * (-len(data) % 8)
+            # The sections are little-endian like the header.
+            if isinstance(section, array) and sys.byteorder != "little":
+                section = array(section.typecode, section)
+                section.byteswap()
+            data += bytes(section)
+        return bytes(data)
+
+    def save(self, path: Path) -> bool:
+        """Writes the table to `path` unless the file there already holds
+        the same table. Returns whether the file was written."""
+        data = self.to_bytes()
+        path = Path(path)
+        if path.exists() and path.read_bytes() == data:
+            return False
+        path.write_bytes(data)
+        return True
+
+    @classmethod
+    def load(cls, path: Path) -> "PCLookupTable":
+        with open(path, "rb") as binary:
+            data = binary.read()
+        (
+            magic,
+            version,
+            num_pcs,
+            num_chains,
+            num_chain_refs,
+            num_strings,
+            strings_size,
+        ) = struct.unpack_from(cls._header_format, data)
+        if magic != cls._magic or version != cls._version:
+            raise ValueError(f"{path} is not a PC lookup table.")
+        position = struct.calcsize(cls._header_format)
+
+        def read_section(typecode, length):
+            nonlocal position
+            position += -position % 8
+            section = array(typecode)
+            size = section.itemsize * length
+            section.frombytes(data[position : position + size])
+            if sys.byteorder != "little":
+                section.byteswap()
+            position += size
+            return section
+
+        table = cls()
+        table._pcs = read_section("Q", num_pcs)
+        table._label_ids = read_section("i", num_pcs)
+        table._scope_ids = read_section("i", num_pcs)
+        table._overrides = read_section("i", num_pcs)
+        table._chain_ref_offsets = read_section("I", num_pcs + 1)
+        table._chain_refs = read_section("I", num_chain_refs)
+        table._chain_name_ids = read_section("i", num_chains)
+        string_offsets = read_section("I", num_strings + 1)
+        position += -position % 8
+        strings = data[position : position + strings_size]
+        table._strings = [
+            strings[string_offsets[i] : string_offsets[i + 1]].decode()
+            for i in range(num_strings)
+        ]
+        return table
+
+
+# Branches, compares and hints, which define no general purpose register.
+_no_def_mnemonics = {
+    "b",
+    "bl",
+    "blr",
+    "br",
+    "ret",
+    "cbz",
+    "cbnz",
+    "tbz",
+    "tbnz",
+    "cmp",
+    "cmn",
+    "tst",
+    "fcmp",
+    "fcmpe",
+    "ccmp",
+    "ccmn",
+    "nop",
+    "prfm",
+}
+# Registers a call may clobber under the AAPCS64.
+_call_clobbers = [f"x{i}" for i in range(19)] + ["x30"]
+
+
+def _normalize_register(token: str) -> Optional[str]:
+    # SVE vectors `z<n>` share their low bits with `v<n>` and predicates
+    # come with a `/z` or `/m` qualifier.
+    token = token.strip().lstrip("{").rstrip("}!").split(".")[0]
+    token = token.split("/")[0]
+    if len(token) < 2 or not token[1:].isdigit():
+        return None
+    if token[0] in "xw":
+        return f"x{token[1:]}"
+    if token[0] in "bhsdqvz":
+        return f"v{token[1:]}"
+    if token[0] == "p":
+        return f"p{token[1:]}"
+    return None
+
+
+def _is_predicate(register: str) -> bool:
+    return register.startswith("p")
+
+
+class DisassembledInstruction:
+    def __init__(self, pc: int, mnemonic: str, operands: str):
+        self._pc = pc
+        self._mnemonic = mnemonic
+        self._operands = operands
+
+        address = ""
+        registers = operands
+        if "[" in operands:
+            registers, address = operands.split("[", 1)
+            address, _, post_index = address.partition("]")
+            registers = f"{registers},{post_index}"
+        register_tokens = [
+            _normalize_register(token) for token in registers.split(",")
+        ]
+        self._address_uses = [
+            register
+            for register in map(_normalize_register, address.split(","))
+            if register is not None
+        ]
+        self._is_memory_access = mnemonic.startswith(("ld", "st")) and bool(
+            address
+        )
+        if self._is_memory_access:
+            if mnemonic.startswith("ld"):
+                self._defs = [
+                    reg
+                    for reg in register_tokens
+                    if reg and not _is_predicate(reg)
+                ]
+                self._uses = [
+                    reg
+                    for reg in register_tokens
+                    if reg and _is_predicate(reg)
+                ] + self._address_uses
+            else:
+                self._defs = []
+                self._uses = [
+                    reg for reg in register_tokens if reg
+                ] + self._address_uses
+        elif mnemonic in ("bl", "blr"):
+            self._defs = list(_call_clobbers)
+            self._uses = [reg for reg in register_tokens if reg]
+        elif mnemonic.split(".")[0] in _no_def_mnemonics:
+            self._defs = []
+            self._uses = [reg for reg in register_tokens if reg]
+        else:
+            self._defs = [register_tokens[0]] if register_tokens[0] else []
+            self._uses = [reg for reg in register_tokens[1:] if reg]
+
+    def pc(self) -> int:
+        return self._pc
+
+    def mnemonic(self) -> str:
+        return self._mnemonic
+
+    def operands(self) -> str:
+        return self._operands
+
+    def defs(self) -> List[str]:
+        return self._defs
+
+    def uses(self) -> List[str]:
+        return self._uses
+
+    def address_uses(self) -> List[str]:
+        return self._address_uses
+
+    def is_memory_access(self) -> bool:
+        return self._is_memory_access
+
+    def is_load(self) -> bool:
+        return self.is_memory_access() and self._mnemonic.startswith("ld")
+
+    def __str__(self) -> str:
+        return (
+            f"DisassembledInstruction(pc: {hex(self._pc)}, "
+            f"{self._mnemonic} {self._operands})"
+        )
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+def parse_objdump(
+    objdump: str, functions: List[str]
+) -> Dict[str, List[DisassembledInstruction]]:
+    """Returns the instructions of `functions` in `objdump` output.
+
+    Functions are matched by their symbol name or, for C++ functions, by
+    their unqualified name.
+    """
+    prefixes = {f"_Z{len(name)}{name}": name for name in functions}
+    found = {}
+    current = None
+    for line in objdump.splitlines():
+        if line.endswith(">:") and "<" in line:
+            symbol = line[line.index("<") + 1 : -2]
+            current = None
+            if symbol in functions:
+                current = symbol
+            else:
+                for prefix, name in prefixes.items():
+                    if symbol.startswith(prefix):
+                        current = name
+                        break
+            if current is not None:
+                found[current] = []
+            continue
+        if current is None:
+            continue
+        tokens = line.split("\t")
+        if len(tokens) < 3 or not tokens[0].rstrip().endswith(":"):
+            continue
+        try:
+            pc = int(tokens[0].strip().rstrip(":"), 16)
+        except ValueError:
+            continue
+        operands = tokens[3] if len(tokens) > 3 else ""
+        operands = operands.split("//")[0].split("<")[0].strip()
+        found[current].append(
+            DisassembledInstruction(pc, tokens[2].strip(), operands)
+        )
+    return found
+
+
+def find_indirect_chains(
+    instructions: List[DisassembledInstruction], max_depth: int = 4
+) -> List[List[Tuple[DisassembledInstruction, int]]]:
+    """Finds memory accesses whose address depends on an earlier load.
+
+    Reaching definitions are computed in one linear pass in program order,
+    ignoring control flow, so the chains are candidates to review rather
+    than proofs. A chain goes from the load of the index, through at most
+    `max_depth` instructions computing the address, to the memory access.
+    Every element is an instruction and the index of the destination
+    register that the next instruction uses, -1 if not relevant.
+    """
+    last_def = {}
+    # Per instruction, for every use: (defining instruction, def index).
+    sources = []
+    for index, inst in enumerate(instructions):
+        sources.append(
+            {
+                register: last_def[register]
+                for register in inst.uses()
+                if register in last_def
+            }
+        )
+        for def_index, register in enumerate(inst.defs()):
+            last_def[register] = (index, def_index)
+
+    chains = []
+    for index, inst in enumerate(instructions):
+        if not inst.is_memory_access():
+            continue
+        # (instruction index, path from the access backwards)
+        stack = [
+            (sources[index][register], [(index, -1)])
+            for register in inst.address_uses()
+            if register in sources[index]
+        ]
+        while stack:
+            (source, def_index), path = stack.pop()
+            source_inst = instructions[source]
+            if source_inst.mnemonic() in ("bl", "blr"):
+                continue
+            step = [(source, def_index)] + path
+            if source_inst.is_load():
+                chains.append(
+                    [(instructions[i], reg_index) for i, reg_index in step]
+                )
+                continue
+            if len(path) > max_depth:
+                continue
+            for register in source_inst.uses():
+                if register in sources[source]:
+                    stack.append((sources[source][register], step))
+    unique_chains = {
+        tuple((inst.pc(), reg_index) for inst, reg_index in chain): chain
+        for chain in chains
+    }
+    return [unique_chains[key] for key in sorted(unique_chains)]
+
+
+def generate_snippet(
+    objdump: str,
+    functions: List[str],
+    scope: str = "main",
+    offset: int = 0,
+    max_depth: int = 4,
+) -> str:
+    """Generates a snippet with every candidate indirect chain in
+    `functions`.
+
+    Index loads are labeled `idx_<pc>` and the dependent accesses
+    `val_<pc>`, all with the allocation scope `scope`, and should be
+    renamed after reviewing the chains. An access that is also the index
+    load of another chain is labeled `idx_<pc>`, so that every PC has a
+    single label. A PC in several chains is labeled in every one of them
+    with an increasing `@<version>`, like the hand-written snippets, so
+    that chains sharing an access get different names. Gathers in SVE code
+    are found as well, since `z` registers are tracked like `v` registers.
+    """
+    lines = ["", f"offset: {offset:x}"]
+    for name, instructions in parse_objdump(objdump, functions).items():
+        if len(instructions) == 0:
+            continue
+        lines.append(f"func {name}:")
+        chains = find_indirect_chains(instructions, max_depth)
+        index_loads = {chain[0][0].pc() for chain in chains}
+        # A load defining several registers, e.g. ldp, can start chains
+        # through each of them. Only the first is kept so that every PC
+        # has one destination register and such chains are merged.
+        def_indices = {}
+        for chain in chains:
+            for inst, def_index in chain:
+                def_indices.setdefault(inst.pc(), def_index)
+        emitted = set()
+        label_versions = {}
+        for chain in chains:
+            key = tuple(inst.pc() for inst, _ in chain)
+            if key in emitted:
+                continue
+            emitted.add(key)
+            for position, (inst, _) in enumerate(chain):
+                def_index = def_indices[inst.pc()]
+                mnemonic = inst.mnemonic()
+                if len(inst.defs()) > 1 and def_index >= 0 and inst.is_load():
+                    mnemonic = f"{mnemonic}@{def_index}"
+                line = f"    {inst.pc():x}:  {mnemonic:<11} {inst.operands()}"
+                if position == 0 or position == len(chain) - 1:
+                    version = label_versions.get(inst.pc(), 0)
+                    label_versions[inst.pc()] = version + 1
+                    prefix = "idx" if inst.pc() in index_loads else "val"
+                    label = f"{prefix}_{inst.pc():x}@{version}"
+                    line = f"{line:<48} label: {label} {scope}"
+                lines.append(line)
+            lines.append("")
+        rets = [inst for inst in instructions if inst.mnemonic() == "ret"]
+        if rets:
+            lines.append(f"ret {rets[-1].pc():x}")
+        else:
+            lines.append(f"ret {instructions[-1].pc():x}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _read_objdump(path: Path) -> str:
+    # Either plain objdump output or a process_info.txt with an objdump
+    # section before the maps.
+    lines = Path(path).read_text(errors="replace").splitlines()
+    if "objdump" in lines:
+        lines = lines[lines.index("objdump") + 1 :]
+        for index, line in enumerate(lines):
+            if line.startswith("PID: "):
+                lines = lines[:index]
+                break
+    return "\n".join(lines)
+
+
+def get_inputs():
+    parser = argparse.ArgumentParser(
+        description="Generate a snippet with candidate indirect chains "
+        "from aarch64 objdump output."
+    )
+    parser.add_argument(
+        "objdump",
+        type=str,
+        help="objdump output or a process_info.txt that contains it.",
+    )
+    parser.add_argument(
+        "functions", type=str, nargs="+", help="Functions to analyze."
+    )
+    parser.add_argument("--scope", type=str, default="main")
+    parser.add_argument("--offset", type=lambda x: int(x, 16), default=0)
+    parser.add_argument("--max-depth", type=int, default=4)
+
+    args = parser.parse_args()
+    return (
+        Path(args.objdump),
+        args.functions,
+        args.scope,
+        args.offset,
+        args.max_depth,
+    )
+
 
-    return access_sites, indirect_chains
+if __name__ == "__main__":
+    objdump_path, functions, scope, offset, max_depth = get_inputs()
+    print(
+        generate_snippet(
+            _read_objdump(objdump_path), functions, scope, offset, max_depth
+        )
+    )